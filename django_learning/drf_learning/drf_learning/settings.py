@@ -56,11 +56,63 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # client IP of throttles is REMOTE_ADDR - None would trust any X-Forwarded-For
+    # sent by clients. Behind proxies set it to their number.
+    'NUM_PROXIES': 0,
 }
 
 TOKEN_TTL = datetime.timedelta(hours=24)
 
+# Token lookup cache used by ExpiringTokenAuthentication (see test_api/cache.py).
+# LOCAL_* - per-process LRU, SHARED_* - alias from CACHES shared between processes.
+TOKEN_CACHE = {
+    'ENABLED': True,
+    'LOCAL_MAX_SIZE': 1024,
+    'LOCAL_TTL': 30,
+    'SHARED_CACHE': 'default',
+    'SHARED_TTL': 300,
+    'NEGATIVE_MAX_SIZE': 10000,
+    'NEGATIVE_TTL': 5,
+}
+
+# Bloom filter of existing token keys (see test_api/bloom.py) - unknown keys
+# are rejected without DB lookup. Rebuild with `manage.py rebuild_token_filter`.
+# SHARED_CACHE must be a shared backend (Redis, Memcached), with a process local
+# one keys missing in the filter are still looked up in DB.
+TOKEN_FILTER = {
+    'ENABLED': False,
+    'REFRESH_INTERVAL': 300,
+    'FALSE_POSITIVE_RATE': 0.01,
+    'MAX_BYTES': 1024 * 1024,
+    'SHARED_CACHE': 'default',
+}
+
+# Stateless HMAC signed tokens (see test_api/tokens.py) issued on login instead of
+# DB tokens. Revocation epochs are kept in CACHE - use a shared backend in production.
+SIGNED_TOKENS = {
+    'ENABLED': False,
+    'CACHE': 'default',
+    'EPOCH_TTL': 60,
+}
+
+# Deletion of expired and inactive tokens - `manage.py reap_tokens` or
+# in-process thread every INTERVAL seconds (None - disabled).
+TOKEN_REAPER = {
+    'INTERVAL': None,
+    'BATCH_SIZE': 1000,
+    'SLEEP': 0.1,
+}
+
+# Token.last_used tracking (see test_api/usage.py) - kept in memory and written
+# in one UPDATE every FLUSH_INTERVAL seconds or when MAX_PENDING tokens are waiting.
+TOKEN_USAGE = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 30,
+    'MAX_PENDING': 1000,
+}
+
 MIDDLEWARE = [
+    'drf_learning.querycount.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +122,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query count per request (see drf_learning/querycount.py) - N+1 and views over
+# BUDGETS (url name: max queries) are logged, STRICT raises instead.
+QUERY_BUDGET = {
+    'ENABLED': True,
+    'SERVER_TIMING': DEBUG,
+    'REPEAT_THRESHOLD': 5,
+    'BUDGETS': {
+        'get-user-data': 1,
+        'user-detail': 2,
+        'user-list': 2,
+    },
+    'STRICT': False,
+}
+
 ROOT_URLCONF = 'drf_learning.urls'
 
 TEMPLATES = [
@@ -105,6 +171,43 @@ DATABASES = {
 }
 
 
+# Cached UserDetail data (see test_api/representations.py) - replaced on every
+# user change, ETag/If-None-Match answered without DB access.
+USER_DETAIL_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TTL': 3600,
+}
+
+# Login attempts per username and per client IP (see test_api/throttling.py),
+# over the rate login gets 429 with Retry-After before password is checked.
+# BACKEND: 'local' - per-process token buckets, 'cache' - counters in CACHE
+# shared between nodes (needs atomic incr - Redis or Memcached).
+LOGIN_THROTTLE = {
+    'ENABLED': True,
+    'BACKEND': 'local',
+    'CACHE': 'default',
+    'USERNAME_RATE': '10/min',
+    'IP_RATE': '100/min',
+}
+
+# Login password checks go through test_api.hashing executor
+AUTHENTICATION_BACKENDS = [
+    'test_api.backends.PooledModelBackend',
+]
+
+# Password hashing off the request thread (see test_api/hashing.py) - over
+# MAX_PENDING running/queued hashes requests get 503 with Retry-After.
+# Rehash on login to a cheaper hasher: put it first in PASSWORD_HASHERS.
+PASSWORD_HASHING = {
+    'EXECUTOR': 'thread',
+    'WORKERS': 4,
+    'MAX_PENDING': 16,
+    'TIMEOUT': 0.5,
+    'REHASH_ON_LOGIN': True,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TestApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'test_api'
+
+    def ready(self):
+        from test_api import signals  # noqa: F401
+        from test_api.services import start_token_reaper
+        start_token_reaper()
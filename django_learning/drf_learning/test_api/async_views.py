@@ -0,0 +1,102 @@
+"""
+Async variants of read-only test_api endpoints - served under /api/async/.
+
+DRF views are sync only, under ASGI every request runs in a thread. These
+are plain Django async views: request handling stays on the event loop and
+only ORM work goes to a thread (Django 3.2 has no async ORM yet). Responses
+and errors are the same as of the sync views.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from rest_framework import exceptions
+
+from .authentication import ExpiringTokenAuthentication
+from .representations import user_representations
+from .serializers import UserSerializer
+
+
+def error_response(exc, authenticator):
+    """ Same body and headers as DRF exception handler gives for auth errors """
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = JsonResponse(data, status=exceptions.NotAuthenticated.status_code)
+    response['WWW-Authenticate'] = authenticator.authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """
+    Set request.user and request.auth from token - like IsAuthenticated with
+    ExpiringTokenAuthentication. Returns error response for anonymous request.
+    """
+    authenticator = ExpiringTokenAuthentication()
+    try:
+        credentials = await sync_to_async(authenticator.authenticate)(request)
+    except exceptions.AuthenticationFailed as exc:
+        return error_response(exc, authenticator)
+
+    if credentials is None:
+        return error_response(exceptions.NotAuthenticated(), authenticator)
+    request.user, request.auth = credentials
+    return None
+
+
+def token_required(view):
+    """ Read-only async view for authenticated users only """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+        error = await authenticate(request)
+        if error is not None:
+            return error
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@token_required
+async def user_data(request):
+    """ Async GetUserDataApiView """
+    return JsonResponse({
+        'user': str(request.user),
+        'auth': str(request.auth),
+    })
+
+
+@sync_to_async
+def get_user_data(pk):
+    """ Serialized user or None """
+    user = User.objects.filter(pk=pk).first()
+    return None if user is None else UserSerializer(user).data
+
+
+@token_required
+async def user_detail(request, pk):
+    """ Async UserDetail - the same representation cache, ETag and 304 """
+    etag = None
+    data = None
+    if user_representations.enabled:
+        # version first - a change after this point gets a new version
+        version = await sync_to_async(user_representations.get_version)(pk)
+        etag = user_representations.make_etag(pk, version)
+        if user_representations.is_fresh(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        data = await sync_to_async(user_representations.get)(pk, version)
+
+    if data is None:
+        data = await get_user_data(pk)
+        if data is None:
+            detail = f'No {User._meta.object_name} matches the given query.'
+            return JsonResponse({'detail': detail}, status=exceptions.NotFound.status_code)
+        if etag is not None:
+            await sync_to_async(user_representations.set)(pk, version, data)
+
+    response = JsonResponse(data)
+    if etag is not None:
+        response['ETag'] = etag
+    return response
@@ -1,10 +1,20 @@
 import pytz
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
 from django.utils import timezone
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
+from test_api.bloom import token_filter
+from test_api.cache import token_cache
 from test_api.models import Token
+from test_api import tokens
+from test_api.usage import token_usage
+from test_api.utils import instance_from_values
+
+TOKEN_FIELDS = ('id', 'key', 'created', 'user_id', 'is_active')
+USER_FIELDS = ('id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
 
 
 class ExpiringTokenAuthentication(TokenAuthentication):
@@ -16,14 +26,10 @@ class ExpiringTokenAuthentication(TokenAuthentication):
     model = Token
 
     def authenticate_credentials(self, key, request=None):
-        models = self.get_model()
+        token = self.get_token(key)
 
-        try:
-            token = models.objects.select_related("user").get(key=key)
-        except models.DoesNotExist:
-            raise AuthenticationFailed(
-                {"error": "Invalid or Inactive Token", "is_authenticated": False}
-            )
+        if not token.is_active:
+            raise invalid_token()
 
         if not token.user.is_active:
             raise AuthenticationFailed(
@@ -37,4 +43,72 @@ class ExpiringTokenAuthentication(TokenAuthentication):
             raise AuthenticationFailed(
                 {"error": "Token has expired", "is_authenticated": False}
             )
+
+        if isinstance(token, Token):
+            token_usage.touch(token.key)
         return token.user, token
+
+    def get_token(self, key):
+        """
+        Token with related user - from token cache if possible.
+        Keys known to be missing are rejected without DB lookup.
+        """
+        if tokens.is_signed_key(key):
+            return self.get_signed_token(key)
+
+        entry = token_cache.get(key)
+        if entry is not None:
+            return self.token_from_entry(entry)
+
+        if token_cache.is_invalid(key) or not token_filter.might_exist(key):
+            raise invalid_token()
+
+        models = self.get_model()
+
+        try:
+            token = models.objects.select_related("user").get(key=key)
+        except models.DoesNotExist:
+            token_cache.set_invalid(key)
+            raise invalid_token()
+
+        token_cache.set(key, self.entry_from_token(token))
+        return token
+
+    # noinspection PyMethodMayBeStatic
+    def get_signed_token(self, key):
+        """ Stateless token - no DB access unless its user epoch is not cached """
+        if not tokens.is_enabled():
+            raise invalid_token()
+
+        try:
+            token = tokens.SignedToken.load(key)
+        except signing.BadSignature:
+            raise invalid_token()
+
+        if token.is_revoked():
+            raise invalid_token()
+        return token
+
+    # noinspection PyMethodMayBeStatic
+    def entry_from_token(self, token):
+        return {
+            'token': {field: getattr(token, field) for field in TOKEN_FIELDS},
+            'user': {field: getattr(token.user, field) for field in USER_FIELDS},
+        }
+
+    def token_from_entry(self, entry):
+        """
+        Build token and user from cached values. Fields that are not cached
+        stay deferred and are loaded from DB on first access.
+        """
+        models = self.get_model()
+        token = instance_from_values(models, entry['token'])
+        token.user = instance_from_values(get_user_model(), entry['user'])
+        return token
+
+
+def invalid_token():
+    return AuthenticationFailed(
+        {"error": "Invalid or Inactive Token", "is_authenticated": False}
+    )
+
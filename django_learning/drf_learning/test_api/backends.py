@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from test_api.hashing import password_hashing
+
+UserModel = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """ ModelBackend with password checks in the hashing executor """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # same work as for existing user - no timing difference
+            password_hashing.make_password(password)
+        else:
+            if password_hashing.check_user_password(user, password) and self.user_can_authenticate(user):
+                return user
+        return None
@@ -0,0 +1,247 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+
+from test_api.models import Token
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    # seconds between rebuilds from the Token table
+    'REFRESH_INTERVAL': 300,
+    'FALSE_POSITIVE_RATE': 0.01,
+    # memory bound of the filter - false positive rate grows when it is hit
+    'MAX_BYTES': 1024 * 1024,
+    # alias from settings.CACHES used to see tokens issued by other processes - with
+    # a process local backend (or None) keys missing in the filter are looked up in DB
+    'SHARED_CACHE': 'default',
+    'KEY_PREFIX': 'test_api:token_filter',
+}
+
+# small tables still get a filter with a low false positive rate
+MIN_CAPACITY = 1024
+
+# backends not seen by other processes
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class BloomFilter:
+    """ Bloom filter over strings - no false negatives, tunable false positives """
+
+    def __init__(self, size_bits, hashes):
+        self.size_bits = max(size_bits, 8)
+        self.hashes = max(hashes, 1)
+        self.bits = bytearray(math.ceil(self.size_bits / 8))
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate, max_bytes):
+        """ Optimal size for {capacity} items, but not larger than {max_bytes} """
+        capacity = max(capacity, MIN_CAPACITY)
+        size_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        size_bits = min(size_bits, max_bytes * 8)
+        hashes = round(size_bits / capacity * math.log(2))
+        return cls(size_bits, hashes)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((first + i * second) % self.size_bits for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self):
+        """ Expected false positive rate for the current number of items """
+        return (1 - math.exp(-self.hashes * self.count / self.size_bits)) ** self.hashes
+
+
+class TokenKeyFilter:
+    """
+    Per-process Bloom filter of existing token keys, rebuilt from DB every
+    REFRESH_INTERVAL seconds or when `rebuild_token_filter` bumps the shared
+    generation. A key missing in the filter is unknown unless it was issued
+    after the last rebuild - such keys are marked in the shared cache. Without
+    a shared cache the filter cannot tell, so missing keys go to DB.
+
+    A stale filter is rebuilt in a background thread and served until the new
+    one is ready - requests never wait for the Token table scan, except for
+    the very first build.
+    """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.bloom = None
+        self.built_at = None
+        self.generation = None
+        self.rejected = 0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        # held while a background refresh runs
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    @property
+    def shared(self):
+        alias = self.options['SHARED_CACHE']
+        return caches[alias] if alias else None
+
+    @property
+    def is_shared(self):
+        """ Keys issued by other processes can be seen """
+        return self.shared is not None and not isinstance(self.shared, PROCESS_LOCAL_CACHES)
+
+    def make_key(self, name):
+        return f"{self.options['KEY_PREFIX']}:{name}"
+
+    def get_generation(self):
+        if self.shared is None:
+            return None
+        return self.shared.get(self.make_key('generation'))
+
+    def rebuild(self, generation=None):
+        """ Build a new filter from the Token table and swap it in """
+        with self._lock:
+            return self._build(generation)
+
+    def _build(self, generation=None):
+        bloom = BloomFilter.for_capacity(
+            # headroom for tokens issued until the next rebuild
+            int(Token.objects.count() * 1.25),
+            self.options['FALSE_POSITIVE_RATE'],
+            self.options['MAX_BYTES'],
+        )
+        for key in Token.objects.values_list('key', flat=True).iterator():
+            bloom.add(key)
+
+        self.bloom = bloom
+        self.built_at = time.monotonic()
+        self.generation = generation if generation is not None else self.get_generation()
+        self.rebuilds += 1
+        return bloom
+
+    def rebuild_for(self, generation):
+        """ Filter of {generation} - built once however many threads ask for it """
+        with self._lock:
+            if self.bloom is not None and self.generation == generation:
+                return self.bloom
+            return self._build(generation)
+
+    def get_bloom(self):
+        bloom = self.bloom
+        if bloom is None:
+            with self._lock:
+                # another thread could build it while we were waiting for the lock
+                return self.bloom if self.bloom is not None else self._build()
+
+        if time.monotonic() - self.built_at > self.options['REFRESH_INTERVAL']:
+            self.refresh()
+        return bloom
+
+    def refresh(self):
+        """ Rebuild filter in a background thread, unless it is already being rebuilt """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(target=self._run_refresh, name='token-filter', daemon=True).start()
+        except Exception:
+            self._refresh_lock.release()
+            raise
+
+    def _run_refresh(self):
+        try:
+            self.rebuild()
+        except Exception:
+            # the old filter is served until the next try
+            logger.exception('Could not rebuild token filter')
+        finally:
+            self._refresh_lock.release()
+            connection.close()
+
+    def add(self, key):
+        """ Register a just issued key for this and other processes """
+        if not self.enabled:
+            return
+        if self.bloom is not None:
+            self.bloom.add(key)
+        if self.shared is not None:
+            # kept until every process has rebuilt its filter
+            self.shared.set(self.make_key(f'recent:{key}'), True, 2 * self.options['REFRESH_INTERVAL'])
+
+    def might_exist(self, key):
+        """ False means the key is definitely not in DB """
+        if not self.enabled:
+            return True
+
+        if key in self.get_bloom():
+            return True
+
+        if not self.is_shared:
+            # could be issued by other process after the last rebuild
+            return True
+
+        generation_key, recent_key = self.make_key('generation'), self.make_key(f'recent:{key}')
+        values = self.shared.get_many([generation_key, recent_key])
+        if values.get(recent_key):
+            return True
+        if values.get(generation_key) != self.generation:
+            if key in self.rebuild_for(values.get(generation_key)):
+                return True
+
+        self.rejected += 1
+        return False
+
+    def request_rebuild(self):
+        """ Make every process rebuild its filter on the next unknown key """
+        if self.shared is None:
+            return
+        self.shared.set(self.make_key('generation'), time.time_ns(), None)
+
+    def stats(self):
+        bloom = self.bloom
+        return {
+            'enabled': self.enabled,
+            'items': bloom.count if bloom else 0,
+            'size_bytes': bloom.size_bytes if bloom else 0,
+            'hashes': bloom.hashes if bloom else 0,
+            'false_positive_rate': bloom.false_positive_rate if bloom else 0,
+            'rejected': self.rejected,
+            'rebuilds': self.rebuilds,
+        }
+
+
+token_filter = TokenKeyFilter(getattr(settings, 'TOKEN_FILTER', None))
+
+
+@receiver(setting_changed)
+def reload_token_filter(setting, value, **kwargs):
+    """ Reconfigure filter on override_settings(TOKEN_FILTER=...) """
+    if setting == 'TOKEN_FILTER':
+        token_filter.configure(value)
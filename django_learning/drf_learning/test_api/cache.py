@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    # per-process tier
+    'LOCAL_MAX_SIZE': 1024,
+    'LOCAL_TTL': 30,
+    # shared tier - alias from settings.CACHES, None disables it
+    'SHARED_CACHE': 'default',
+    'SHARED_TTL': 300,
+    # unknown keys - short lived, so new tokens are not rejected for long
+    'NEGATIVE_MAX_SIZE': 10000,
+    'NEGATIVE_TTL': 5,
+    'KEY_PREFIX': 'test_api:token',
+}
+
+
+class LocalLRUCache:
+    """ Bounded in-memory LRU cache with expiring entries. """
+
+    def __init__(self, max_size, ttl, timer=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < self.timer():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TokenCache:
+    """
+    Two-tier cache for token lookups made by ExpiringTokenAuthentication.
+
+    Entries are plain dicts keyed by the token key. Lookups go to the
+    per-process LRU first and then to the shared Django cache backend,
+    so an invalidation is seen by other processes after LOCAL_TTL at most.
+
+    Keys missing in DB are remembered separately for NEGATIVE_TTL.
+    """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.local = LocalLRUCache(self.options['LOCAL_MAX_SIZE'], self.options['LOCAL_TTL'])
+        self.negative = LocalLRUCache(self.options['NEGATIVE_MAX_SIZE'], self.options['NEGATIVE_TTL'])
+        self.hits_local = 0
+        self.hits_shared = 0
+        self.hits_negative = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    @property
+    def shared(self):
+        alias = self.options['SHARED_CACHE']
+        return caches[alias] if alias else None
+
+    def make_key(self, key, negative=False):
+        prefix = self.options['KEY_PREFIX']
+        return f"{prefix}:invalid:{key}" if negative else f"{prefix}:{key}"
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        entry = self.local.get(key)
+        if entry is not None:
+            self.hits_local += 1
+            return entry
+
+        if self.shared is not None:
+            entry = self.shared.get(self.make_key(key))
+            if entry is not None:
+                self.hits_shared += 1
+                self.local.set(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def set(self, key, entry):
+        if not self.enabled:
+            return
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(self.make_key(key), entry, self.options['SHARED_TTL'])
+
+    def is_invalid(self, key):
+        """ Key is known to be missing in DB """
+        if not self.enabled:
+            return False
+
+        invalid = self.negative.get(key) is not None
+        if not invalid and self.shared is not None:
+            invalid = self.shared.get(self.make_key(key, negative=True)) is not None
+            if invalid:
+                self.negative.set(key, True)
+
+        if invalid:
+            self.hits_negative += 1
+        return invalid
+
+    def set_invalid(self, key):
+        if not self.enabled:
+            return
+        self.negative.set(key, True)
+        if self.shared is not None:
+            self.shared.set(self.make_key(key, negative=True), True, self.options['NEGATIVE_TTL'])
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+            self.negative.delete(key)
+        if self.shared is not None and keys:
+            self.shared.delete_many(
+                [self.make_key(key) for key in keys] + [self.make_key(key, negative=True) for key in keys]
+            )
+
+    def clear(self):
+        self.local.clear()
+        self.negative.clear()
+        self.hits_local = self.hits_shared = self.hits_negative = self.misses = 0
+
+    def stats(self):
+        return {
+            'hits_local': self.hits_local,
+            'hits_shared': self.hits_shared,
+            'hits_negative': self.hits_negative,
+            'misses': self.misses,
+            'local_size': len(self.local),
+            'negative_size': len(self.negative),
+        }
+
+
+token_cache = TokenCache(getattr(settings, 'TOKEN_CACHE', None))
+
+
+@receiver(setting_changed)
+def reload_token_cache(setting, value, **kwargs):
+    """ Reconfigure cache on override_settings(TOKEN_CACHE=...) """
+    if setting == 'TOKEN_CACHE':
+        token_cache.configure(value)
@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import APIException
+
+# smaller batches are hashed inline - not worth a round trip to the pool
+POOL_THRESHOLD = 8
+POOL_WORKERS = os.cpu_count() or 1
+
+DEFAULTS = {
+    # 'thread' - hashlib releases GIL while hashing, 'process' - shared process pool
+    'EXECUTOR': 'thread',
+    'WORKERS': POOL_WORKERS,
+    # hashes running or waiting in queue, requests over it get 503
+    'MAX_PENDING': POOL_WORKERS * 4,
+    # seconds to wait for a free place in queue
+    'TIMEOUT': 0.5,
+    # rehash password on login with first of PASSWORD_HASHERS if it differs
+    'REHASH_ON_LOGIN': True,
+}
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = 'Too many password checks in progress, try again later.'
+    default_code = 'hashing_busy'
+    # seconds for Retry-After header
+    wait = 1
+
+
+def _init_worker():
+    """ Spawned workers start with bare interpreter - PASSWORD_HASHERS come from settings """
+    django.setup()
+
+
+def get_process_pool():
+    """
+    Pool shared by the whole process, workers are started on first use -
+    PASSWORD_HASHING['WORKERS'] of them, like threads of the thread executor
+    """
+    global _pool, _pool_workers
+    workers = password_hashing.options['WORKERS']
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            # reconfigured - hashes already sent to the old pool still finish
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            # spawn - forking a threaded server process is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def hash_passwords(passwords):
+    """ make_password for each of {passwords} - in parallel, PBKDF2 is CPU bound """
+    if len(passwords) < POOL_THRESHOLD:
+        return [hashers.make_password(password) for password in passwords]
+
+    chunksize = max(len(passwords) // (password_hashing.options['WORKERS'] * 4), 1)
+    return list(get_process_pool().map(hashers.make_password, passwords, chunksize=chunksize))
+
+
+def _verify(password, encoded):
+    """ check_password without upgrade of hash - setter can not be sent to other process """
+    return hashers.check_password(password, encoded)
+
+
+class HashingExecutor:
+    """
+    Runs password hashing off the request thread with bounded queue, so a burst
+    of logins can not occupy all workers - over MAX_PENDING raises HashingBusy.
+    """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self._slots = threading.BoundedSemaphore(self.options['MAX_PENDING'])
+        self._executor = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.options['EXECUTOR'] == 'process':
+                    self._executor = get_process_pool()
+                else:
+                    self._executor = ThreadPoolExecutor(self.options['WORKERS'], thread_name_prefix='hashing')
+            return self._executor
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=self.options['TIMEOUT']):
+            self.rejected += 1
+            raise HashingBusy()
+
+        try:
+            future = self.get_executor().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def make_password(self, password):
+        return self.run(hashers.make_password, password)
+
+    def check_password(self, password, encoded):
+        return self.run(_verify, password, encoded)
+
+    # noinspection PyMethodMayBeStatic
+    def must_update(self, encoded):
+        """ Hash was made by other hasher than preferred one or with other parameters """
+        preferred = hashers.get_hasher('default')
+        try:
+            hasher = hashers.identify_hasher(encoded)
+        except ValueError:
+            return False
+        return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+    def check_user_password(self, user, password):
+        """ user.check_password() through executor, with rehash if policy allows """
+        is_correct = self.check_password(password, user.password)
+        if is_correct and self.options['REHASH_ON_LOGIN'] and self.must_update(user.password):
+            user.password = self.make_password(password)
+            user.save(update_fields=['password'])
+        return is_correct
+
+
+password_hashing = HashingExecutor(getattr(settings, 'PASSWORD_HASHING', None))
+
+
+@receiver(setting_changed)
+def reload_password_hashing(setting, value, **kwargs):
+    """ Reconfigure executor on override_settings(PASSWORD_HASHING=...) """
+    if setting == 'PASSWORD_HASHING':
+        password_hashing.configure(value)
@@ -0,0 +1,419 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+    CaptureQueriesContext, override_settings,
+)
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from test_api import serializers, tokens, views
+from test_api.bloom import token_filter
+from test_api.cache import token_cache
+from test_api.hashing import password_hashing
+from test_api.models import Token
+from test_api.services import bulk_create_users
+from test_api.throttling import LoginRateThrottle, login_throttle
+
+
+@contextmanager
+def test_database():
+    """ Throwaway database like in `manage.py test` - never touch real data """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, iterations):
+    """ Run func {iterations} times, return timings (ms) and executed queries count """
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings, len(queries)
+
+
+def bench_auth(command, options):
+    """ Authenticated GET /api/data/ with and without token cache, with signed token """
+    factory = APIRequestFactory()
+    view = views.GetUserDataApiView.as_view()
+    user = User.objects.create_user(username='bench', password='bench')
+    key = Token.objects.filter(user=user).first().key
+
+    def request(key):
+        def get():
+            response = view(factory.get('/api/data/', HTTP_AUTHORIZATION=f'Token {key}'))
+            assert response.status_code == 200, response.data
+        return get
+
+    for enabled in (False, True):
+        with override_settings(TOKEN_CACHE={'ENABLED': enabled}):
+            timings, queries = measure(request(key), options['iterations'])
+            command.report(f'token cache {"on" if enabled else "off"}', timings, queries)
+            if enabled:
+                command.stdout.write(f'    cache stats: {token_cache.stats()}')
+
+    with override_settings(SIGNED_TOKENS={'ENABLED': True}):
+        timings, queries = measure(request(tokens.SignedToken.issue(user).key), options['iterations'])
+        command.report('signed token', timings, queries)
+
+
+def bench_invalid_flood(command, options):
+    """ Flood of unknown (random) and repeated deleted token keys """
+    factory = APIRequestFactory()
+    view = views.GetUserDataApiView.as_view()
+    for i in range(options['iterations']):
+        # token is created by post_save signal
+        User.objects.create(username=f'bench{i}')
+    deleted = Token.objects.first()
+    deleted.delete()
+
+    def flood(keys):
+        keys = iter(keys)
+
+        def request():
+            response = view(factory.get('/api/data/', HTTP_AUTHORIZATION=f'Token {next(keys)}'))
+            assert response.status_code == 401, response.data
+        return request
+
+    # token filter needs a cache shared between processes
+    with tempfile.TemporaryDirectory() as shared_dir:
+        shared_caches = {
+            **settings.CACHES,
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': shared_dir},
+        }
+        for enabled in (False, True):
+            with override_settings(
+                CACHES=shared_caches,
+                TOKEN_CACHE={'ENABLED': enabled}, TOKEN_FILTER={'ENABLED': enabled, 'SHARED_CACHE': 'shared'},
+            ):
+                state = 'on' if enabled else 'off'
+                random_keys = [Token.generate_key() for _ in range(options['iterations'])]
+                timings, queries = measure(flood(random_keys), options['iterations'])
+                command.report(f'random keys, negative cache/filter {state}', timings, queries)
+
+                timings, queries = measure(flood([deleted.key] * options['iterations']), options['iterations'])
+                command.report(f'deleted key, negative cache/filter {state}', timings, queries)
+
+                if enabled:
+                    command.stdout.write(f'    cache stats: {token_cache.stats()}')
+                    command.stdout.write(f'    filter stats: {token_filter.stats()}')
+
+
+def bench_login(command, options):
+    """
+    POST /api/api-token-auth/ from {threads} parallel clients of the same user.
+    Password checks run in test_api.hashing executor - requests over its
+    queue limit get 503 and are counted separately.
+    """
+    factory = APIRequestFactory()
+    view = views.CustomAuthToken.as_view()
+    User.objects.create_user(username='bench', password='bench')
+    Token.objects.all().delete()
+
+    def login():
+        started = time.perf_counter()
+        try:
+            request = factory.post('/api/api-token-auth/', {'username': 'bench', 'password': 'bench'}, format='json')
+            response = view(request)
+            assert response.status_code in (200, 503), response.data
+            key = response.data['token'] if response.status_code == 200 else None
+            return (time.perf_counter() - started) * 1000, key
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    # password checks are measured here, not the login rate limit
+    with override_settings(LOGIN_THROTTLE={'ENABLED': False}), ThreadPoolExecutor(options['threads']) as executor:
+        results = list(executor.map(lambda _: login(), range(options['iterations'])))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [key for _, key in results if key is not None]
+    cores = os.cpu_count() or 1
+    command.report(f"login, {options['threads']} threads", [timing for timing, _ in results])
+    command.stdout.write(
+        f'    throughput: {len(succeeded) / elapsed:.1f} logins/s '
+        f'({len(succeeded) / elapsed / cores:.1f} per core, {cores} cores), '
+        f'rejected with 503: {len(results) - len(succeeded)}, executor: {password_hashing.options["EXECUTOR"]}'
+    )
+    command.stdout.write(
+        f'    distinct tokens: {len(set(succeeded))}, tokens in DB: {Token.objects.count()}'
+    )
+
+
+def bench_login_throttle(command, options):
+    """ Overhead of LoginRateThrottle per request - {iterations} usernames from 100 IPs, both backends """
+    factory = APIRequestFactory()
+    throttle = LoginRateThrottle()
+    requests = [
+        Request(
+            factory.post(
+                '/api/api-token-auth/', {'username': f'user{i}', 'password': 'secret'},
+                format='json', REMOTE_ADDR=f'10.0.0.{i % 100}',
+            ),
+            parsers=[JSONParser()],
+        )
+        for i in range(options['iterations'])
+    ]
+    for request in requests:
+        # parse body in advance - the view does it anyway
+        request.data
+
+    for backend in ('local', 'cache'):
+        with override_settings(LOGIN_THROTTLE={'BACKEND': backend, 'IP_RATE': '1000/min', 'USERNAME_RATE': '5/min'}):
+            attempts = iter(requests * 2)
+            timings, queries = measure(lambda: throttle.allow_request(next(attempts), None), len(requests) * 2)
+            command.report(f'throttle, {backend} backend', timings, queries)
+            command.stdout.write(f'    stats: {login_throttle.stats()}')
+
+
+def bench_asgi(command, options):
+    """
+    GET /api/data/ (sync DRF view) vs /api/async/data/ through the ASGI application
+    from {threads} concurrent connections - like behind an ASGI server, without network
+    """
+    application = get_asgi_application()
+    user = User.objects.create_user(username='bench', password='bench')
+    key = Token.objects.filter(user=user).first().key
+
+    async def get(path):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Token {key}'.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        assert messages[0]['status'] == 200, messages
+        return (time.perf_counter() - started) * 1000
+
+    async def connections(path):
+        slots = asyncio.Semaphore(options['threads'])
+
+        async def request():
+            async with slots:
+                return await get(path)
+        return await asyncio.gather(*(request() for _ in range(options['iterations'])))
+
+    for title, path in (('sync view', '/api/data/'), ('async view', '/api/async/data/')):
+        started = time.perf_counter()
+        timings = asyncio.run(connections(path))
+        elapsed = time.perf_counter() - started
+
+        command.report(f"{title}, {options['threads']} connections", timings)
+        command.stdout.write(f'    throughput: {len(timings) / elapsed:.1f} requests/s')
+
+
+def measure_memory(func):
+    """ Time (ms) and peak of memory allocated (MB) of func - in separate runs, tracing is slow """
+    started = time.perf_counter()
+    func()
+    elapsed = (time.perf_counter() - started) * 1000
+
+    tracemalloc.start()
+    try:
+        func()
+        return elapsed, tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_user_detail(command, options):
+    """ GET /api/users/<pk>/ - uncached, from representation cache, revalidated with If-None-Match """
+    factory = APIRequestFactory()
+    view = views.UserDetail.as_view()
+    user = User.objects.create_user(username='bench', password='bench', email='bench@example.com')
+
+    def request(**headers):
+        def get():
+            request = factory.get(f'/api/users/{user.pk}/', **headers)
+            force_authenticate(request, user)
+            response = view(request, pk=user.pk)
+            assert response.status_code in (200, 304), response.data
+            return response
+        return get
+
+    with override_settings(USER_DETAIL_CACHE={'ENABLED': False}):
+        timings, queries = measure(request(), options['iterations'])
+        command.report('uncached', timings, queries)
+
+    etag = request()()['ETag']
+    timings, queries = measure(request(), options['iterations'])
+    command.report('cached', timings, queries)
+    timings, queries = measure(request(HTTP_IF_NONE_MATCH=etag), options['iterations'])
+    command.report('304 Not Modified', timings, queries)
+
+
+def bench_user_list(command, options):
+    """ GET /api/users/ - first page, whole list streamed and serialized at once, for {users} sizes """
+    factory = APIRequestFactory()
+    view = views.UserList.as_view()
+    admin = User.objects.create_user(username='bench')
+
+    def get(params):
+        def request():
+            request = factory.get('/api/users/', params)
+            force_authenticate(request, user=admin)
+            response = view(request)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            else:
+                response.render()
+        return request
+
+    def serialize_all():
+        serializers.UserSerializer(User.objects.all(), many=True).data
+
+    created = User.objects.count()
+    for size in options['users']:
+        User.objects.bulk_create(
+            (User(username=f'user{i}', email=f'user{i}@example.com') for i in range(created, size)),
+            batch_size=10000,
+        )
+        created = size
+
+        for title, func in (
+            ('first page', get({'page_size': 100})),
+            ('streamed', get({'stream': 1})),
+            ('serialized at once', serialize_all),
+        ):
+            elapsed, peak = measure_memory(func)
+            command.stdout.write(f'{size} users, {title}: {elapsed:.0f}ms, peak memory {peak:.1f}MB')
+
+
+def bench_export(command, options):
+    """ GET /api/users/export/ - NDJSON and CSV, for {users} sizes with a token per user """
+    factory = APIRequestFactory()
+    view = views.UserExportView.as_view()
+    admin = User.objects.create_superuser(username='bench', email='bench', password='bench')
+
+    def export(output):
+        def request():
+            request = factory.get('/api/users/export/', {'output': output})
+            force_authenticate(request, user=admin)
+            for _ in view(request).streaming_content:
+                pass
+        return request
+
+    created = User.objects.count()
+    for size in options['users']:
+        User.objects.bulk_create(
+            (User(username=f'user{i}', email=f'user{i}@example.com') for i in range(created, size)),
+            batch_size=10000,
+        )
+        Token.objects.bulk_create(
+            (Token(key=Token.generate_key(), user_id=pk)
+             for pk in User.objects.filter(auth_token__isnull=True).values_list('pk', flat=True).iterator()),
+            batch_size=10000,
+        )
+        created = size
+
+        for output in ('ndjson', 'csv'):
+            elapsed, peak = measure_memory(export(output))
+            command.stdout.write(
+                f'{size} users, {output}: {elapsed:.0f}ms, {size / elapsed * 1000:.0f} users/s, '
+                f'peak memory {peak:.1f}MB'
+            )
+
+
+def bench_bulk_users(command, options):
+    """ {iterations} users - one POST /api/create/ per user vs bulk creation """
+    factory = APIRequestFactory()
+    view = views.CreateUserAPIView.as_view()
+    admin = User.objects.create_superuser(username='bench', email='bench', password='bench')
+    count = options['iterations']
+
+    def create(username):
+        request = factory.post('/api/create/', {'username': username, 'password': 'secret'}, format='json')
+        force_authenticate(request, user=admin)
+        assert view(request).status_code == 201
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for i in range(count):
+            create(f'single{i}')
+        elapsed = time.perf_counter() - started
+    command.stdout.write(
+        f'per request: {elapsed:.2f}s, {count / elapsed:.1f} users/s, queries/user={len(queries) / count:.2f}'
+    )
+
+    rows = [{'username': f'bulk{i}', 'password': 'secret'} for i in range(count)]
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        created, errors = bulk_create_users(rows)
+        elapsed = time.perf_counter() - started
+    assert created == count, errors
+    workers = password_hashing.options['WORKERS']
+    command.stdout.write(
+        f'bulk ({workers} hashing processes): {elapsed:.2f}s, {count / elapsed:.1f} users/s, '
+        f'queries/user={len(queries) / count:.2f}'
+    )
+
+
+class Command(BaseCommand):
+    help = 'Run test_api benchmarks against a throwaway test database'
+
+    scenarios = {
+        'asgi': bench_asgi,
+        'auth': bench_auth,
+        'bulk_users': bench_bulk_users,
+        'export': bench_export,
+        'invalid_flood': bench_invalid_flood,
+        'login': bench_login,
+        'login_throttle': bench_login_throttle,
+        'user_detail': bench_user_detail,
+        'user_list': bench_user_list,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument(
+            '--users', type=lambda value: [int(size) for size in value.split(',')], default=[10000, 100000],
+            help='Comma separated table sizes, e.g. 10000,100000,1000000',
+        )
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.scenarios[options['scenario']](self, options)
+
+    def report(self, title, timings, queries=None):
+        timings = sorted(timings)
+        line = (
+            f'{title}: n={len(timings)} mean={statistics.mean(timings):.3f}ms '
+            f'p50={timings[len(timings) // 2]:.3f}ms p99={timings[int(len(timings) * 0.99)]:.3f}ms'
+        )
+        if queries is not None:
+            line += f' queries/op={queries / len(timings):.2f}'
+        self.stdout.write(line)
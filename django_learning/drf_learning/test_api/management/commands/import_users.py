@@ -0,0 +1,33 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_api.services import bulk_create_users
+
+
+class Command(BaseCommand):
+    help = 'Create users with tokens from JSON file - list of {"username", "password", "email"}'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path']) as file:
+                rows = json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Could not read users: {error}')
+
+        if not isinstance(rows, list):
+            raise CommandError('Expected a list of users')
+
+        started = time.perf_counter()
+        created, errors = bulk_create_users(rows, options['batch_size'])
+
+        for error in errors:
+            self.stderr.write(f"Row {error['index']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} users, skipped {len(errors)} rows in {time.perf_counter() - started:.2f}s'
+        ))
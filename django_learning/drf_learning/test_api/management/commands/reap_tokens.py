@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from test_api.services import get_reaper_options, reap_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and inactive tokens in small primary key batches'
+
+    def add_arguments(self, parser):
+        options = get_reaper_options()
+        parser.add_argument('--batch-size', type=int, default=options['BATCH_SIZE'])
+        parser.add_argument(
+            '--sleep', type=float, default=options['SLEEP'],
+            help='Seconds to sleep between batches',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count tokens which would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        total = 0
+
+        for batch, total in reap_tokens(options['batch_size'], options['sleep'], options['dry_run']):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{action} {batch} tokens, {total} in total, {total / elapsed:.0f} tokens/s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {total} tokens in {time.perf_counter() - started:.2f}s'
+        ))
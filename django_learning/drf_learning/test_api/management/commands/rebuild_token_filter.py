@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from test_api.bloom import token_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild Bloom filter of token keys from the Token table and make '
+        'running processes refresh their filters on the next unknown key'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-refresh', action='store_true',
+            help='Only build the filter and show its stats, do not notify running processes',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        token_filter.rebuild()
+        elapsed = time.perf_counter() - started
+
+        stats = token_filter.stats()
+        self.stdout.write(
+            f"Built filter for {stats['items']} keys in {elapsed:.2f}s: "
+            f"{stats['size_bytes']} bytes, {stats['hashes']} hashes, "
+            f"expected false positive rate {stats['false_positive_rate']:.4%}"
+        )
+
+        if not options['no_refresh']:
+            token_filter.request_rebuild()
+            self.stdout.write(self.style.SUCCESS('Requested filter refresh in running processes'))
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('test_api', '0002_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenEpoch',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='token_epoch', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('epoch', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_api', '0003_tokenepoch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created'], name='token_active_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['created'], name='token_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['id'], name='token_inactive_idx'),
+        ),
+    ]
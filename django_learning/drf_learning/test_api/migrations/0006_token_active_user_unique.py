@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def deactivate_older_tokens(apps, schema_editor):
+    """ Before the unique index - keep only the freshest active token of every user """
+    Token = apps.get_model('test_api', 'Token')
+    freshest = Token.objects.filter(user=OuterRef('user'), is_active=True).order_by('-created', '-pk').values('pk')
+    Token.objects.filter(is_active=True).exclude(pk=Subquery(freshest[:1])).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_api', '0005_token_last_used'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_older_tokens, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='token',
+            name='token_active_user_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='token',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user',), name='token_active_user_unique'),
+        ),
+    ]
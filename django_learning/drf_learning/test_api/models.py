@@ -15,6 +15,22 @@ class Token(AuthToken):
         verbose_name="User",
     )
     is_active = models.BooleanField(default=True)
+    # written in batches by test_api.usage.TokenUsageTracker
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    class Meta(AuthToken.Meta):
+        indexes = [
+            # reaper - expired or inactive tokens
+            models.Index(fields=['created'], name='token_created_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_active=False), name='token_inactive_idx'),
+        ]
+        constraints = [
+            # one active token per user - concurrent logins can not create two;
+            # login and admin find the active token of user by it
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(is_active=True), name='token_active_user_unique',
+            ),
+        ]
 
 
 class TokenProxy(Token):
@@ -30,3 +46,15 @@ class TokenProxy(Token):
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+class TokenEpoch(models.Model):
+    """ Revocation counter for signed tokens - bumped on logout and user change """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name="token_epoch",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="User",
+    )
+    epoch = models.PositiveIntegerField(default=0)
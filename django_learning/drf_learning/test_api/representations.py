@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.http import parse_etags, quote_etag
+
+DEFAULTS = {
+    'ENABLED': True,
+    # alias from settings.CACHES - shared, so a change is seen by all processes at once
+    'CACHE': 'default',
+    'TTL': 3600,
+    # change it when serializer output changes - old entries are not read anymore
+    'KEY_PREFIX': 'test_api:user_detail:v1',
+}
+
+
+class RepresentationCache:
+    """
+    Serialized objects keyed by object id and version stamp. The version is
+    replaced on every change, so entries are never updated in place - the
+    version alone tells if a client copy (ETag) or a cached entry is current.
+    """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE']]
+
+    def make_key(self, name, pk, version=None):
+        key = f"{self.options['KEY_PREFIX']}:{name}:{pk}"
+        return key if version is None else f'{key}:{version}'
+
+    def get_version(self, pk):
+        """ Current version stamp of object, a new one if there is none yet """
+        key = self.make_key('version', pk)
+        version = self.cache.get(key)
+        if version is None:
+            # add() keeps the version of a concurrent request
+            self.cache.add(key, time.time_ns(), self.options['TTL'])
+            version = self.cache.get(key)
+        return version
+
+    # noinspection PyMethodMayBeStatic
+    def make_etag(self, pk, version):
+        return quote_etag(f'{pk}-{version}')
+
+    # noinspection PyMethodMayBeStatic
+    def is_fresh(self, request, etag):
+        """ Client copy of {request} (If-None-Match) is current """
+        return etag in parse_etags(request.headers.get('If-None-Match', ''))
+
+    def bump_version(self, pk):
+        self.cache.set(self.make_key('version', pk), time.time_ns(), self.options['TTL'])
+
+    def get(self, pk, version):
+        data = self.cache.get(self.make_key('data', pk, version))
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def set(self, pk, version, data):
+        self.cache.set(self.make_key('data', pk, version), data, self.options['TTL'])
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+user_representations = RepresentationCache(getattr(settings, 'USER_DETAIL_CACHE', None))
+
+
+@receiver(setting_changed)
+def reload_user_representations(setting, value, **kwargs):
+    """ Reconfigure cache on override_settings(USER_DETAIL_CACHE=...) """
+    if setting == 'USER_DETAIL_CACHE':
+        user_representations.configure(value)
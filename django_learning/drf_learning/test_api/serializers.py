@@ -1,17 +1,43 @@
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
 
+from test_api.hashing import password_hashing
 
-class UserSerializer(serializers.ModelSerializer):
+
+class DynamicFieldsMixin:
+    """ Serializer takes additional `fields` argument - subset of fields to show """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password']
+        extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
         user = User(
             username=validated_data['username']
         )
-        user.set_password(validated_data['password'])
+        user.password = password_hashing.make_password(validated_data['password'])
         user.save()
         return user
+
+
+class UserImportSerializer(UserSerializer):
+    """ Row of bulk user import - username uniqueness is checked for the whole batch at once """
+
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            **UserSerializer.Meta.extra_kwargs,
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+
+import pytz
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from test_api import tokens
+from test_api.bloom import token_filter
+from test_api.hashing import hash_passwords
+from test_api.models import Token
+from test_api.serializers import UserImportSerializer
+
+logger = logging.getLogger(__name__)
+
+REAPER_DEFAULTS = {
+    # seconds between runs of the in-process reaper, None disables it
+    'INTERVAL': None,
+    'BATCH_SIZE': 1000,
+    # pause between batches to let other queries through
+    'SLEEP': 0.1,
+}
+
+
+def get_fresh_tokens(user):
+    """ Active non-expired DB tokens of user, freshest first """
+    utc_now = timezone.now()
+    utc_now = utc_now.replace(tzinfo=pytz.utc)
+
+    return Token.objects.filter(
+        user=user,
+        is_active=True,
+        created__gt=utc_now - settings.TOKEN_TTL,
+    ).order_by('-created')
+
+
+def get_fresh_token(user):
+    """ Freshest active non-expired DB token of user or None - single indexed query """
+    return get_fresh_tokens(user).first()
+
+
+def issue_token(user):
+    """
+    Token for login - signed one if enabled, otherwise the freshest valid DB token
+    of user or a new one. The database keeps one active token per user
+    (token_active_user_unique), so of concurrent logins only one creates the
+    token - the others read it.
+    """
+    if tokens.is_enabled():
+        return tokens.SignedToken.issue(user)
+
+    token = get_fresh_token(user)
+    if token is not None:
+        return token
+
+    try:
+        with transaction.atomic():
+            # expired token still counts as the active one until it is reaped
+            Token.objects.filter(user=user, is_active=True, created__lte=get_expiry_cutoff()).update(is_active=False)
+            return Token.objects.create(user=user)
+    except IntegrityError:
+        # another login created the token in the meantime
+        token = get_fresh_token(user)
+        if token is None:
+            raise
+        return token
+
+
+def bulk_create_users(rows, batch_size=1000):
+    """
+    Validate and create users with their tokens in batches of {batch_size}.
+    Invalid rows are skipped. Returns number of created users and list
+    of errors - {'index': row index, 'errors': serializer errors}.
+    """
+    created = 0
+    errors = []
+
+    for start in range(0, len(rows), batch_size):
+        valid = {}
+        usernames = set()
+        for index, row in enumerate(rows[start:start + batch_size], start):
+            serializer = UserImportSerializer(data=row)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+            elif serializer.validated_data['username'] in usernames:
+                errors.append({'index': index, 'errors': {'username': ['Duplicated username.']}})
+            else:
+                valid[index] = serializer.validated_data
+                usernames.add(serializer.validated_data['username'])
+
+        taken = set(get_user_model().objects.filter(username__in=usernames).values_list('username', flat=True))
+        for index in [index for index, data in valid.items() if data['username'] in taken]:
+            errors.append({'index': index, 'errors': {'username': ['A user with that username already exists.']}})
+            del valid[index]
+
+        created += _create_users(list(valid.values()))
+
+    errors.sort(key=lambda error: error['index'])
+    return created, errors
+
+
+def _create_users(users_data):
+    """ Insert valid users and their tokens - post_save signals are not sent """
+    if not users_data:
+        return 0
+
+    passwords = hash_passwords([data['password'] for data in users_data])
+    user_model = get_user_model()
+    users = [
+        user_model(username=data['username'], email=data.get('email', ''), password=password)
+        for data, password in zip(users_data, passwords)
+    ]
+
+    with transaction.atomic():
+        users = user_model.objects.bulk_create(users)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            users = user_model.objects.filter(username__in=[user.username for user in users]).only('pk')
+
+        token_objects = Token.objects.bulk_create(Token(key=Token.generate_key(), user=user) for user in users)
+
+    for token in token_objects:
+        token_filter.add(token.key)
+    return len(users)
+
+
+def get_reaper_options():
+    return {**REAPER_DEFAULTS, **getattr(settings, 'TOKEN_REAPER', {})}
+
+
+def get_expiry_cutoff():
+    """ Tokens created before it are expired """
+    utc_now = timezone.now()
+    utc_now = utc_now.replace(tzinfo=pytz.utc)
+    return utc_now - settings.TOKEN_TTL
+
+
+def get_expired_tokens(cutoff=None):
+    """ Tokens older than TOKEN_TTL """
+    return Token.objects.filter(created__lt=cutoff or get_expiry_cutoff())
+
+
+def get_inactive_tokens():
+    """ Tokens deactivated by logout """
+    return Token.objects.filter(is_active=False)
+
+
+def get_dead_token_batches(batch_size):
+    """
+    Primary keys of tokens that can never authenticate again, in batches of
+    at most {batch_size} - expired ones by token_created_idx, then inactive
+    not expired ones by token_inactive_idx. An OR of both conditions can use
+    neither index and walks the whole primary key.
+    """
+    cutoff = get_expiry_cutoff()
+    expired = get_expired_tokens(cutoff)
+    # keyset on (created, pk) - the index holds both, every batch is a range scan
+    last = None
+    while True:
+        queryset = expired.order_by('created', 'pk')
+        if last is not None:
+            created, pk = last
+            queryset = queryset.filter(Q(created__gte=created) & (Q(created__gt=created) | Q(pk__gt=pk)))
+        rows = list(queryset.values_list('created', 'pk')[:batch_size])
+        if not rows:
+            break
+        last = rows[-1]
+        yield [pk for _, pk in rows]
+
+    # expired ones were taken above
+    inactive = get_inactive_tokens().filter(created__gte=cutoff).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(inactive.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        last_pk = pks[-1]
+        yield pks
+
+
+def reap_tokens(batch_size, sleep=0, dry_run=False):
+    """
+    Delete dead tokens in batches, each batch in its own short transaction.
+    Yields (batch size, total so far) after every batch.
+    """
+    total = 0
+    for pks in get_dead_token_batches(batch_size):
+        if not dry_run:
+            with transaction.atomic():
+                Token.objects.filter(pk__in=pks).delete()
+
+        total += len(pks)
+        yield len(pks), total
+
+        if sleep:
+            time.sleep(sleep)
+
+
+class TokenReaper(threading.Thread):
+    """ Background thread running reap_tokens every {interval} seconds """
+
+    def __init__(self, interval, batch_size, sleep):
+        super().__init__(name='token-reaper', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            started = time.perf_counter()
+            total = 0
+            try:
+                for _, total in reap_tokens(self.batch_size, self.sleep):
+                    if self.stopped.is_set():
+                        break
+            except Exception:
+                logger.exception('Token reaper failed')
+            finally:
+                connection.close()
+            logger.info('Token reaper deleted %s tokens in %.2fs', total, time.perf_counter() - started)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_token_reaper():
+    """ Start in-process reaper if TOKEN_REAPER['INTERVAL'] is set """
+    options = get_reaper_options()
+    if not options['INTERVAL']:
+        return None
+
+    reaper = TokenReaper(options['INTERVAL'], options['BATCH_SIZE'], options['SLEEP'])
+    reaper.start()
+    return reaper
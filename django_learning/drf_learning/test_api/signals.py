@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from test_api import tokens
+from test_api.bloom import token_filter
+from test_api.cache import token_cache
+from test_api.models import Token
+from test_api.representations import user_representations
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance=None, created=False, **kwargs):
+    """
+    Cached tokens hold user flags (is_active etc.) - drop them on user change.
+    Again after commit - requests between save and commit still read and
+    cache the old row.
+    """
+    if not created and token_cache.enabled:
+        keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+        token_cache.invalidate(*keys)
+        transaction.on_commit(lambda: token_cache.invalidate(*keys))
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def check_signed_token_fields(sender, instance=None, update_fields=None, **kwargs):
+    """
+    Signed tokens carry user flags (is_active etc.) - mark user for revocation
+    when they or the password change. Saves of other fields (last_login on
+    login) keep the tokens and make no query.
+    """
+    instance._revoke_signed_tokens = False
+    if instance.pk is None or not tokens.is_enabled():
+        return
+
+    # set by set_password() until saved - a hash upgrade on login clears it first
+    if instance._password is not None:
+        instance._revoke_signed_tokens = True
+        return
+
+    if update_fields is None:
+        # hash upgrades on login save only the password - any other change of it revokes
+        fields = [*tokens.USER_FIELDS, 'password']
+    else:
+        fields = [field for field in tokens.USER_FIELDS if field in update_fields]
+    if fields:
+        old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+        instance._revoke_signed_tokens = old is not None and any(
+            old[field] != getattr(instance, field) for field in fields
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_signed_tokens(sender, instance=None, created=False, **kwargs):
+    if not created and getattr(instance, '_revoke_signed_tokens', False):
+        tokens.bump_epoch(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_token_epoch(sender, instance=None, **kwargs):
+    tokens.forget_epoch(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_representation(sender, instance=None, **kwargs):
+    """
+    New version of cached UserDetail data. Again after commit - requests
+    between save and commit still read and cache the old row.
+    """
+    if user_representations.enabled:
+        user_representations.bump_version(instance.pk)
+        transaction.on_commit(lambda: user_representations.bump_version(instance.pk))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance=None, **kwargs):
+    """ Before and after commit, like user changes """
+    token_cache.invalidate(instance.key)
+    transaction.on_commit(lambda: token_cache.invalidate(instance.key))
+
+
+@receiver(post_save, sender=Token)
+def register_token_key(sender, instance=None, created=False, **kwargs):
+    if created:
+        token_filter.add(instance.key)
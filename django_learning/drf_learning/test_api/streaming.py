@@ -0,0 +1,49 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# rows encoded into one chunk of streaming response
+CHUNK_SIZE = 1000
+
+
+def chunked(items, size=CHUNK_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_json_array(rows):
+    """ JSON array of {rows} dicts encoded lazily, chunk by chunk """
+    yield '['
+    separator = ''
+    for chunk in chunked(rows):
+        yield separator + ','.join(json.dumps(row, cls=DjangoJSONEncoder) for row in chunk)
+        separator = ','
+    yield ']'
+
+
+def stream_ndjson(rows):
+    """ One JSON document per line for each of {rows} dicts """
+    for chunk in chunked(rows):
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in chunk)
+
+
+class Echo:
+    """ File-like object for csv.writer - returns written line instead of storing it """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, fieldnames):
+    """ CSV with header of {fieldnames} for each of {rows} dicts """
+    writer = csv.DictWriter(Echo(), fieldnames)
+    yield writer.writeheader()
+    for chunk in chunked(rows):
+        yield ''.join(writer.writerow(row) for row in chunk)
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..cache import token_cache
+from ..models import Token
+from ..usage import token_usage
+
+
+class TestAsyncViews(TestCase):
+    """ Async views answer the same as their sync versions """
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.async_client = AsyncClient()
+
+        self.user = User.objects.create_user(username='test', password='test', email='test@example.com')
+        self.token = Token.objects.get(user=self.user)
+        self.auth = f'Token {self.token.key}'
+
+    def assertSameResponse(self, url, async_url, **headers):
+        response = self.client.get(url, **headers)
+        async_response = self.client.get(async_url, **headers)
+
+        self.assertEqual(async_response.status_code, response.status_code)
+        self.assertEqual(async_response.json(), response.json())
+        self.assertEqual(async_response.get('WWW-Authenticate'), response.get('WWW-Authenticate'))
+        return async_response
+
+    def test_user_data(self):
+        response = self.assertSameResponse(
+            reverse('get-user-data'), reverse('async-get-user-data'), HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_detail(self):
+        response = self.assertSameResponse(
+            reverse('user-detail', args=[self.user.pk]), reverse('async-user-detail', args=[self.user.pk]),
+            HTTP_AUTHORIZATION=self.auth,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('password', response.json())
+
+        response = self.assertSameResponse(
+            reverse('user-detail', args=[0]), reverse('async-user-detail', args=[0]), HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_detail_etag(self):
+        url = reverse('user-detail', args=[self.user.pk])
+        async_url = reverse('async-user-detail', args=[self.user.pk])
+        etag = self.client.get(url, HTTP_AUTHORIZATION=self.auth)['ETag']
+        self.assertEqual(self.client.get(async_url, HTTP_AUTHORIZATION=self.auth)['ETag'], etag)
+
+        response = self.client.get(async_url, HTTP_AUTHORIZATION=self.auth, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        self.user.save()
+        response = self.client.get(async_url, HTTP_AUTHORIZATION=self.auth, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_authentication_errors(self):
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Token unknown'}):
+            response = self.assertSameResponse(reverse('get-user-data'), reverse('async-get-user-data'), **headers)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.assertSameResponse(
+            reverse('get-user-data'), reverse('async-get-user-data'), HTTP_AUTHORIZATION=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_client(self):
+        # headers go to ASGI scope without HTTP_ prefix
+        response = await self.async_client.get(reverse('async-get-user-data'), AUTHORIZATION=self.auth)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'user': 'test', 'auth': self.token.key})
+
+    def test_read_only(self):
+        response = self.client.post(reverse('async-get-user-data'), HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -0,0 +1,352 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+
+from .. import views
+from ..authentication import ExpiringTokenAuthentication
+from ..bloom import BloomFilter, token_filter
+from ..cache import LocalLRUCache, token_cache
+from ..models import Token
+from ..throttling import login_throttle
+from ..usage import token_usage
+
+
+class TestTokenCache(TestCase):
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        token_cache.clear()
+        self.factory = APIRequestFactory()
+        self.auth = ExpiringTokenAuthentication()
+
+        self.user = User.objects.create_user(username='test', password='test')
+        self.token = Token.objects.get(user=self.user)
+
+    def test_cached_lookup_without_queries(self):
+        self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, self.user.username)
+        self.assertEqual(token.pk, self.token.pk)
+        self.assertEqual(token_cache.stats()['hits_local'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_deferred_user_fields_are_loaded(self):
+        self.auth.authenticate_credentials(self.token.key)
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(user.check_password('test'))
+
+    def test_logout_invalidates_token(self):
+        self.auth.authenticate_credentials(self.token.key)
+        request = self.factory.post(
+            reverse('api-token-logout'),
+            format='json',
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+        response = views.CustomAuthLogOut.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_token_delete_invalidates_token(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_user_deactivation_invalidates_token(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_invalidated_again_after_commit(self):
+        self.auth.authenticate_credentials(self.token.key)
+        entry = token_cache.get(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # concurrent request caches the old row before the commit
+            token_cache.set(self.token.key, entry)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+
+class TestLocalLRUCache(TestCase):
+
+    def test_eviction_of_least_recently_used(self):
+        cache = LocalLRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entries(self):
+        now = [0]
+        cache = LocalLRUCache(max_size=2, ttl=10, timer=lambda: now[0])
+        cache.set('a', 1)
+        now[0] = 11
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestInvalidTokenRejection(TestCase):
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        token_cache.clear()
+        self.auth = ExpiringTokenAuthentication()
+        self.user = User.objects.create_user(username='test', password='test')
+
+    def test_negative_cache(self):
+        key = Token.generate_key()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_created_token_drops_negative_entry(self):
+        key = Token.generate_key()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+        Token.objects.filter(user=self.user).delete()
+        Token.objects.create(key=key, user=self.user)
+        user, _ = self.auth.authenticate_credentials(key)
+        self.assertEqual(user.pk, self.user.pk)
+
+
+# token filter needs a cache seen by all processes
+SHARED_CACHE_DIR = tempfile.mkdtemp()
+SHARED_CACHES = {
+    **settings.CACHES,
+    'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': SHARED_CACHE_DIR},
+}
+
+
+@override_settings(CACHES=SHARED_CACHES, TOKEN_FILTER={'ENABLED': True, 'SHARED_CACHE': 'shared'})
+class TestTokenFilter(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(SHARED_CACHE_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        token_cache.clear()
+        caches['shared'].clear()
+        self.auth = ExpiringTokenAuthentication()
+        self.user = User.objects.create_user(username='test', password='test')
+        # tests issue the active token of user themselves
+        Token.objects.filter(user=self.user).delete()
+
+    def test_filter_rejects_unknown_keys(self):
+        token_filter.rebuild()
+
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(Token.generate_key())
+
+    def test_filter_accepts_new_keys(self):
+        token_filter.rebuild()
+        token = Token.objects.create(user=self.user)
+
+        user, _ = self.auth.authenticate_credentials(token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_filter_sees_keys_issued_by_other_processes(self):
+        token_filter.rebuild()
+        token = Token.objects.create(user=self.user)
+        # filter of another process does not have the key
+        token_filter.bloom = BloomFilter(size_bits=1024, hashes=3)
+
+        user, _ = self.auth.authenticate_credentials(token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_process_local_cache_falls_through_to_db(self):
+        with override_settings(TOKEN_FILTER={'ENABLED': True, 'SHARED_CACHE': 'default'}):
+            token_filter.rebuild()
+            # issued by another process - no marker this process could see
+            token = Token.objects.create(user=self.user)
+            cache.clear()
+            token_filter.bloom = BloomFilter(size_bits=1024, hashes=3)
+
+            user, _ = self.auth.authenticate_credentials(token.key)
+            self.assertEqual(user.pk, self.user.pk)
+
+    def test_rebuild_of_generation_runs_once(self):
+        token_filter.rebuild()
+        token_filter.request_rebuild()
+        rebuilds = token_filter.stats()['rebuilds']
+
+        for _ in range(3):
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.authenticate_credentials(Token.generate_key())
+        self.assertEqual(token_filter.stats()['rebuilds'], rebuilds + 1)
+
+    def test_stale_filter_is_served_while_rebuilt(self):
+        bloom = token_filter.rebuild()
+        token_filter.built_at -= token_filter.options['REFRESH_INTERVAL'] + 1
+        release = threading.Event()
+
+        with mock.patch.object(token_filter, 'rebuild', side_effect=lambda: release.wait(5)) as rebuild:
+            for _ in range(3):
+                self.assertIs(token_filter.get_bloom(), bloom)
+            release.set()
+            while token_filter._refresh_lock.locked():
+                time.sleep(0.01)
+
+        rebuild.assert_called_once_with()
+
+
+class TestBloomFilter(TestCase):
+
+    def test_no_false_negatives(self):
+        keys = [Token.generate_key() for _ in range(1000)]
+        bloom = BloomFilter.for_capacity(len(keys), 0.01, max_bytes=1024 * 1024)
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(Token.generate_key() in bloom for _ in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_memory_bound(self):
+        bloom = BloomFilter.for_capacity(10 ** 6, 0.01, max_bytes=1024)
+        self.assertEqual(bloom.size_bytes, 1024)
+
+
+@override_settings(SIGNED_TOKENS={'ENABLED': True})
+class TestSignedTokens(TestCase):
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        # epochs are cached by user id, which is reused between tests
+        cache.clear()
+        login_throttle.clear()
+        self.factory = APIRequestFactory()
+        self.auth = ExpiringTokenAuthentication()
+        self.user = User.objects.create_user(username='test', password='test')
+
+    def login(self):
+        request = self.factory.post(
+            reverse('api-token-auth'),
+            {'username': 'test', 'password': 'test'},
+            format='json',
+        )
+        response = views.CustomAuthToken.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    def test_authentication_without_queries(self):
+        key = self.login()
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(key)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, self.user.username)
+        self.assertEqual(str(token), key)
+
+    def test_db_tokens_keep_working(self):
+        self.login()
+        key = Token.objects.get(user=self.user).key
+
+        user, _ = self.auth.authenticate_credentials(key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_forged_token(self):
+        key = self.login()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key[:-1] + ('a' if key[-1] != 'a' else 'b'))
+
+    def test_logout_revokes_token(self):
+        key = self.login()
+        request = self.factory.post(
+            reverse('api-token-logout'),
+            format='json',
+            HTTP_AUTHORIZATION=f'Token {key}'
+        )
+        response = views.CustomAuthLogOut.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+        self.auth.authenticate_credentials(self.login())
+
+    def test_user_change_revokes_token(self):
+        key = self.login()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_password_change_revokes_token(self):
+        key = self.login()
+        self.user.set_password('changed')
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_login_keeps_tokens(self):
+        key = self.login()
+        update_last_login(None, self.user)
+        self.login()
+        # hash upgrade on login
+        User.objects.filter(pk=self.user.pk).update(password=make_password('test', hasher='pbkdf2_sha1'))
+        self.login()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+        user, _ = self.auth.authenticate_credentials(key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_unrelated_change_keeps_tokens(self):
+        key = self.login()
+        self.user.first_name = 'Test'
+        self.user.save()
+
+        user, _ = self.auth.authenticate_credentials(key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_deleted_user(self):
+        key = self.login()
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_disabled_signed_tokens(self):
+        key = self.login()
+
+        with override_settings(SIGNED_TOKENS={'ENABLED': False}), self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
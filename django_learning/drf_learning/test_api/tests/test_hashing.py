@@ -0,0 +1,93 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..hashing import HashingBusy, HashingExecutor, get_process_pool, password_hashing
+from ..throttling import login_throttle
+
+MD5_FIRST = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+]
+
+
+class TestHashingExecutor(TestCase):
+
+    def test_full_queue_is_rejected(self):
+        executor = HashingExecutor({'MAX_PENDING': 1, 'TIMEOUT': 0.01})
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(password):
+            started.set()
+            release.wait(5)
+            return password
+
+        thread = threading.Thread(target=executor.run, args=(slow_hash, 'test'))
+        thread.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(HashingBusy):
+                executor.make_password('test')
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(executor.rejected, 1)
+        # slot is free again
+        self.assertTrue(executor.check_password('test', executor.make_password('test')))
+
+    def test_process_pool_size(self):
+        # workers are not started until the first hash
+        with override_settings(PASSWORD_HASHING={'EXECUTOR': 'process', 'WORKERS': 2}):
+            self.assertIs(password_hashing.get_executor(), get_process_pool())
+            self.assertEqual(get_process_pool()._max_workers, 2)
+
+        with override_settings(PASSWORD_HASHING={'EXECUTOR': 'process', 'WORKERS': 3}):
+            self.assertEqual(password_hashing.get_executor()._max_workers, 3)
+
+
+class TestLogin(TestCase):
+
+    def setUp(self) -> None:
+        login_throttle.clear()
+        self.url = reverse('api-token-auth')
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test', password='test')
+
+    def test_login(self):
+        response = self.client.post(self.url, {'username': 'test', 'password': 'test'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(self.url, {'username': 'test', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_busy_executor_returns_503(self):
+        with mock.patch.object(password_hashing, 'run', side_effect=HashingBusy):
+            response = self.client.post(self.url, {'username': 'test', 'password': 'test'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], str(HashingBusy.wait))
+
+    @override_settings(PASSWORD_HASHERS=MD5_FIRST)
+    def test_rehash_on_login(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+        response = self.client.post(self.url, {'username': 'test', 'password': 'test'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+        self.assertTrue(self.user.check_password('test'))
+
+    @override_settings(PASSWORD_HASHERS=MD5_FIRST, PASSWORD_HASHING={'REHASH_ON_LOGIN': False})
+    def test_no_rehash_when_disabled(self):
+        response = self.client.post(self.url, {'username': 'test', 'password': 'test'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
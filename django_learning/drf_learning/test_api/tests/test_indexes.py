@@ -0,0 +1,36 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+
+from .utils import ExplainTestMixin
+from ..admin import TokenInline
+from ..models import Token
+from ..services import get_expired_tokens, get_fresh_tokens, get_inactive_tokens
+
+
+class TestTokenIndexes(ExplainTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test', password='test')
+
+    def test_authentication_lookup(self):
+        self.assertUsesIndex(Token.objects.select_related('user').filter(key=Token.generate_key()))
+
+    def test_fresh_token_lookup(self):
+        self.assertUsesIndex(get_fresh_tokens(self.user)[:1], 'token_active_user_unique')
+
+    def test_admin_inline_lookup(self):
+        queryset = TokenInline(User, admin.site).get_queryset(None).filter(user=self.user)
+        self.assertUsesIndex(queryset, 'token_active_user_unique')
+
+    def test_reaper_lookup(self):
+        expired = get_expired_tokens().order_by('created', 'pk')
+        self.assertUsesIndex(expired.values_list('created', 'pk')[:1000], 'token_created_idx')
+        created = timezone.now()
+        batch = expired.filter(Q(created__gte=created) & (Q(created__gt=created) | Q(pk__gt=0)))
+        self.assertUsesIndex(batch.values_list('created', 'pk')[:1000], 'token_created_idx')
+
+        inactive = get_inactive_tokens().filter(created__gte=created, pk__gt=0).order_by('pk')
+        self.assertUsesIndex(inactive.values_list('pk')[:1000], 'token_inactive_idx')
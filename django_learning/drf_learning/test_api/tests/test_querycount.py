@@ -0,0 +1,75 @@
+import asyncio
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from drf_learning.querycount import QueryBudgetExceeded, QueryBudgetTestMixin, QueryCountMiddleware, sql_shape
+from ..cache import token_cache
+from ..models import Token
+from ..usage import token_usage
+
+STRICT = {
+    'STRICT': True,
+    'BUDGETS': {'get-user-data': 1, 'user-detail': 2, 'user-list': 2},
+}
+
+
+class TestQueryBudget(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        token_cache.clear()
+        self.client = APIClient()
+        self.users = [User.objects.create_user(username=f'test{i}') for i in range(5)]
+        self.token_key = Token.objects.get(user=self.users[0]).key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token_key}')
+
+    def test_sql_shape(self):
+        self.assertEqual(
+            sql_shape("SELECT * FROM \"auth_user\" WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM "auth_user" WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    @override_settings(QUERY_BUDGET=STRICT)
+    def test_views_within_budget(self):
+        for url in (reverse('get-user-data'), reverse('user-detail', args=[self.users[1].pk]), reverse('user-list')):
+            token_cache.clear()
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(QUERY_BUDGET={**STRICT, 'BUDGETS': {'user-list': 1}})
+    def test_budget_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('user-list'))
+
+    @override_settings(QUERY_BUDGET={'SERVER_TIMING': True})
+    def test_server_timing(self):
+        response = self.client.get(reverse('get-user-data'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries"$')
+
+        with override_settings(QUERY_BUDGET={'SERVER_TIMING': False}):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('get-user-data')))
+
+    @override_settings(QUERY_BUDGET={'SERVER_TIMING': True})
+    async def test_async_request(self):
+        async def get_response(request):
+            pass
+
+        # async chain is not adapted to sync around the middleware
+        self.assertTrue(asyncio.iscoroutinefunction(QueryCountMiddleware(get_response)))
+
+        response = await AsyncClient().get(
+            reverse('async-get-user-data'), AUTHORIZATION=f'Token {self.token_key}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries"$')
+
+    def test_repeated_queries_fail(self):
+        with self.assertRaisesRegex(AssertionError, r'5x SELECT .* FROM "test_api_token"'):
+            with self.assertQueryBudget():
+                for user in self.users:
+                    Token.objects.filter(user=user).first()
+
+        with self.assertQueryBudget(max_queries=1):
+            list(Token.objects.filter(user__in=self.users))
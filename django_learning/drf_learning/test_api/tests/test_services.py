@@ -0,0 +1,157 @@
+import datetime
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .. import services
+from ..hashing import POOL_THRESHOLD, hash_passwords
+from ..models import Token
+from ..services import bulk_create_users, issue_token, reap_tokens
+
+
+class TestIssueToken(TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test', password='test')
+        self.token = Token.objects.get(user=self.user)
+
+    def test_reuse_fresh_token_in_single_query(self):
+        with self.assertNumQueries(1):
+            token = issue_token(self.user)
+        self.assertEqual(token, self.token)
+
+    def test_one_active_token_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Token.objects.create(user=self.user)
+
+    def test_token_created_by_concurrent_login(self):
+        # the first read misses the token another login has just created
+        with mock.patch.object(services, 'get_fresh_token', side_effect=[None, self.token]):
+            self.assertEqual(issue_token(self.user), self.token)
+
+        self.assertQuerysetEqual(Token.objects.filter(user=self.user), [self.token])
+        self.token.refresh_from_db()
+        self.assertTrue(self.token.is_active)
+
+    def test_inactive_token_is_not_reused(self):
+        self.token.is_active = False
+        self.token.save()
+
+        token = issue_token(self.user)
+        self.assertNotEqual(token, self.token)
+        self.assertTrue(token.is_active)
+
+    def test_expired_token_is_not_reused(self):
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - datetime.timedelta(days=2))
+
+        self.assertNotEqual(issue_token(self.user), self.token)
+        self.token.refresh_from_db()
+        self.assertFalse(self.token.is_active)
+
+
+class TestConcurrentIssueToken(TransactionTestCase):
+
+    def test_concurrent_logins_get_same_token(self):
+        user = User.objects.create_user(username='test', password='test')
+        Token.objects.filter(user=user).delete()
+
+        threads_count = 10
+        barrier = threading.Barrier(threads_count)
+        keys = []
+
+        def login():
+            try:
+                barrier.wait(timeout=5)
+                for _ in range(100):
+                    try:
+                        keys.append(issue_token(user).key)
+                        break
+                    except OperationalError:
+                        # in-memory SQLite of tests reports a locked table instead of waiting for it
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=login) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(keys), threads_count)
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(Token.objects.filter(user=user).count(), 1)
+
+
+class TestReapTokens(TestCase):
+
+    def setUp(self) -> None:
+        users = [User.objects.create_user(username=f'test{i}') for i in range(5)]
+        self.fresh = Token.objects.get(user=users[0])
+        Token.objects.filter(user__in=users[1:3]).update(is_active=False)
+        # users[2] is both - deleted once
+        Token.objects.filter(user__in=users[2:]).update(created=timezone.now() - datetime.timedelta(days=2))
+
+    def test_delete_dead_tokens_in_batches(self):
+        progress = list(reap_tokens(batch_size=3))
+
+        self.assertEqual(progress, [(3, 3), (1, 4)])
+        self.assertQuerysetEqual(Token.objects.all(), [self.fresh])
+
+    def test_dry_run(self):
+        progress = list(reap_tokens(batch_size=3, dry_run=True))
+
+        self.assertEqual(progress[-1], (1, 4))
+        self.assertEqual(Token.objects.count(), 5)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('reap_tokens', batch_size=2, sleep=0, stdout=out)
+
+        self.assertIn('Deleted 4 tokens', out.getvalue())
+        self.assertQuerysetEqual(Token.objects.all(), [self.fresh])
+
+
+class TestBulkCreateUsers(TestCase):
+
+    def setUp(self) -> None:
+        User.objects.create_user(username='existing')
+
+    def test_create_users_with_tokens(self):
+        created, errors = bulk_create_users([
+            {'username': 'first', 'password': 'secret', 'email': 'first@example.com'},
+            {'username': 'second', 'password': 'secret'},
+        ])
+
+        self.assertEqual((created, errors), (2, []))
+        user = User.objects.get(username='first')
+        self.assertEqual(user.email, 'first@example.com')
+        self.assertTrue(user.check_password('secret'))
+        self.assertTrue(Token.objects.filter(user=user, is_active=True).exists())
+
+    def test_per_row_errors(self):
+        created, errors = bulk_create_users([
+            {'username': 'first', 'password': 'secret'},
+            {'username': 'first', 'password': 'secret'},
+            {'username': 'existing', 'password': 'secret'},
+            {'username': 'bad name!', 'password': 'secret'},
+            {'username': 'no_password'},
+        ], batch_size=2)
+
+        self.assertEqual(created, 1)
+        self.assertEqual([error['index'] for error in errors], [1, 2, 3, 4])
+        self.assertIn('password', errors[3]['errors'])
+
+    def test_passwords_hashed_in_pool(self):
+        passwords = [f'secret{i}' for i in range(POOL_THRESHOLD)]
+        hashed = hash_passwords(passwords)
+
+        self.assertTrue(all(check_password(password, encoded) for password, encoded in zip(passwords, hashed)))
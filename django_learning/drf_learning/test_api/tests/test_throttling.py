@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..hashing import password_hashing
+from ..throttling import SlidingWindowStore, TokenBucketStore, login_throttle
+
+
+class Timer:
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucketStore(TestCase):
+
+    def test_burst_and_refill(self):
+        timer = Timer()
+        store = TokenBucketStore(max_keys=10, timer=timer)
+
+        self.assertEqual([store.consume('key', 3, 60) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.consume('key', 3, 60), 20)
+        # other keys have own buckets
+        self.assertEqual(store.consume('other', 3, 60), 0)
+
+        timer.now += 20
+        self.assertEqual(store.consume('key', 3, 60), 0)
+
+    def test_bounded_keys(self):
+        store = TokenBucketStore(max_keys=2)
+        for key in ('first', 'second', 'third'):
+            store.consume(key, 1, 60)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.consume('first', 1, 60), 0)
+
+
+class TestSlidingWindowStore(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_sliding_window(self):
+        timer = Timer(6000.0)
+        store = SlidingWindowStore(cache, 'test', timer=timer)
+
+        self.assertEqual([store.consume('key', 2, 60) for _ in range(2)], [0, 0])
+        self.assertGreater(store.consume('key', 2, 60), 0)
+
+        # half of the previous window still counts
+        timer.now += 90
+        self.assertEqual(store.consume('key', 2, 60), 0)
+        self.assertGreater(store.consume('key', 2, 60), 0)
+
+        timer.now += 60
+        self.assertEqual(store.consume('key', 2, 60), 0)
+
+
+class TestLoginThrottle(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        login_throttle.clear()
+        self.url = reverse('api-token-auth')
+        self.client = APIClient()
+        User.objects.create_user(username='test', password='test')
+
+    def login(self, username='test', password='wrong', **extra):
+        return self.client.post(self.url, {'username': username, 'password': password}, format='json', **extra)
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(LOGIN_THROTTLE={'USERNAME_RATE': '3/min'})
+    def test_username_limit_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch.object(password_hashing, 'run') as run:
+            self.assertThrottled(self.login(password='test'))
+        run.assert_not_called()
+
+        # other users from the same IP are not affected
+        self.assertEqual(self.login(username='other').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(login_throttle.stats()['rejected_username'], 1)
+
+    @override_settings(LOGIN_THROTTLE={'IP_RATE': '2/min'})
+    def test_ip_limit(self):
+        self.login(username='first')
+        self.login(username='second')
+        self.assertThrottled(self.login(username='third'))
+
+        response = self.login(username='third', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(login_throttle.stats()['rejected_ip'], 1)
+
+    @override_settings(LOGIN_THROTTLE={'IP_RATE': '2/min'})
+    def test_forwarded_for_is_not_trusted(self):
+        for i in range(2):
+            self.login(username=f'user{i}', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')
+        self.assertThrottled(self.login(username='third', HTTP_X_FORWARDED_FOR='10.0.0.3'))
+
+    @override_settings(LOGIN_THROTTLE={'BACKEND': 'cache', 'USERNAME_RATE': '2/min'})
+    def test_cache_backend(self):
+        self.login()
+        self.login()
+        self.assertThrottled(self.login())
+
+    @override_settings(LOGIN_THROTTLE={'ENABLED': False, 'USERNAME_RATE': '1/min'})
+    def test_disabled(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,65 @@
+import datetime
+import threading
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from ..authentication import ExpiringTokenAuthentication
+from ..models import Token
+from ..usage import TokenUsageTracker, token_usage
+
+
+class TestTokenUsageTracker(TestCase):
+
+    def setUp(self) -> None:
+        # global tracker - tokens used by a test are never flushed into other database
+        self.addCleanup(token_usage.clear)
+        self.tracker = TokenUsageTracker({'MAX_PENDING': 10}, autostart=False)
+        self.tokens = [Token.objects.get(user=User.objects.create_user(username=f'test{i}')) for i in range(5)]
+
+    def test_last_use_is_kept(self):
+        now = timezone.now()
+        token = self.tokens[0]
+        self.tracker.touch(token.key, now - datetime.timedelta(minutes=1))
+        self.tracker.touch(token.key, now)
+
+        self.assertEqual(self.tracker.flush(), 1)
+        token.refresh_from_db()
+        self.assertEqual(token.last_used, now)
+
+    def test_bounded_writes_under_load(self):
+        def use_tokens():
+            for _ in range(1000):
+                for token in self.tokens:
+                    self.tracker.touch(token.key)
+
+        threads = [threading.Thread(target=use_tokens) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), len(self.tokens))
+        self.assertEqual(self.tracker.stats()['touches'], 4 * 1000 * len(self.tokens))
+        self.assertFalse(Token.objects.filter(last_used__isnull=True).exists())
+
+    def test_clear(self):
+        self.tracker.touch(self.tokens[0].key)
+        self.tracker.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tracker.flush(), 0)
+
+    def test_empty_flush(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tracker.flush(), 0)
+
+    def test_authentication_without_writes(self):
+        auth = ExpiringTokenAuthentication()
+        token_usage.flush()
+
+        with self.assertNumQueries(1):
+            auth.authenticate_credentials(self.tokens[0].key)
+        self.assertIn(self.tokens[0].key, token_usage.pending)
@@ -1,11 +1,19 @@
+import json
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIRequestFactory, APIClient
 
 from .. import views
 from ..models import Token
+from ..representations import user_representations
+from ..throttling import login_throttle
+from ..usage import token_usage
 
 
 # coverage run --source='.' manage.py test test_api
@@ -14,6 +22,7 @@ from ..models import Token
 class TestUserCreation(TestCase):
 
     def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
         self.factory = APIRequestFactory()
 
         self.admin = User.objects.create_superuser(
@@ -51,6 +60,7 @@ class TestUserCreation(TestCase):
 class UserLoginTest(TestCase):
 
     def setUp(self) -> None:
+        login_throttle.clear()
         self.url = reverse('api-token-auth')
         self.client = APIClient()
         self.factory = APIRequestFactory()
@@ -107,6 +117,7 @@ class UserLoginTest(TestCase):
 class TestUserLogout(TestCase):
 
     def setUp(self):
+        self.addCleanup(token_usage.clear)
         self.factory = APIRequestFactory()
 
         self.url = reverse('api-token-logout')
@@ -148,3 +159,166 @@ class TestUserLogout(TestCase):
             self.assertNotEqual(response.status_code, status.HTTP_200_OK)
             self.assertTrue(request.user.is_anonymous)
             self.assertFalse(request.user.is_authenticated)
+
+
+class TestUserDetail(TestCase):
+
+    def setUp(self) -> None:
+        # ids are reused between tests, cached data of old users must go
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('user-detail', args=[self.user.pk])
+
+    def test_cached_until_user_changes(self):
+        self.assertEqual(self.client.get(self.url).data['email'], 'test@example.com')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['email'], 'test@example.com')
+
+        self.user.email = 'new@example.com'
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data['email'], 'new@example.com')
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        self.user.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deleted_user(self):
+        other = User.objects.create_user(username='other')
+        url = reverse('user-detail', args=[other.pk])
+        etag = self.client.get(url)['ETag']
+
+        other.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_version_bumped_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+        version = user_representations.get_version(self.user.pk)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(user_representations.get_version(self.user.pk), version)
+
+
+class TestUserList(TestCase):
+
+    def setUp(self) -> None:
+        self.addCleanup(token_usage.clear)
+        self.url = reverse('user-list')
+        self.client = APIClient()
+
+        self.user = User.objects.create_user(username='test', password='test', email='test@test.com')
+        User.objects.bulk_create(User(username=f'user{i}') for i in range(5))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=self.user).key}')
+
+    def test_password_is_not_exposed(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'username', 'email'})
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_fields_projection(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'username,password'})
+
+        self.assertEqual(response.data['results'][0], {'username': 'test'})
+        users_query = next(query['sql'] for query in queries if 'FROM "auth_user"' in query['sql'])
+        self.assertNotIn('"auth_user"."email"', users_query)
+
+    def test_unknown_fields(self):
+        response = self.client.get(self.url, {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream(self):
+        response = self.client.get(self.url, {'stream': 1, 'fields': 'id,username'})
+
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data), User.objects.count())
+        self.assertEqual(data[0], {'id': self.user.id, 'username': 'test'})
+
+
+class TestUserExport(TestCase):
+
+    def setUp(self) -> None:
+        self.url = reverse('user-export')
+        self.client = APIClient()
+
+        self.admin = User.objects.create_superuser(username='admin', email='admin', password='admin')
+        self.user = User.objects.create_user(username='test', password='test')
+        # user keeps the active token created with it
+        Token.objects.create(user=self.user, is_active=False)
+        Token.objects.filter(user=self.admin).delete()
+        self.client.force_authenticate(self.admin)
+
+    def test_ndjson(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        admin, user = [json.loads(line) for line in lines]
+        self.assertEqual(admin['tokens'], [])
+        self.assertEqual(user['username'], 'test')
+        self.assertEqual(len(user['tokens']), 1)
+        self.assertNotIn('key', user['tokens'][0])
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'output': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines[0], 'id,username,email,is_active,date_joined,token_id,token_created,token_last_used')
+        self.assertEqual(len(lines), 3)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestBulkUserCreation(TestCase):
+
+    def setUp(self) -> None:
+        self.url = reverse('create-users-bulk')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', email='admin', password='admin'))
+
+    def test_bulk_create(self):
+        response = self.client.post(self.url, [
+            {'username': 'first', 'password': 'secret'},
+            {'username': 'admin', 'password': 'secret'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+
+    def test_nothing_created(self):
+        response = self.client.post(self.url, [{'username': 'admin', 'password': 'secret'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_a_list(self):
+        response = self.client.post(self.url, {'username': 'first', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
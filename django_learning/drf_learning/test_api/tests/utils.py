@@ -0,0 +1,25 @@
+import re
+
+from django.db import connection
+
+
+class ExplainTestMixin:
+    """ Assertions on query plans - Postgres and SQLite """
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        """ Main table of {queryset} is looked up by index ({index_name} if given), not scanned """
+        table = queryset.model._meta.db_table
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # planner prefers sequential scans for tiny test tables
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            full_scan = re.search(rf'Seq Scan on {table}\b', plan)
+        else:
+            plan = queryset.explain()
+            full_scan = re.search(rf'\bSCAN (TABLE )?{table}\b', plan)
+
+        self.assertIsNone(full_scan, f'Full scan of {table}:\n{plan}')
+        if index_name is not None:
+            self.assertIn(index_name, plan, f'Index {index_name} is not used:\n{plan}')
@@ -0,0 +1,196 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'ENABLED': True,
+    # 'local' - token buckets in process memory, for single node deployments
+    # 'cache' - sliding window counters in CACHE, shared between nodes
+    'BACKEND': 'local',
+    'CACHE': 'default',
+    # login attempts per period, for each username and each client IP
+    'USERNAME_RATE': '10/min',
+    'IP_RATE': '100/min',
+    # local backend keeps buckets of so many keys, least recently used are dropped
+    'MAX_KEYS': 100000,
+    'KEY_PREFIX': 'test_api:login_throttle',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """ '10/min' -> (10, 60) - same format as DRF throttle rates """
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class TokenBucketStore:
+    """
+    Per-process token buckets - {num} attempts at once, refilled with
+    {num} per {period}. A bucket is two numbers, so a bounded number of keys
+    fits in memory; buckets of idle keys are full again and can be dropped.
+
+    Not lock-free - Python has no compare-and-swap, so a short lock guards
+    read-modify-write of a bucket. The 'cache' backend is the lock-free one
+    (atomic incr()).
+    """
+
+    def __init__(self, max_keys, timer=time.monotonic):
+        self.max_keys = max_keys
+        self.timer = timer
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, num, period):
+        """ Take a token from bucket of {key}, returns 0 or seconds to wait for one """
+        now = self.timer()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (num, now))
+            tokens = min(num, tokens + (now - updated) * num / period)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * period / num
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SlidingWindowStore:
+    """
+    Sliding window counters in a Django cache - count of current fixed window
+    plus the overlapping part of the previous one. One atomic incr() per
+    attempt, so all nodes see the same counters (Redis, Memcached).
+    """
+
+    def __init__(self, cache, key_prefix, timer=time.time):
+        self.cache = cache
+        self.key_prefix = key_prefix
+        self.timer = timer
+
+    def consume(self, key, num, period):
+        now = self.timer()
+        window = math.floor(now / period)
+        current_key = f'{self.key_prefix}:{key}:{window}'
+
+        # add() does nothing when counter exists, incr() is atomic
+        self.cache.add(current_key, 0, 2 * period)
+        try:
+            count = self.cache.incr(current_key)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.add(current_key, 1, 2 * period)
+            count = 1
+        previous = self.cache.get(f'{self.key_prefix}:{key}:{window - 1}', 0)
+
+        elapsed = now / period - window
+        if previous * (1 - elapsed) + count <= num:
+            return 0
+
+        # rejected attempts are not counted - like with token buckets
+        try:
+            self.cache.decr(current_key)
+        except ValueError:
+            pass
+        return (1 - elapsed) * period
+
+    def clear(self):
+        """ Counters expire by themselves """
+
+
+class LoginThrottle:
+    """ Limits login attempts per username and per client IP before password check """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        if self.options['BACKEND'] == 'cache':
+            self.store = SlidingWindowStore(caches[self.options['CACHE']], self.options['KEY_PREFIX'])
+        else:
+            self.store = TokenBucketStore(self.options['MAX_KEYS'])
+        self.allowed = 0
+        self.rejected_ip = 0
+        self.rejected_username = 0
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    def check(self, ip, username=None):
+        """ Returns 0 when attempt is allowed or seconds to wait """
+        wait = self.store.consume(f'ip:{ip}', *parse_rate(self.options['IP_RATE']))
+        if wait:
+            self.rejected_ip += 1
+            return wait
+
+        if username:
+            # usernames may contain characters not allowed in cache keys
+            digest = hashlib.blake2b(username.encode(), digest_size=16).hexdigest()
+            wait = self.store.consume(f'user:{digest}', *parse_rate(self.options['USERNAME_RATE']))
+            if wait:
+                self.rejected_username += 1
+                return wait
+
+        self.allowed += 1
+        return 0
+
+    def clear(self):
+        self.store.clear()
+        self.allowed = self.rejected_ip = self.rejected_username = 0
+
+    def stats(self):
+        return {
+            'backend': self.options['BACKEND'],
+            'allowed': self.allowed,
+            'rejected_ip': self.rejected_ip,
+            'rejected_username': self.rejected_username,
+        }
+
+
+login_throttle = LoginThrottle(getattr(settings, 'LOGIN_THROTTLE', None))
+
+
+@receiver(setting_changed)
+def reload_login_throttle(setting, value, **kwargs):
+    """ Reconfigure throttle on override_settings(LOGIN_THROTTLE=...) """
+    if setting == 'LOGIN_THROTTLE':
+        login_throttle.configure(value)
+
+
+class LoginRateThrottle(BaseThrottle):
+    """
+    DRF throttle for login views - runs before the view, so before password
+    hashing. Client IP comes from get_ident(), see NUM_PROXIES in settings.
+    """
+
+    def allow_request(self, request, view):
+        if not login_throttle.enabled:
+            return True
+
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        self._wait = login_throttle.check(self.get_ident(request), str(username) if username else None)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
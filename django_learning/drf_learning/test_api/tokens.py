@@ -0,0 +1,110 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from test_api.models import TokenEpoch
+from test_api.utils import instance_from_values
+
+DEFAULTS = {
+    'ENABLED': False,
+    # alias from settings.CACHES holding epochs - must be shared between processes,
+    # otherwise revocation is seen by other processes only after EPOCH_TTL
+    'CACHE': 'default',
+    'EPOCH_TTL': 60,
+    'KEY_PREFIX': 'test_api:token_epoch',
+}
+SALT = 'test_api.tokens.SignedToken'
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+# epoch of deleted users - never matches a token
+NO_USER = -1
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'SIGNED_TOKENS', {})}
+
+
+def is_enabled():
+    return get_options()['ENABLED']
+
+
+def is_signed_key(key):
+    """ DB token keys are hex strings, signed ones contain a signature separator """
+    return ':' in key
+
+
+class SignedToken:
+    """
+    Stateless token - HMAC signed user id, issue time and revocation epoch.
+    Used as request.auth the same way as test_api.models.Token.
+    """
+
+    is_active = True
+
+    def __init__(self, key, user, created, epoch):
+        self.key = key
+        self.user = user
+        self.user_id = user.pk
+        self.created = created
+        self.epoch = epoch
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def issue(cls, user):
+        created = timezone.now()
+        payload = {
+            'user': {field: getattr(user, field) for field in USER_FIELDS},
+            'iat': int(created.timestamp()),
+            'epoch': get_epoch(user.pk),
+        }
+        key = signing.Signer(salt=SALT).sign_object(payload, compress=True)
+        return cls(key, user, created, payload['epoch'])
+
+    @classmethod
+    def load(cls, key):
+        """ Token from signed key - raises signing.BadSignature for forged keys """
+        payload = signing.Signer(salt=SALT).unsign_object(key)
+        user = instance_from_values(get_user_model(), payload['user'])
+        created = datetime.datetime.fromtimestamp(payload['iat'], tz=datetime.timezone.utc)
+        return cls(key, user, created, payload['epoch'])
+
+    def is_revoked(self):
+        return self.epoch != get_epoch(self.user_id)
+
+
+def get_cache():
+    return caches[get_options()['CACHE']]
+
+
+def make_key(user_id):
+    return f"{get_options()['KEY_PREFIX']}:{user_id}"
+
+
+def get_epoch(user_id):
+    """ Current revocation epoch of user - from cache, DB on cache miss only """
+    epoch = get_cache().get(make_key(user_id))
+    if epoch is None:
+        epochs = list(
+            get_user_model().objects.filter(pk=user_id).values_list('token_epoch__epoch', flat=True)
+        )
+        epoch = NO_USER if not epochs else epochs[0] or 0
+        get_cache().set(make_key(user_id), epoch, get_options()['EPOCH_TTL'])
+    return epoch
+
+
+def bump_epoch(user_id):
+    """ Revoke all signed tokens of user """
+    updated = TokenEpoch.objects.filter(user_id=user_id).update(epoch=F('epoch') + 1)
+    if not updated:
+        TokenEpoch.objects.get_or_create(user_id=user_id, defaults={'epoch': 1})
+    get_cache().delete(make_key(user_id))
+
+
+def forget_epoch(user_id):
+    get_cache().delete(make_key(user_id))
@@ -1,12 +1,17 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 
 urlpatterns = [
     path('create/', views.CreateUserAPIView.as_view(), name='create-user'),
+    path('create/bulk/', views.BulkCreateUserAPIView.as_view(), name='create-users-bulk'),
     path('data/', views.GetUserDataApiView.as_view(), name='get-user-data'),
     path('users/', views.UserList.as_view(), name='user-list'),
+    path('users/export/', views.UserExportView.as_view(), name='user-export'),
     path('users/<int:pk>/', views.UserDetail.as_view(), name='user-detail'),
     path('api-token-auth/', views.CustomAuthToken.as_view(), name='api-token-auth'),
     path('api-token-logout/', views.CustomAuthLogOut.as_view(), name='api-token-logout'),
+    # async variants - same responses, for ASGI deployments
+    path('async/data/', async_views.user_data, name='async-get-user-data'),
+    path('async/users/<int:pk>/', async_views.user_detail, name='async-user-detail'),
 ]
@@ -0,0 +1,132 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, DatabaseError
+from django.db.models import Case, DateTimeField, Value, When
+from django.dispatch import receiver
+from django.utils import timezone
+
+from test_api.models import Token
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # flush pending timestamps every FLUSH_INTERVAL seconds
+    # or as soon as MAX_PENDING distinct tokens are waiting
+    'FLUSH_INTERVAL': 30,
+    'MAX_PENDING': 1000,
+}
+
+
+class TokenUsageTracker:
+    """
+    Collects last use time of tokens in memory - one entry per token key -
+    and writes them with a single UPDATE per flush from a background thread.
+    """
+
+    def __init__(self, options=None, autostart=True):
+        self.autostart = autostart
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.pending = {}
+        self.touches = 0
+        self.flushes = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    def touch(self, key, when=None):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.pending[key] = when or timezone.now()
+            self.touches += 1
+            full = len(self.pending) >= self.options['MAX_PENDING']
+
+        if self._thread is None and self.autostart:
+            self.start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """ Write pending timestamps, returns number of flushed keys """
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        Token.objects.filter(key__in=pending).update(
+            last_used=Case(
+                *[When(key=key, then=Value(when)) for key, when in pending.items()],
+                output_field=DateTimeField(),
+            )
+        )
+        self.flushes += 1
+        self.rows += len(pending)
+        return len(pending)
+
+    def clear(self):
+        """ Drop pending timestamps """
+        with self._lock:
+            self.pending = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='token-usage', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.options['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.safe_flush()
+            connection.close()
+
+    def safe_flush(self):
+        try:
+            self.flush()
+        except DatabaseError as error:
+            logger.warning('Could not flush token usage: %s', error)
+
+    def stop(self):
+        """ Stop background thread and write what is left """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.safe_flush()
+
+    def stats(self):
+        return {
+            'touches': self.touches,
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'pending': len(self.pending),
+        }
+
+
+token_usage = TokenUsageTracker(getattr(settings, 'TOKEN_USAGE', None))
+
+
+@receiver(setting_changed)
+def reload_token_usage(setting, value, **kwargs):
+    """ Reconfigure tracker on override_settings(TOKEN_USAGE=...) """
+    if setting == 'TOKEN_USAGE':
+        token_usage.stop()
+        token_usage.configure(value)
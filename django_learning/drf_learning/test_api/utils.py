@@ -9,3 +9,9 @@ def custom_create_token(token_model, user, serializer):
     token.created = utc_now
     token.save()
     return token
+
+
+def instance_from_values(model, values):
+    """ Model instance with only given fields loaded, the rest are deferred """
+    field_names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(model.objects.db, field_names, [values[name] for name in field_names])
@@ -0,0 +1,201 @@
+"""
+Query count, DB time and N+1 detection per request.
+
+QueryCountMiddleware counts queries of every request, reports SQL run
+again and again (N+1 - e.g. related objects fetched per row of a list) and
+checks QUERY_BUDGET['BUDGETS'] of the view. QueryBudgetTestMixin does the
+same for a block of test code.
+
+Queries of streamed responses run after the middleware and are not counted.
+
+The canonical copy is django_learning/drf_learning/drf_learning/querycount.py.
+django_mini_project and django_movie_portal carry byte for byte copies,
+checked by their tests - change the canonical one and copy it over.
+"""
+import asyncio
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Server-Timing header with query count and DB time - dev only, shows internals
+    'SERVER_TIMING': False,
+    # the same SQL run so many times in one request is reported as N+1
+    'REPEAT_THRESHOLD': 5,
+    # max queries per view for GET/HEAD - url name or dotted path of unnamed view,
+    # over it a warning is logged. Writes are not checked, their size varies.
+    'BUDGETS': {},
+    # raise QueryBudgetExceeded instead of warning - for tests
+    'STRICT': False,
+}
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+def sql_shape(sql):
+    """ SQL without values - queries differing only in parameters have the same shape """
+    return LITERAL.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """ Execute wrapper counting queries, their time and shapes """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        """ Shapes run at least {threshold} times, most frequent first """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def report(self, threshold):
+        lines = [f'{self.count} queries, {self.duration * 1000:.1f}ms']
+        lines += [f'  {count}x {shape}' for shape, count in self.repeated(threshold)]
+        return '\n'.join(lines)
+
+
+@contextmanager
+def track_queries():
+    """ Collect QueryStats of all databases used inside the block """
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+# stats of the running async request - connections are per thread, its ORM work
+# runs in sync_to_async threads, which get a copy of the context
+context_stats = contextvars.ContextVar('context_stats', default=None)
+
+
+def count_context_query(execute, sql, params, many, context):
+    stats = context_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_context_counter(connection, **kwargs):
+    if count_context_query not in connection.execute_wrappers:
+        # first - execute_wrapper() blocks pop the last one on exit
+        connection.execute_wrappers.insert(0, count_context_query)
+
+
+@contextmanager
+def track_context_queries():
+    """ Collect QueryStats of queries of the current context, in whatever thread they run """
+    stats = QueryStats()
+    token = context_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        context_stats.reset(token)
+
+
+class QueryCountMiddleware:
+    """
+    Works in both modes - under ASGI async views run without a thread hop
+    through this middleware
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Django checks this to call us as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        options = get_options()
+        if not options['ENABLED']:
+            return self.get_response(request)
+
+        with track_queries() as stats:
+            response = self.get_response(request)
+        return self.finish(request, response, stats, options)
+
+    async def __acall__(self, request):
+        options = get_options()
+        if not options['ENABLED']:
+            return await self.get_response(request)
+
+        with track_context_queries() as stats:
+            response = await self.get_response(request)
+        return self.finish(request, response, stats, options)
+
+    def finish(self, request, response, stats, options):
+        self.check(request, stats, options)
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+        return response
+
+    # noinspection PyMethodMayBeStatic
+    def check(self, request, stats, options):
+        view_name = request.resolver_match.view_name if request.resolver_match else request.path
+        repeated = stats.repeated(options['REPEAT_THRESHOLD'])
+        if repeated:
+            logger.warning(
+                'Possible N+1 in %s:\n%s', view_name, stats.report(options['REPEAT_THRESHOLD'])
+            )
+
+        budget = options['BUDGETS'].get(view_name) if request.method in ('GET', 'HEAD') else None
+        if budget is not None and stats.count > budget:
+            message = f'{view_name} made {stats.count} queries, budget is {budget}'
+            if options['STRICT']:
+                raise QueryBudgetExceeded(message + '\n' + stats.report(options['REPEAT_THRESHOLD']))
+            logger.warning(message)
+
+
+class QueryBudgetTestMixin:
+    """ TestCase assertions on query count and repeated queries """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries=None, repeat_threshold=None):
+        """
+        Code inside the block makes at most {max_queries} queries and no query
+        shape is repeated {repeat_threshold} times (N+1)
+        """
+        threshold = repeat_threshold or get_options()['REPEAT_THRESHOLD']
+        with track_queries() as stats:
+            yield stats
+
+        if max_queries is not None and stats.count > max_queries:
+            self.fail(f'Query budget {max_queries} exceeded: {stats.report(threshold)}')
+        if stats.repeated(threshold):
+            self.fail(f'Repeated queries (N+1): {stats.report(threshold)}')
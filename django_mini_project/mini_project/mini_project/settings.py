@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mini_project.querycount.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +52,35 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query count per request (see mini_project/querycount.py) - N+1 and views over
+# BUDGETS (url name: max queries) are logged, STRICT raises instead.
+QUERY_BUDGET = {
+    'ENABLED': True,
+    'SERVER_TIMING': DEBUG,
+    'REPEAT_THRESHOLD': 5,
+    'BUDGETS': {
+        'salesorder-list': 2,
+        'salesorder-detail': 2,
+    },
+    'STRICT': False,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered orders of orders_page (see orders/fragments.py) - one entry
+    # per order, the whole page has to fit or every render culls what the
+    # next one needs. Sized for 100k orders plus changed versions - about
+    # 70MB per process; use Redis or Memcached shared by processes in production.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 150000},
+    },
+}
+ORDERS_FRAGMENT_CACHE = 'fragments'
+
 ROOT_URLCONF = 'mini_project.urls'
 
 TEMPLATES = [
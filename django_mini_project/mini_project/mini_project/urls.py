@@ -17,10 +17,12 @@ from django.contrib import admin
 from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from orders.views import orders_page, OrderView, orders_app
+from orders.views import orders_page, OrderView, orders_app, ProductOrderStatsView, UserOrderStatsView
 
 router = SimpleRouter()
 router.register('api/orders', OrderView)
+router.register('api/stats/users', UserOrderStatsView, basename='user-order-stats')
+router.register('api/stats/products', ProductOrderStatsView, basename='product-order-stats')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
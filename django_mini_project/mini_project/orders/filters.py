@@ -0,0 +1,32 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class OrderFilter(BaseFilterBackend):
+    """
+    Query params (all optional, integers):
+        user - orders of user
+        amount_min, amount_max - amount range, inclusive
+        product - orders containing product
+    """
+
+    lookups = {
+        'user': 'user_id',
+        'amount_min': 'amount__gte',
+        'amount_max': 'amount__lte',
+        'product': 'products',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        filters = {}
+        for param, lookup in self.lookups.items():
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                filters[lookup] = int(value)
+            except ValueError:
+                raise ValidationError({param: 'A valid integer is required.'})
+
+        # one through row per order and product - no duplicates to remove
+        return queryset.filter(**filters)
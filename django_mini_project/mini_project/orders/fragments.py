@@ -0,0 +1,60 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+
+# orders fetched from DB and looked up in cache at once
+CHUNK_SIZE = 1000
+FRAGMENT_TTL = 24 * 60 * 60
+KEY_PREFIX = 'orders:fragment'
+# fields shown by orders/order.html
+FRAGMENT_FIELDS = ('amount', 'description')
+
+
+def get_cache():
+    return caches[getattr(settings, 'ORDERS_FRAGMENT_CACHE', 'default')]
+
+
+def make_key(order):
+    """
+    Key of rendered {order} - versioned by the shown fields, so a change by
+    save(), QuerySet.update() or raw SQL is never served stale. Fragments of
+    old versions and deleted orders are not read again and age out.
+    """
+    version = hashlib.md5(repr([getattr(order, field) for field in FRAGMENT_FIELDS]).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{order.pk}:{version}'
+
+
+def render_orders(orders, chunk_size=None):
+    """
+    HTML of {orders} queryset in chunks of {chunk_size} (CHUNK_SIZE by default) -
+    one query per chunk (iterator), rendered order fragments are cached until
+    the order is changed (see make_key)
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    template = get_template('orders/order.html')
+    cache = get_cache()
+
+    chunk = []
+    for order in orders.iterator(chunk_size=chunk_size):
+        chunk.append(order)
+        if len(chunk) == chunk_size:
+            yield render_chunk(chunk, template, cache)
+            chunk = []
+    if chunk:
+        yield render_chunk(chunk, template, cache)
+
+
+def render_chunk(orders, template, cache):
+    keys = {order.pk: make_key(order) for order in orders}
+    cached = cache.get_many(keys.values())
+
+    rendered = {}
+    for order in orders:
+        if keys[order.pk] not in cached:
+            rendered[keys[order.pk]] = template.render({'order': order})
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_TTL)
+
+    return ''.join(cached.get(keys[order.pk]) or rendered[keys[order.pk]] for order in orders)
@@ -0,0 +1,265 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory
+
+from mini_project.querycount import track_queries
+from orders import fragments
+from orders.models import ProductOrderStats, SalesOrder, UserOrderStats
+from orders.pagination import OrderCursorPagination
+from orders.stats import reconcile
+from orders.views import OrderView, orders_page
+from products.models import Product
+
+
+@contextmanager
+def test_database():
+    """ Throwaway database like in `manage.py test` - never touch real data """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, iterations):
+    """ Run func {iterations} times, return timings (ms) and executed queries count """
+    timings = []
+    # CaptureQueriesContext keeps only the last 9000 queries
+    with track_queries() as queries:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings, queries.count
+
+
+def create_orders(start, stop, users, products, batch_size=10000):
+    """ Orders {start}..{stop} spread over {users}, each with one of {products} """
+    for batch_start in range(start, stop, batch_size):
+        numbers = range(batch_start, min(batch_start + batch_size, stop))
+        SalesOrder.objects.bulk_create(
+            SalesOrder(amount=i % 1000, description=f'order {i}', user=users[i % len(users)]) for i in numbers
+        )
+        orders = SalesOrder.objects.order_by('-id').values_list('id', flat=True)[:len(numbers)]
+        SalesOrder.products.through.objects.bulk_create(
+            SalesOrder.products.through(salesorder_id=order_id, product=products[order_id % len(products)])
+            for order_id in orders
+        )
+
+
+def bench_order_list(command, options):
+    """ GET /api/orders/ - first and middle page, filtered pages, for {orders} table sizes """
+    factory = APIRequestFactory()
+    view = OrderView.as_view({'get': 'list'})
+    users = [User.objects.create_user(username=f'user{i}') for i in range(100)]
+    products = [Product.objects.create(name=f'product {i}') for i in range(100)]
+
+    def get(params):
+        def request():
+            response = view(factory.get('/api/orders/', params))
+            assert response.status_code == 200, response.data
+            response.render()
+        return request
+
+    def middle_cursor():
+        paginator = OrderCursorPagination()
+        paginator.base_url = '/api/orders/'
+        paginator.ordering = ('id',)
+        middle = SalesOrder.objects.order_by('id').values_list('id', flat=True)[SalesOrder.objects.count() // 2]
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(middle)))
+        return parse_qs(urlparse(url).query)['cursor'][0]
+
+    created = 0
+    for size in options['orders']:
+        create_orders(created, size, users, products)
+        created = size
+
+        for title, params in (
+            ('first page', {}),
+            ('middle page', {'cursor': middle_cursor()}),
+            ('by user', {'user': users[0].pk}),
+            ('by amount range', {'amount_min': 100, 'amount_max': 110}),
+            ('by product', {'product': products[0].pk}),
+            ('by amount, descending', {'ordering': '-amount'}),
+        ):
+            timings, queries = measure(get(params), options['iterations'])
+            command.report(f'{size} orders, {title}', timings, queries)
+
+
+def bench_bulk_orders(command, options):
+    """ {iterations} orders with 3 products each - one POST /api/orders/ per order vs POST /api/orders/bulk/ """
+    factory = APIRequestFactory()
+    user = User.objects.create_user(username='bench')
+    products = [Product.objects.create(name=f'product {i}').pk for i in range(10)]
+    rows = [
+        {'amount': i, 'description': f'order {i}', 'user': user.pk, 'products': products[i % 8:i % 8 + 3]}
+        for i in range(options['iterations'])
+    ]
+
+    view = OrderView.as_view({'post': 'create'})
+    started = time.perf_counter()
+    with track_queries() as queries:
+        for row in rows:
+            response = view(factory.post('/api/orders/', row, format='json'))
+            assert response.status_code == 201, response.data
+    elapsed = time.perf_counter() - started
+    command.stdout.write(
+        f'per order: {elapsed:.2f}s, {len(rows) / elapsed:.0f} orders/s, queries/order={queries.count / len(rows):.2f}'
+    )
+
+    view = OrderView.as_view({'post': 'bulk'})
+    started = time.perf_counter()
+    with track_queries() as queries:
+        response = view(factory.post('/api/orders/bulk/', rows, format='json'))
+        assert response.status_code == 201, response.data
+    elapsed = time.perf_counter() - started
+    command.stdout.write(
+        f'bulk: {elapsed:.2f}s, {len(rows) / elapsed:.0f} orders/s, queries/order={queries.count / len(rows):.3f}'
+    )
+
+
+def bench_order_stats(command, options):
+    """ Totals per user and product - on the fly from orders vs stats tables, for {orders} table sizes """
+    users = [User.objects.create_user(username=f'user{i}') for i in range(100)]
+    products = [Product.objects.create(name=f'product {i}') for i in range(100)]
+
+    def user_totals_on_the_fly():
+        SalesOrder.objects.filter(user=users[0]).aggregate(orders=Count('id'), amount=Sum('amount'))
+
+    def user_totals_from_stats():
+        UserOrderStats.objects.filter(user=users[0]).values_list('order_count', 'total_amount').first()
+
+    def top_products_on_the_fly():
+        list(
+            SalesOrder.products.through.objects.values('product')
+            .annotate(amount=Sum('salesorder__amount')).order_by('-amount')[:10]
+        )
+
+    def top_products_from_stats():
+        list(ProductOrderStats.objects.order_by('-total_amount')[:10])
+
+    created = 0
+    for size in options['orders']:
+        create_orders(created, size, users, products)
+        created = size
+        # bulk inserted orders send no signals
+        reconcile()
+
+        for title, func in (
+            ('user totals, on the fly', user_totals_on_the_fly),
+            ('user totals, from stats', user_totals_from_stats),
+            ('top products, on the fly', top_products_on_the_fly),
+            ('top products, from stats', top_products_from_stats),
+        ):
+            timings, queries = measure(func, options['iterations'])
+            command.report(f'{size} orders, {title}', timings, queries)
+
+
+# orders_page before streaming - whole queryset rendered by one template
+ALL_AT_ONCE_TEMPLATE = """<html><body>
+{% for order in orders %}
+    <div class="btn btn-success btn-lg">
+        Description: {{ order.description }}
+        <br>
+        Amount: {{ order.amount }}
+    </div>
+    <br>
+    <br>
+{% endfor %}
+</body></html>"""
+
+
+def measure_response(func):
+    """ Time to first byte and to the end (ms), peak of memory allocated (MB) - tracing in separate run """
+    def run():
+        started = time.perf_counter()
+        response = func()
+        chunks = iter(response.streaming_content) if response.streaming else iter([response.content])
+        next(chunks)
+        first_byte = time.perf_counter() - started
+        for _ in chunks:
+            pass
+        return first_byte * 1000, (time.perf_counter() - started) * 1000
+
+    first_byte, total = run()
+    tracemalloc.start()
+    try:
+        run()
+        return first_byte, total, tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_orders_page(command, options):
+    """ GET / - rendered at once vs streamed with cold and warm fragment cache, for {orders} table sizes """
+    factory = APIRequestFactory()
+    users = [User.objects.create_user(username=f'user{i}') for i in range(10)]
+    products = [Product.objects.create(name=f'product {i}') for i in range(10)]
+    template = Template(ALL_AT_ONCE_TEMPLATE)
+
+    def all_at_once():
+        return HttpResponse(template.render(Context({'orders': SalesOrder.objects.all()})))
+
+    def streamed():
+        return orders_page(factory.get('/'))
+
+    created = 0
+    for size in options['orders']:
+        create_orders(created, size, users, products)
+        created = size
+
+        for title, func in (
+            ('at once', all_at_once),
+            ('streamed, cold cache', lambda: fragments.get_cache().clear() or streamed()),
+            ('streamed, warm cache', streamed),
+        ):
+            first_byte, total, peak = measure_response(func)
+            command.stdout.write(
+                f'{size} orders, {title}: first byte {first_byte:.0f}ms, total {total:.0f}ms, peak memory {peak:.1f}MB'
+            )
+
+
+class Command(BaseCommand):
+    help = 'Run orders benchmarks against a throwaway test database'
+
+    scenarios = {
+        'bulk_orders': bench_bulk_orders,
+        'order_list': bench_order_list,
+        'order_stats': bench_order_stats,
+        'orders_page': bench_orders_page,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument(
+            '--orders', type=lambda value: [int(size) for size in value.split(',')], default=[10000, 100000],
+            help='Comma separated table sizes, e.g. 10000,100000,1000000',
+        )
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.scenarios[options['scenario']](self, options)
+
+    def report(self, title, timings, queries=None):
+        timings = sorted(timings)
+        line = (
+            f'{title}: n={len(timings)} mean={statistics.mean(timings):.3f}ms '
+            f'p50={timings[len(timings) // 2]:.3f}ms p99={timings[int(len(timings) * 0.99)]:.3f}ms'
+        )
+        if queries is not None:
+            line += f' queries/op={queries / len(timings):.2f}'
+        self.stdout.write(line)
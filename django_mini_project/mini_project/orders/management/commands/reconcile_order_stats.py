@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from orders.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute order stats per user and product from orders and fix rows that differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report rows that differ')
+
+    def handle(self, *args, **options):
+        fixed = reconcile(dry_run=options['dry_run'])
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        for model, count in fixed.items():
+            self.stdout.write(f'{verb} {count} {model} rows')
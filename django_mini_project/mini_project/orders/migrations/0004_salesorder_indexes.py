@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_salesorder_products'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['user', 'id'], name='salesorder_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['amount', 'id'], name='salesorder_amount_id_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    """ Stats of existing orders - later kept up to date by orders.signals """
+    SalesOrder = apps.get_model('orders', 'SalesOrder')
+    UserOrderStats = apps.get_model('orders', 'UserOrderStats')
+    ProductOrderStats = apps.get_model('orders', 'ProductOrderStats')
+
+    users = (
+        SalesOrder.objects.filter(user__isnull=False).values('user')
+        .annotate(orders=Count('id'), amount=Sum('amount')).values_list('user', 'orders', 'amount')
+    )
+    UserOrderStats.objects.bulk_create(
+        UserOrderStats(user_id=user_id, order_count=orders, total_amount=amount) for user_id, orders, amount in users
+    )
+
+    products = (
+        SalesOrder.products.through.objects.values('product')
+        .annotate(orders=Count('salesorder'), amount=Sum('salesorder__amount'))
+        .values_list('product', 'orders', 'amount')
+    )
+    ProductOrderStats.objects.bulk_create(
+        ProductOrderStats(product_id=product_id, order_count=orders, total_amount=amount)
+        for product_id, orders, amount in products
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0002_rename_products_product'),
+        ('orders', '0004_salesorder_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductOrderStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to='products.product')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserOrderStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
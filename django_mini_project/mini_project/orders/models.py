@@ -1,11 +1,66 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 from products.models import Product
 
 
+class SalesOrderQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Orders are taken out of order stats by the delete itself - a delete
+        receiver would turn off fast delete of cascades
+        """
+        from orders import stats
+
+        with transaction.atomic(using=self.db):
+            counted = stats.count_orders(self)
+            deleted = super().delete()
+            stats.add_orders(counted.values(), sign=-1)
+        return deleted
+
+
 class SalesOrder(models.Model):
     amount = models.IntegerField()
     description = models.CharField(max_length=255)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     products = models.ManyToManyField(Product)
+
+    objects = SalesOrderQuerySet.as_manager()
+
+    def delete(self, using=None, keep_parents=False):
+        from orders import stats
+
+        with transaction.atomic(using=using):
+            # before delete - product rows are gone afterwards
+            counted = (self.user_id, self.amount, list(self.products.values_list('pk', flat=True)))
+            deleted = super().delete(using, keep_parents)
+            stats.add_orders([counted], sign=-1)
+        return deleted
+
+    class Meta:
+        indexes = [
+            # filters combined with keyset pagination on id
+            models.Index(fields=['user', 'id'], name='salesorder_user_id_idx'),
+            models.Index(fields=['amount', 'id'], name='salesorder_amount_id_idx'),
+        ]
+
+
+class UserOrderStats(models.Model):
+    """
+    Orders of user - kept up to date by orders.signals and SalesOrder
+    deletes, fixed by `reconcile_order_stats`
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='order_stats')
+    order_count = models.PositiveIntegerField(default=0)
+    total_amount = models.BigIntegerField(default=0)
+
+
+class ProductOrderStats(models.Model):
+    """
+    Orders containing product - kept up to date by orders.signals and
+    SalesOrder deletes, fixed by `reconcile_order_stats`
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='order_stats')
+    order_count = models.PositiveIntegerField(default=0)
+    total_amount = models.BigIntegerField(default=0)
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination - constant cost for any page. Ordered by id unless
+    another whitelisted field is requested with `ordering` param.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        """ Ties of non-unique ordering field are ordered by key - same order on every page """
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if ordering[0].lstrip('-') != self.ordering:
+            ordering += (f'-{self.ordering}' if ordering[0].startswith('-') else self.ordering,)
+        return ordering
+
+
+class StatsCursorPagination(OrderCursorPagination):
+    """ Stats rows have user or product as primary key """
+    ordering = 'pk'
@@ -1,9 +1,53 @@
-from rest_framework.serializers import ModelSerializer
+from django.contrib.auth.models import User
+from rest_framework.serializers import IntegerField, ListField, ModelSerializer
 
-from orders.models import SalesOrder
+from orders.models import ProductOrderStats, SalesOrder, UserOrderStats
+from products.serializers import ProductSerializer
+
+
+class OrderUserSerializer(ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username']
 
 
 class OrderSerializer(ModelSerializer):
+    """ Related objects as ids, nested objects for fields listed in context['expand'] """
+
+    expandable_fields = {
+        'products': lambda: ProductSerializer(many=True, read_only=True),
+        'user': lambda: OrderUserSerializer(read_only=True),
+    }
+
     class Meta:
         model = SalesOrder
         fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        for field_name in self.context.get('expand', ()):
+            self.fields[field_name] = self.expandable_fields[field_name]()
+
+
+class OrderImportSerializer(ModelSerializer):
+    """ Row of bulk order import - user and products are checked for the whole batch at once """
+
+    user = IntegerField(required=False, allow_null=True)
+    products = ListField(child=IntegerField(), required=False)
+
+    class Meta:
+        model = SalesOrder
+        fields = ['amount', 'description', 'user', 'products']
+
+
+class UserOrderStatsSerializer(ModelSerializer):
+    class Meta:
+        model = UserOrderStats
+        fields = ['user', 'order_count', 'total_amount']
+
+
+class ProductOrderStatsSerializer(ModelSerializer):
+    class Meta:
+        model = ProductOrderStats
+        fields = ['product', 'order_count', 'total_amount']
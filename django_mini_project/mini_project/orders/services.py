@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from orders import stats
+from orders.models import SalesOrder
+from orders.serializers import OrderImportSerializer
+from products.models import Product
+
+
+def bulk_create_orders(rows, batch_size=1000):
+    """
+    Validate and create orders with their products in one transaction - all
+    or nothing. Returns ids of created orders and list of errors -
+    {'index': row index, 'errors': serializer errors}, nothing is created
+    when there are any.
+    """
+    valid = []
+    errors = []
+    for index, row in enumerate(rows):
+        serializer = OrderImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    errors += _check_relations(valid)
+    if errors:
+        errors.sort(key=lambda error: error['index'])
+        return [], errors
+
+    return _create_orders([data for _, data in valid], batch_size), []
+
+
+def _check_relations(valid):
+    """ Errors of rows referring to missing users or products - two queries for all rows """
+    user_ids = {data['user'] for _, data in valid if data.get('user') is not None}
+    product_ids = {pk for _, data in valid for pk in data.get('products', [])}
+    users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+
+    errors = []
+    for index, data in valid:
+        row_errors = {}
+        if data.get('user') is not None and data['user'] not in users:
+            row_errors['user'] = [f'Invalid pk "{data["user"]}" - object does not exist.']
+        missing = sorted(set(data.get('products', [])) - products)
+        if missing:
+            row_errors['products'] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+    return errors
+
+
+def _create_orders(orders_data, batch_size):
+    """
+    Insert orders and their product rows. post_save and m2m_changed signals
+    are not sent - order stats are updated here, once per user and product.
+    """
+    through = SalesOrder.products.through
+
+    with transaction.atomic():
+        orders = SalesOrder.objects.bulk_create(
+            (
+                SalesOrder(amount=data['amount'], description=data['description'], user_id=data.get('user'))
+                for data in orders_data
+            ),
+            batch_size=batch_size,
+        )
+        if connection.features.can_return_rows_from_bulk_insert:
+            ids = [order.pk for order in orders]
+        else:
+            # ids of one multi-row insert are consecutive (SQLite locks the whole
+            # database for the transaction) - the newest ids are ours
+            ids = list(SalesOrder.objects.order_by('-id').values_list('id', flat=True)[:len(orders)])[::-1]
+
+        through.objects.bulk_create(
+            (
+                through(salesorder_id=order_id, product_id=product_id)
+                for order_id, data in zip(ids, orders_data)
+                for product_id in set(data.get('products', []))
+            ),
+            batch_size=batch_size,
+        )
+        stats.add_orders(
+            (data.get('user'), data['amount'], set(data.get('products', []))) for data in orders_data
+        )
+    return ids
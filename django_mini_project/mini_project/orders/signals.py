@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from orders import stats
+from orders.models import SalesOrder
+
+
+@receiver(pre_save, sender=SalesOrder)
+def remember_counted_values(sender, instance=None, **kwargs):
+    """
+    Values counted in stats before the change - to move them on post_save.
+    By the stored row, not by _state.adding - SalesOrder(pk=<existing>).save()
+    updates the row.
+    """
+    instance._counted = None
+    if instance.pk is not None:
+        instance._counted = SalesOrder.objects.filter(pk=instance.pk).values_list('user_id', 'amount').first()
+
+
+@receiver(post_save, sender=SalesOrder)
+def count_order(sender, instance=None, created=False, **kwargs):
+    counted = getattr(instance, '_counted', None)
+    if counted is None:
+        # new order has no products yet - they come with m2m_changed
+        stats.add_orders([(instance.user_id, instance.amount, [])])
+        return
+
+    user_id, amount = counted
+    if (user_id, amount) == (instance.user_id, instance.amount):
+        return
+
+    product_ids = list(instance.products.values_list('pk', flat=True))
+    stats.add_orders([(user_id, amount, product_ids)], sign=-1)
+    stats.add_orders([(instance.user_id, instance.amount, product_ids)])
+
+
+# deleted orders are taken out of stats by SalesOrder.delete() and SalesOrderQuerySet.delete() -
+# no delete receiver on SalesOrder, so orders of deleted users are fast deleted
+
+
+@receiver(pre_delete, sender=User)
+def uncount_user_orders(sender, instance=None, **kwargs):
+    """ Orders of user are deleted by cascade - products keep no count of them, user stats go with the user """
+    counted = stats.count_orders(SalesOrder.objects.filter(user=instance))
+    stats.add_orders(((None, amount, product_ids) for _, amount, product_ids in counted.values()), sign=-1)
+
+
+@receiver(m2m_changed, sender=SalesOrder.products.through)
+def count_order_products(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    """ Products added to or removed from orders - from either side of the relation """
+    related = instance.salesorder_set if reverse else instance.products
+
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set of remove() may hold objects that are not related, clear() gives none
+        existing = related.all()
+        if action == 'pre_remove':
+            existing = existing.filter(pk__in=pk_set)
+        instance._uncounted = set(existing.values_list('pk', flat=True))
+        return
+
+    if action == 'post_add':
+        pks, sign = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        pks, sign = instance._uncounted, -1
+    else:
+        return
+
+    if reverse:
+        # instance is product, pks are orders
+        amounts = SalesOrder.objects.filter(pk__in=pks).values_list('amount', flat=True)
+        orders = [(None, amount, [instance.pk]) for amount in amounts]
+    else:
+        orders = [(None, instance.amount, pks)]
+    stats.add_orders(orders, sign)
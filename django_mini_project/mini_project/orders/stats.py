@@ -0,0 +1,136 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Count, F, Sum, Value, When
+
+from orders.models import ProductOrderStats, SalesOrder, UserOrderStats
+
+
+# stats rows changed by one UPDATE - keeps number of query parameters low
+BATCH_SIZE = 500
+
+
+def apply_deltas(model, deltas):
+    """
+    Add {pk: (orders, amount)} deltas to stats rows with UPDATE ... SET x = x + delta,
+    so concurrent changes are not lost. Missing rows are created.
+    """
+    deltas = [(pk, delta) for pk, delta in deltas.items() if any(delta)]
+    for start in range(0, len(deltas), BATCH_SIZE):
+        batch = dict(deltas[start:start + BATCH_SIZE])
+        existing = set(model.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        if existing:
+            model.objects.filter(pk__in=existing).update(**{
+                field: F(field) + Case(
+                    *[When(pk=pk, then=Value(batch[pk][i])) for pk in existing],
+                    default=Value(0), output_field=BigIntegerField(),
+                )
+                for i, field in enumerate(('order_count', 'total_amount'))
+            })
+
+        # no row to subtract from - left to reconcile
+        missing = {pk: delta for pk, delta in batch.items() if pk not in existing and delta[0] > 0}
+        if not missing:
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    model(pk=pk, order_count=orders, total_amount=amount) for pk, (orders, amount) in missing.items()
+                )
+        except IntegrityError:
+            # some were created by a concurrent request in the meantime
+            for pk, delta in missing.items():
+                apply_delta(model, pk, *delta)
+
+
+def apply_delta(model, pk, orders, amount):
+    """ Single row version of apply_deltas """
+    changes = {'order_count': F('order_count') + orders, 'total_amount': F('total_amount') + amount}
+    if model.objects.filter(pk=pk).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(pk=pk, order_count=orders, total_amount=amount)
+    except IntegrityError:
+        model.objects.filter(pk=pk).update(**changes)
+
+
+def order_deltas(orders, sign=1):
+    """ User and product deltas of (user_id, amount, product ids) orders """
+    users = defaultdict(lambda: [0, 0])
+    products = defaultdict(lambda: [0, 0])
+    for user_id, amount, product_ids in orders:
+        if user_id is not None:
+            users[user_id][0] += sign
+            users[user_id][1] += sign * amount
+        for product_id in product_ids:
+            products[product_id][0] += sign
+            products[product_id][1] += sign * amount
+    return users, products
+
+
+def count_orders(orders):
+    """ {pk: (user_id, amount, product ids)} of {orders} queryset - two queries """
+    rows = orders.order_by().values_list('pk', 'user_id', 'amount')
+    counted = {pk: (user_id, amount, []) for pk, user_id, amount in rows}
+    through = SalesOrder.products.through.objects.filter(salesorder__in=orders.order_by().values('pk'))
+    for order_id, product_id in through.values_list('salesorder_id', 'product_id'):
+        if order_id in counted:
+            counted[order_id][2].append(product_id)
+    return counted
+
+
+def add_orders(orders, sign=1):
+    """ Count (user_id, amount, product ids) orders in stats, sign=-1 removes them """
+    users, products = order_deltas(orders, sign)
+    apply_deltas(UserOrderStats, users)
+    apply_deltas(ProductOrderStats, products)
+
+
+def compute_user_stats():
+    """ On the fly - {user_id: (orders, amount)} """
+    rows = (
+        SalesOrder.objects.filter(user__isnull=False).values('user')
+        .annotate(orders=Count('id'), amount=Sum('amount')).values_list('user', 'orders', 'amount')
+    )
+    return {user_id: (orders, amount) for user_id, orders, amount in rows}
+
+
+def compute_product_stats():
+    """ On the fly - {product_id: (orders, amount)} """
+    through = SalesOrder.products.through
+    rows = (
+        through.objects.values('product')
+        .annotate(orders=Count('salesorder'), amount=Sum('salesorder__amount'))
+        .values_list('product', 'orders', 'amount')
+    )
+    return {product_id: (orders, amount) for product_id, orders, amount in rows}
+
+
+def reconcile(dry_run=False):
+    """
+    Compare stats tables with on the fly aggregates and fix differences.
+    Returns number of fixed rows per model.
+    """
+    fixed = Counter()
+    with transaction.atomic():
+        for model, compute in (
+            (UserOrderStats, compute_user_stats),
+            (ProductOrderStats, compute_product_stats),
+        ):
+            # lock stats rows first, so incremental updates wait for the fix
+            current = {
+                pk: (orders, amount) for pk, orders, amount in
+                model.objects.select_for_update().values_list('pk', 'order_count', 'total_amount')
+            }
+            expected = compute()
+            stale = [pk for pk, value in current.items() if value != (0, 0) and pk not in expected]
+            wrong = {pk: value for pk, value in expected.items() if current.get(pk) != value}
+            fixed[model.__name__] = len(stale) + len(wrong)
+            if dry_run:
+                continue
+
+            model.objects.filter(pk__in=stale).delete()
+            for pk, (orders, amount) in wrong.items():
+                model.objects.update_or_create(pk=pk, defaults={'order_count': orders, 'total_amount': amount})
+    return fixed
@@ -1,3 +1,342 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from mini_project.querycount import QueryBudgetTestMixin
+from orders import fragments, stats
+from orders.models import ProductOrderStats, SalesOrder, UserOrderStats
+from products.models import Product
+
+
+def create_orders(count, user, products):
+    """ {count} orders of {user}, each with all {products} """
+    orders = SalesOrder.objects.bulk_create(
+        SalesOrder(amount=i, description=f'order {i}', user=user) for i in range(count)
+    )
+    # pks are not returned by bulk_create on every backend
+    orders = SalesOrder.objects.order_by('-id')[:count]
+    SalesOrder.products.through.objects.bulk_create(
+        SalesOrder.products.through(salesorder=order, product=product) for order in orders for product in products
+    )
+
+
+class TestOrderQueries(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test')
+        self.products = [Product.objects.create(name=f'product {i}') for i in range(3)]
+
+    def assertListQueries(self, count, url='/api/orders/'):
+        with self.assertQueryBudget(max_queries=count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_constant_queries_for_any_size(self):
+        create_orders(10, self.user, self.products)
+        self.assertListQueries(2)
+
+        create_orders(990, self.user, self.products)
+        response = self.assertListQueries(2, '/api/orders/?page_size=1000')
+        self.assertEqual(len(response.json()['results']), 1000)
+
+        response = self.assertListQueries(3, '/api/orders/?page_size=1000&expand=products,user')
+        self.assertEqual(len(response.json()['results']), 1000)
+
+    def test_expand(self):
+        create_orders(1, self.user, self.products)
+        order = SalesOrder.objects.get()
+
+        data = self.client.get(f'/api/orders/{order.pk}/').json()
+        self.assertEqual(data['user'], self.user.pk)
+        self.assertCountEqual(data['products'], [product.pk for product in self.products])
+
+        data = self.client.get(f'/api/orders/{order.pk}/?expand=products,user,unknown').json()
+        self.assertEqual(data['user'], {'id': self.user.pk, 'username': 'test'})
+        self.assertCountEqual(data['products'], [{'id': product.pk, 'name': product.name} for product in self.products])
+
+    def test_create_with_product_ids(self):
+        response = self.client.post(
+            '/api/orders/?expand=products',
+            {'amount': 1, 'description': 'new', 'products': [self.products[0].pk]},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['products'], [self.products[0].pk])
+
+    @override_settings(QUERY_BUDGET={'SERVER_TIMING': True})
+    def test_server_timing(self):
+        create_orders(5, self.user, self.products)
+
+        response = self.client.get('/api/orders/')
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+
+class TestOrderList(TestCase):
+
+    def setUp(self) -> None:
+        self.users = [User.objects.create_user(username=f'test{i}') for i in range(2)]
+        self.products = [Product.objects.create(name=f'product {i}') for i in range(2)]
+        for i in range(10):
+            order = SalesOrder.objects.create(amount=i % 5, description=f'order {i}', user=self.users[i % 2])
+            order.products.set(self.products[:i % 2 + 1])
+
+    def get_all(self, url):
+        """ Ids of orders from all pages """
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [order['id'] for order in data['results']]
+            url = data['next']
+        return ids
+
+    def test_keyset_pages(self):
+        data = self.client.get('/api/orders/?page_size=4').json()
+        self.assertEqual(len(data['results']), 4)
+        self.assertNotIn('count', data)
+
+        ids = self.get_all('/api/orders/?page_size=4')
+        self.assertEqual(ids, list(SalesOrder.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_filters(self):
+        cases = {
+            f'user={self.users[0].pk}': SalesOrder.objects.filter(user=self.users[0]),
+            'amount_min=1&amount_max=3': SalesOrder.objects.filter(amount__range=(1, 3)),
+            f'product={self.products[1].pk}': SalesOrder.objects.filter(products=self.products[1]),
+            f'product={self.products[0].pk}&user={self.users[1].pk}':
+                SalesOrder.objects.filter(products=self.products[0], user=self.users[1]),
+        }
+        for query, expected in cases.items():
+            with self.subTest(query):
+                ids = self.get_all(f'/api/orders/?page_size=2&{query}')
+                self.assertEqual(ids, list(expected.order_by('id').values_list('id', flat=True)))
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/orders/?amount_min=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount_min', response.json())
+
+    def test_ordering(self):
+        ids = self.get_all('/api/orders/?page_size=3&ordering=-amount')
+        self.assertEqual(ids, list(SalesOrder.objects.order_by('-amount', '-id').values_list('id', flat=True)))
+
+        # not whitelisted - default order
+        ids = self.get_all('/api/orders/?ordering=description')
+        self.assertEqual(ids, list(SalesOrder.objects.order_by('id').values_list('id', flat=True)))
+
+
+class TestBulkOrders(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test')
+        self.products = [Product.objects.create(name=f'product {i}') for i in range(3)]
+        self.url = '/api/orders/bulk/'
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def test_create_orders_with_products(self):
+        rows = [
+            {'amount': i, 'description': f'order {i}', 'user': self.user.pk, 'products': [p.pk for p in self.products]}
+            for i in range(100)
+        ]
+        rows.append({'amount': 1, 'description': 'no user', 'products': [self.products[0].pk, self.products[0].pk]})
+
+        # validation, user and product checks, orders, ids, product rows - in transaction,
+        # stats of users and products - select, update existing, insert new rows in savepoint
+        with self.assertQueryBudget(max_queries=15):
+            response = self.post(rows)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 101)
+        self.assertEqual(data['ids'], list(SalesOrder.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(SalesOrder.products.through.objects.count(), 301)
+
+        order = SalesOrder.objects.get(pk=data['ids'][5])
+        self.assertEqual((order.amount, order.user), (5, self.user))
+        self.assertCountEqual(order.products.all(), self.products)
+        self.assertIsNone(SalesOrder.objects.get(pk=data['ids'][-1]).user)
+
+    def test_all_or_nothing(self):
+        response = self.post([
+            {'amount': 1, 'description': 'valid'},
+            {'amount': 'abc', 'description': 'invalid amount'},
+            {'amount': 1, 'description': 'unknown user', 'user': 0},
+            {'amount': 1, 'description': 'unknown product', 'products': [self.products[0].pk, 0]},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual([error['index'] for error in errors], [1, 2, 3])
+        self.assertIn('amount', errors[0]['errors'])
+        self.assertIn('user', errors[1]['errors'])
+        self.assertEqual(errors[2]['errors'], {'products': ['Invalid pk "0" - object does not exist.']})
+        self.assertFalse(SalesOrder.objects.exists())
+
+    def test_expects_list(self):
+        response = self.post({'amount': 1, 'description': 'single'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestOrderStats(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.users = [User.objects.create_user(username=f'test{i}') for i in range(3)]
+        self.products = [Product.objects.create(name=f'product {i}') for i in range(3)]
+
+    def assertStatsCorrect(self):
+        stored = {
+            model: {pk: (orders, amount) for pk, orders, amount in model.objects.exclude(order_count=0).values_list(
+                'pk', 'order_count', 'total_amount'
+            )}
+            for model in (UserOrderStats, ProductOrderStats)
+        }
+        self.assertEqual(stored[UserOrderStats], stats.compute_user_stats())
+        self.assertEqual(stored[ProductOrderStats], stats.compute_product_stats())
+
+    def test_incremental_updates(self):
+        first = SalesOrder.objects.create(amount=10, description='first', user=self.users[0])
+        first.products.set(self.products[:2])
+        second = SalesOrder.objects.create(amount=20, description='second', user=self.users[1])
+        second.products.add(*self.products)
+        SalesOrder.objects.create(amount=5, description='no user').products.add(self.products[2])
+        self.assertStatsCorrect()
+
+        first.amount = 15
+        first.user = self.users[2]
+        first.save()
+        self.assertStatsCorrect()
+
+        # new instance with pk of existing order updates the row
+        first = SalesOrder(pk=first.pk, amount=12, description='first', user=self.users[2])
+        first.save()
+        self.assertStatsCorrect()
+
+        second.products.remove(self.products[0], self.products[0])
+        first.products.remove(self.products[2])  # not in order
+        self.products[1].salesorder_set.add(SalesOrder.objects.get(description='no user'))
+        self.assertStatsCorrect()
+
+        self.products[1].salesorder_set.clear()
+        first.products.clear()
+        self.assertStatsCorrect()
+
+        second.delete()
+        self.users[2].delete()
+        self.assertStatsCorrect()
+
+        self.client.post('/api/orders/bulk/', [
+            {'amount': 7, 'description': 'bulk', 'user': self.users[0].pk, 'products': [self.products[0].pk]},
+            {'amount': 3, 'description': 'bulk', 'user': self.users[0].pk, 'products': [p.pk for p in self.products]},
+        ], content_type='application/json')
+        self.assertStatsCorrect()
+
+    def test_fast_delete(self):
+        for user in self.users:
+            for i in range(5):
+                SalesOrder.objects.create(amount=i, description='order', user=user).products.set(self.products)
+
+        # the cascade collects orders of user for their M2M rows in one query and deletes
+        # them in batch - no query per order
+        with self.assertQueryBudget(repeat_threshold=2):
+            self.users[2].delete()
+        self.assertStatsCorrect()
+
+        with self.assertQueryBudget(max_queries=11, repeat_threshold=2):
+            SalesOrder.objects.filter(user=self.users[1]).delete()
+        self.assertStatsCorrect()
+
+        SalesOrder.objects.first().delete()
+        self.assertStatsCorrect()
+
+    def test_reconcile(self):
+        create_orders(5, self.users[0], self.products)
+        # bulk_create of the helper sends no signals
+        self.assertFalse(UserOrderStats.objects.exists())
+
+        self.assertEqual(stats.reconcile(dry_run=True), {'UserOrderStats': 1, 'ProductOrderStats': 3})
+        self.assertFalse(UserOrderStats.objects.exists())
+
+        UserOrderStats.objects.create(user=self.users[1], order_count=1, total_amount=1)
+        call_command('reconcile_order_stats', stdout=StringIO())
+        self.assertStatsCorrect()
+        self.assertEqual(UserOrderStats.objects.get(user=self.users[0]).total_amount, 10)
+        self.assertEqual(stats.reconcile(), {'UserOrderStats': 0, 'ProductOrderStats': 0})
+
+    def test_endpoints(self):
+        for i, user in enumerate(self.users):
+            for amount in range(i + 1):
+                SalesOrder.objects.create(amount=10 * amount, description='order', user=user)
+
+        data = self.client.get('/api/stats/users/?ordering=-total_amount').json()
+        self.assertEqual(
+            [(row['user'], row['order_count'], row['total_amount']) for row in data['results']],
+            [(self.users[2].pk, 3, 30), (self.users[1].pk, 2, 10), (self.users[0].pk, 1, 0)],
+        )
+
+        SalesOrder.objects.first().products.add(self.products[0])
+        data = self.client.get(f'/api/stats/products/{self.products[0].pk}/').json()
+        self.assertEqual(data, {'product': self.products[0].pk, 'order_count': 1, 'total_amount': 0})
+
+
+class TestOrdersPage(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        fragments.get_cache().clear()
+        for i in range(5):
+            SalesOrder.objects.create(amount=i, description=f'order {i}')
+
+    def get_page(self):
+        response = self.client.get('/')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_streamed_page(self):
+        with mock.patch.object(fragments, 'render_chunk', wraps=fragments.render_chunk) as render_chunk:
+            with mock.patch.object(fragments, 'CHUNK_SIZE', 2), self.assertQueryBudget(max_queries=3):
+                page = self.get_page()
+
+        self.assertEqual([len(call.args[0]) for call in render_chunk.call_args_list], [2, 2, 1])
+
+        self.assertTrue(page.startswith('<!DOCTYPE html>'))
+        self.assertTrue(page.rstrip().endswith('</html>'))
+        positions = [page.index(f'Description: order {i}') for i in range(5)]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_cached_fragments(self):
+        self.get_page()
+
+        with mock.patch('django.template.base.Template.render') as render:
+            render.return_value = ''
+            self.get_page()
+        # page start and end only
+        self.assertEqual(render.call_count, 2)
+
+        order = SalesOrder.objects.get(description='order 2')
+        order.description = 'changed'
+        order.save()
+        SalesOrder.objects.get(description='order 3').delete()
+        # no signal - fragment key follows the shown fields
+        SalesOrder.objects.filter(description='order 4').update(amount=40)
+
+        page = self.get_page()
+        self.assertIn('Description: changed', page)
+        self.assertNotIn('Description: order 2', page)
+        self.assertNotIn('Description: order 3', page)
+        self.assertIn('Amount: 40', page)
+
+
+class TestQueryCountCopy(SimpleTestCase):
+
+    def test_same_as_canonical(self):
+        """ querycount.py is a copy - see its docstring """
+        canonical = settings.BASE_DIR.parent.parent / 'django_learning/drf_learning/drf_learning/querycount.py'
+        if not canonical.exists():
+            self.skipTest('Project is used outside of the repository')
+        self.assertEqual((settings.BASE_DIR / 'mini_project/querycount.py').read_bytes(), canonical.read_bytes())
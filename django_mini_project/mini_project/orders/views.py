@@ -1,18 +1,114 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from .models import SalesOrder
-from rest_framework.viewsets import ModelViewSet
+from django.template.loader import render_to_string
+from .models import ProductOrderStats, SalesOrder, UserOrderStats
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from .serializers import OrderSerializer
+from . import fragments
+from .filters import OrderFilter
+from .pagination import OrderCursorPagination, StatsCursorPagination
+from .serializers import OrderSerializer, ProductOrderStatsSerializer, UserOrderStatsSerializer
+from .services import bulk_create_orders
 
 
 def orders_page(request):
-    orders = SalesOrder.objects.all()
-    return render(request, 'index.html', {'orders': orders})
+    """ All orders, streamed - memory use does not depend on number of orders """
+    orders = SalesOrder.objects.only('id', *fragments.FRAGMENT_FIELDS).order_by('id')
+
+    def page():
+        yield render_to_string('orders/page_start.html', request=request)
+        yield from fragments.render_orders(orders)
+        yield render_to_string('orders/page_end.html', request=request)
+
+    return StreamingHttpResponse(page(), content_type='text/html; charset=utf-8')
 
 
 class OrderView(ModelViewSet):
-    queryset = SalesOrder.objects.all()
+    """
+    Orders - fixed number of queries for any page size.
+
+    Query params:
+        expand - comma separated products, user: nested objects instead of ids
+        user, amount_min, amount_max, product - see OrderFilter
+        ordering - id or amount, `-` for descending
+        cursor, page_size - see OrderCursorPagination
+    """
+    queryset = SalesOrder.objects.prefetch_related('products')
     serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
+    filter_backends = (OrderFilter, OrderingFilter)
+    ordering_fields = ('id', 'amount')
+
+    def get_expand(self):
+        value = self.request.query_params.get('expand', '')
+        return [name for name in value.split(',') if name in OrderSerializer.expandable_fields]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'user' in self.get_expand():
+            queryset = queryset.select_related('user')
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # expanded fields are read only - writes always take ids
+        if self.request.method in SAFE_METHODS:
+            context['expand'] = self.get_expand()
+        return context
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many orders at once - all or none of them.
+
+        Example:
+                Request data:
+                [
+                    {"amount": 10, "description": "first", "user": 1, "products": [1, 2]},
+                    {"amount": 20, "description": "second"}
+                ]
+                Response data:
+                {
+                    "created": 2,
+                    "ids": [11, 12],
+                    "errors": []
+                }
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'detail': 'Expected a list of orders.'})
+
+        ids, errors = bulk_create_orders(request.data)
+        return Response({
+            'created': len(ids),
+            'ids': ids,
+            'errors': errors,
+        }, status=status.HTTP_400_BAD_REQUEST if errors else status.HTTP_201_CREATED)
+
+
+class UserOrderStatsView(ReadOnlyModelViewSet):
+    """
+    Order count and total amount per user - from orders.stats table, no scan of orders.
+
+    Query params:
+        ordering - order_count or total_amount, `-` for descending
+    """
+    queryset = UserOrderStats.objects.all()
+    serializer_class = UserOrderStatsSerializer
+    pagination_class = StatsCursorPagination
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ('order_count', 'total_amount')
+
+
+class ProductOrderStatsView(UserOrderStatsView):
+    """ Count and total amount of orders containing product - see UserOrderStatsView """
+    queryset = ProductOrderStats.objects.all()
+    serializer_class = ProductOrderStatsSerializer
 
 
 def orders_app(request):
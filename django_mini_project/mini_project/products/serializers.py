@@ -0,0 +1,9 @@
+from rest_framework.serializers import ModelSerializer
+
+from products.models import Product
+
+
+class ProductSerializer(ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name']
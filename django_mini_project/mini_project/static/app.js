@@ -7,7 +7,7 @@ new Vue({
         const vm = this;
         axios.get('/api/orders/')
         .then(function (response){
-            vm.orders = response.data
+            vm.orders = response.data.results
         })
     }
 }
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movie_portal.querycount.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +51,38 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query count per request (see movie_portal/querycount.py) - N+1 and views over
+# BUDGETS (url name: max queries) are logged, STRICT raises instead.
+QUERY_BUDGET = {
+    'ENABLED': True,
+    'SERVER_TIMING': DEBUG,
+    'REPEAT_THRESHOLD': 5,
+    'BUDGETS': {
+        # listing - session and user of logged in visitors on top of it
+        'movies.views.MovieView': 3,
+        'movie-rating': 2,
+        'movie-reviews': 3,
+    },
+    'STRICT': False,
+}
+
+# movies listing pages and cards, see movies.cache.DEFAULTS. The default local
+# memory cache is per process - use a shared one with several workers, otherwise
+# the other processes keep serving pages of an old content version
+MOVIE_LISTING_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TTL': 24 * 60 * 60,
+}
+
+# votes for movies, see movies.ratings.DEFAULTS - written by a background
+# thread of every process in batches
+RATING_BUFFER = {
+    'BUFFERED': True,
+    'BATCH_SIZE': 1000,
+    'FLUSH_INTERVAL': 1.0,
+}
+
 ROOT_URLCONF = 'movie_portal.urls'
 
 TEMPLATES = [
@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'ENABLED': True,
+    # alias from settings.CACHES - shared one (Redis, Memcached) with several processes
+    'CACHE': 'default',
+    'TTL': 24 * 60 * 60,
+    # one request renders a missing page, others wait for it up to LOCK_TIMEOUT seconds
+    'LOCK_TIMEOUT': 10,
+    'POLL_INTERVAL': 0.05,
+    # change it when templates change - old entries are not read anymore
+    'KEY_PREFIX': 'movies:listing:v1',
+}
+
+
+class ListingCache:
+    """
+    Rendered listing pages and movie cards.
+
+    Pages are keyed by content version and request params. Any change of
+    listed content replaces the version, so all cached pages are dropped at
+    once. A missing page is rendered by a single request (single-flight) -
+    others wait for its result instead of rendering the same page.
+
+    Cards are keyed by the values they show, so a card is rendered again only
+    when its movie changed, not on every version bump.
+    """
+
+    def __init__(self, options=None):
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.card_hits = 0
+        self.card_misses = 0
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE']]
+
+    def make_key(self, name, *parts):
+        return ':'.join([self.options['KEY_PREFIX'], name, *map(str, parts)])
+
+    def get_version(self):
+        """ Current content version, a new one if there is none yet """
+        key = self.make_key('version')
+        version = self.cache.get(key)
+        if version is None:
+            # add() keeps the version of a concurrent request
+            self.cache.add(key, time.time_ns(), self.options['TTL'])
+            version = self.cache.get(key)
+        return version
+
+    def bump_version(self):
+        self.cache.set(self.make_key('version'), time.time_ns(), self.options['TTL'])
+
+    def page_key(self, *params):
+        """ Key of page for validated {params} - only values the view renders the page by """
+        digest = hashlib.blake2b(repr(params).encode(), digest_size=16).hexdigest()
+        return self.make_key('page', self.get_version(), digest)
+
+    def get_or_render(self, key, render):
+        """ Cached value of {key} or result of {render}() stored in cache """
+        value = self.cache.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + self.options['LOCK_TIMEOUT']
+        while not self.cache.add(lock_key, 1, self.options['LOCK_TIMEOUT']):
+            # other request renders the page
+            self.waits += 1
+            time.sleep(self.options['POLL_INTERVAL'])
+            value = self.cache.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() > deadline:
+                # renderer is stuck or died - render without the lock
+                return render()
+
+        try:
+            value = render()
+            self.cache.set(key, value, self.options['TTL'])
+            return value
+        finally:
+            self.cache.delete(lock_key)
+
+    def card_key(self, movie):
+        shown = f'{movie.title}\0{movie.tagline}\0{movie.poster.name}'
+        return self.make_key('card', movie.pk, hashlib.blake2b(shown.encode(), digest_size=16).hexdigest())
+
+    def render_cards(self, movies, render):
+        """ HTML of card of every movie - one cache round trip for all, {render}(movie) for missing """
+        keys = [self.card_key(movie) for movie in movies]
+        cached = self.cache.get_many(keys)
+
+        rendered = {key: render(movie) for key, movie in zip(keys, movies) if key not in cached}
+        if rendered:
+            self.cache.set_many(rendered, self.options['TTL'])
+        self.card_hits += len(cached)
+        self.card_misses += len(rendered)
+        return [cached.get(key) or rendered[key] for key in keys]
+
+    def stats(self):
+        pages = self.hits + self.misses
+        cards = self.card_hits + self.card_misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'hit_rate': self.hits / pages if pages else 0.0,
+            'card_hits': self.card_hits,
+            'card_misses': self.card_misses,
+            'card_hit_rate': self.card_hits / cards if cards else 0.0,
+        }
+
+
+listing_cache = ListingCache(getattr(settings, 'MOVIE_LISTING_CACHE', None))
+
+
+@receiver(setting_changed)
+def reload_listing_cache(setting, value, **kwargs):
+    """ Reconfigure cache on override_settings(MOVIE_LISTING_CACHE=...) """
+    if setting == 'MOVIE_LISTING_CACHE':
+        listing_cache.configure(value)
@@ -0,0 +1,23 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.utils.ipv6 import clean_ipv6_address
+
+from .ratings import star_values
+
+
+class RatingForm(forms.Form):
+    """ Vote for movie - star by pk, visitor by IP """
+
+    star = forms.IntegerField()
+    ip = forms.GenericIPAddressField(unpack_ipv4=True)
+
+    def clean_star(self):
+        star = self.cleaned_data['star']
+        if star_values.get(star) is None:
+            raise ValidationError('Нет такой звезды рейтинга')
+        return star
+
+    def clean_ip(self):
+        # the same text for any notation of address - (movie, ip) is unique
+        ip = self.cleaned_data['ip']
+        return clean_ipv6_address(ip, unpack_ipv4=True) if ':' in ip else ip
@@ -0,0 +1,338 @@
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.shortcuts import render
+from django.template.loader import get_template
+from django.db import OperationalError, connection
+from django.db.models import Avg, Count
+from django.test import RequestFactory, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from movie_portal.querycount import track_queries
+from movies.cache import listing_cache
+from movies.models import Movie, Rating, RatingStar, Review
+from movies.pagination import KeysetPaginator
+from movies.ratings import rating_buffer
+from movies.reviews import get_all_review_threads, get_review_threads
+from movies.stats import get_rating, reconcile
+from movies.views import MovieView, movie_rating
+
+
+@contextmanager
+def test_database():
+    """ Throwaway database like in `manage.py test` - never touch real data """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, iterations):
+    """ Run func {iterations} times, return timings (ms) and executed queries count """
+    timings = []
+    with track_queries() as queries:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings, queries.count
+
+
+def create_movies(start, stop, batch_size=10000):
+    """ Movies {start}..{stop} with long descriptions, every 10th is a draft """
+    description = 'Описание фильма. ' * 200
+    for batch_start in range(start, stop, batch_size):
+        Movie.objects.bulk_create(
+            Movie(
+                title=f'Фильм {i}', tagline=f'Слоган {i}', description=description, poster=f'movies/{i}.jpg',
+                country='США', url=f'movie-{i}', year=1950 + i % 70,
+                world_premiere=date(1950, 1, 1) + timedelta(days=i % 25000), draft=i % 10 == 0,
+            )
+            for i in range(batch_start, min(batch_start + batch_size, stop))
+        )
+
+
+def anonymous_get(path, params=None):
+    request = RequestFactory().get(path, params)
+    request.user = AnonymousUser()
+    return request
+
+
+@override_settings(MOVIE_LISTING_CACHE={'ENABLED': False})
+def bench_movie_list(command, options):
+    """ GET / - all movies in one page vs keyset pages, for {movies} table sizes, pages not cached """
+    view = MovieView.as_view()
+    card = get_template('movies/movie_card.html')
+
+    def get(params):
+        def request():
+            response = view(anonymous_get('/', params))
+            assert response.status_code == 200, response.status_code
+        return request
+
+    def render_all():
+        # MovieView before drafts filter, projection and pagination
+        movies = Movie.objects.all()
+        cards = [card.render({'movie': movie}) for movie in movies]
+        render(anonymous_get('/'), 'movies/movies.html', {'movie_list': movies, 'movie_cards': cards})
+
+    def middle_cursor(ordering):
+        movies = Movie.objects.for_listing()
+        paginator = KeysetPaginator(movies, MovieView.paginate_by, ordering)
+        middle = movies.order_by(*paginator.orderings[ordering])[movies.count() // 2]
+        return paginator.make_cursor(middle)
+
+    created = 0
+    for size in options['movies']:
+        create_movies(created, size)
+        created = size
+
+        for title, func, iterations in (
+            ('all at once', render_all, max(1, options['iterations'] // 20)),
+            ('first page', get({}), options['iterations']),
+            ('middle page', get({'cursor': middle_cursor('id')}), options['iterations']),
+            ('by premiere, middle page', get({'ordering': 'premiere', 'cursor': middle_cursor('premiere')}),
+             options['iterations']),
+            ('by year', get({'year': 1980}), options['iterations']),
+        ):
+            timings, queries = measure(func, iterations)
+            command.report(f'{size} movies, {title}', timings, queries)
+
+
+def bench_listing_cache(command, options):
+    """
+    GET / - without cache, cold, after content change and cached, for {movies} table sizes,
+    then {threads} requests of a cold page at once
+    """
+    view = MovieView.as_view()
+
+    def get():
+        response = view(anonymous_get('/'))
+        assert response.status_code == 200, response.status_code
+
+    def cold():
+        listing_cache.cache.clear()
+        get()
+
+    def changed():
+        listing_cache.bump_version()
+        get()
+
+    created = 0
+    for size in options['movies']:
+        create_movies(created, size)
+        created = size
+
+        with override_settings(MOVIE_LISTING_CACHE={'ENABLED': False}):
+            timings, queries = measure(get, options['iterations'])
+        command.report(f'{size} movies, no cache', timings, queries)
+
+        for title, func in (('cold', cold), ('content changed', changed), ('cached', get)):
+            listing_cache.configure()
+            timings, queries = measure(func, options['iterations'])
+            command.report(f'{size} movies, {title}', timings, queries)
+            command.stdout.write(f'  {listing_cache.stats()}')
+
+    listing_cache.configure()
+    listing_cache.cache.clear()
+    barrier = threading.Barrier(options['threads'])
+
+    def stampede():
+        barrier.wait()
+        try:
+            get()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=stampede) for _ in range(options['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # card misses show how many times the page was rendered
+    command.stdout.write(f'{options["threads"]} requests of cold page at once: {listing_cache.stats()}')
+
+
+def bench_rating(command, options):
+    """ Rating of one movie - aggregated from ratings vs read from stats tables, for {ratings} table sizes """
+    create_movies(0, 100)
+    movies = list(Movie.objects.published().values_list('pk', flat=True))
+    stars = [RatingStar.objects.create(value=value) for value in range(1, 6)]
+
+    def on_the_fly():
+        ratings = Rating.objects.filter(movie_id=movies[0])
+        ratings.aggregate(count=Count('id'), average=Avg('star__value'))
+        list(ratings.values('star__value').annotate(count=Count('id')))
+
+    def from_stats():
+        get_rating(movies[0])
+
+    created = 0
+    for size in options['ratings']:
+        for start in range(created, size, 10000):
+            Rating.objects.bulk_create(
+                Rating(
+                    ip=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}', star=stars[i % 5],
+                    movie_id=movies[i % len(movies)],
+                )
+                for i in range(start, min(start + 10000, size))
+            )
+        created = size
+        # bulk inserted ratings send no signals
+        reconcile()
+
+        for title, func in (('on the fly', on_the_fly), ('from stats', from_stats)):
+            timings, queries = measure(func, options['iterations'])
+            command.report(f'{size} ratings, {title}', timings, queries)
+
+
+def bench_rating_load(command, options):
+    """
+    POST /movies/<pk>/rating/ - {votes} votes of 5000 visitors for 100 movies from
+    {threads} threads, each vote written in request vs buffered and written in batches.
+    In-memory SQLite test database does not allow concurrent writers - use a file
+    database (TEST NAME) or PostgreSQL with several threads.
+    """
+    stars = [RatingStar.objects.create(value=value).pk for value in range(1, 6)]
+
+    for title, buffered in (('written in request', False), ('buffered', True)):
+        # new movies - no ratings of the previous run
+        created = Movie.objects.count()
+        create_movies(created, created + 110)
+        movies = list(Movie.objects.published().filter(pk__gt=created).values_list('pk', flat=True))
+        votes = [
+            (movies[i * 7 % len(movies)], f'10.0.{i % 5000 // 256}.{i % 256}', stars[i % 5])
+            for i in range(options['votes'])
+        ]
+        failed = []
+
+        def client(worker):
+            try:
+                for movie_id, ip, star_id in votes[worker::options['threads']]:
+                    request = RequestFactory().post(
+                        f'/movies/{movie_id}/rating/', urlencode({'star': star_id}),
+                        content_type='application/x-www-form-urlencoded', REMOTE_ADDR=ip,
+                    )
+                    try:
+                        response = movie_rating(request, movie_id)
+                        assert response.status_code in (201, 202), response.content
+                    except OperationalError:
+                        # SQLite - concurrent writers get `database is locked`
+                        failed.append(movie_id)
+            finally:
+                connection.close()
+
+        with override_settings(RATING_BUFFER={'BUFFERED': buffered}):
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(worker,)) for worker in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            accepted = time.perf_counter() - started
+            # votes left in buffer when clients are done
+            rating_buffer.flush()
+            written = time.perf_counter() - started
+
+            command.stdout.write(
+                f'{title}: {len(votes) / accepted:.0f} votes/s accepted, {len(votes) / written:.0f} votes/s written, '
+                f'{len(failed)} failed, {Rating.objects.filter(movie__in=movies).count()} ratings'
+            )
+            command.stdout.write(f'  {rating_buffer.stats()}')
+    assert reconcile(dry_run=True) == {'MovieRatingStats': 0, 'MovieRatingBucket': 0}
+
+
+def create_reviews(movie, count, seed=0):
+    """ {count} reviews of movie - a tenth start threads, others reply to a random earlier review """
+    rng = random.Random(seed)
+    ids = []
+    for i in range(count):
+        parent = rng.choice(ids) if i >= count // 10 else None
+        ids.append(Review.objects.create(
+            email='bench@example.com', name=f'Зритель {i}', text='Отзыв', parent_id=parent, movie=movie
+        ).pk)
+
+
+def bench_review_tree(command, options):
+    """ Review threads of one movie - child reviews queried per review vs recursive CTE, for {reviews} counts """
+    per_page = 20
+
+    def naive(movie):
+        def load(review):
+            review.replies = list(Review.objects.filter(parent=review).order_by('id'))
+            for reply in review.replies:
+                load(reply)
+
+        def func():
+            for root in Review.objects.filter(movie=movie, parent__isnull=True).order_by('-id')[:per_page]:
+                load(root)
+        return func
+
+    for size in options['reviews']:
+        movie = Movie.objects.create(
+            title=f'Фильм {size}', description='', poster='movies/bench.jpg', country='США', url=f'bench-{size}'
+        )
+        create_reviews(movie, size)
+
+        for title, func, iterations in (
+            (f'{per_page} threads, query per review', naive(movie), max(1, options['iterations'] // 10)),
+            (f'{per_page} threads, recursive CTE', lambda: get_review_threads(movie.pk, per_page),
+             options['iterations']),
+            ('all threads, one query', lambda: get_all_review_threads(movie.pk), options['iterations']),
+        ):
+            timings, queries = measure(func, iterations)
+            command.report(f'{size} reviews, {title}', timings, queries)
+
+
+class Command(BaseCommand):
+    help = 'Run movies benchmarks against a throwaway test database'
+
+    scenarios = {
+        'listing_cache': bench_listing_cache,
+        'movie_list': bench_movie_list,
+        'rating': bench_rating,
+        'rating_load': bench_rating_load,
+        'review_tree': bench_review_tree,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument(
+            '--movies', type=lambda value: [int(size) for size in value.split(',')], default=[10000, 100000],
+            help='Comma separated table sizes, e.g. 10000,100000',
+        )
+        parser.add_argument(
+            '--ratings', type=lambda value: [int(size) for size in value.split(',')], default=[100000, 1000000],
+            help='Comma separated table sizes, e.g. 100000,1000000',
+        )
+        parser.add_argument(
+            '--reviews', type=lambda value: [int(size) for size in value.split(',')], default=[1000, 5000],
+            help='Comma separated numbers of reviews of one movie, e.g. 1000,5000',
+        )
+        parser.add_argument('--votes', type=int, default=20000)
+        parser.add_argument('--threads', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.scenarios[options['scenario']](self, options)
+
+    def report(self, title, timings, queries=None):
+        timings = sorted(timings)
+        line = (
+            f'{title}: n={len(timings)} mean={statistics.mean(timings):.3f}ms '
+            f'p50={timings[len(timings) // 2]:.3f}ms p99={timings[int(len(timings) * 0.99)]:.3f}ms'
+        )
+        if queries is not None:
+            line += f' queries/op={queries / len(timings):.2f}'
+        self.stdout.write(line)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from movies.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating stats per movie and star from ratings and fix rows that differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report rows that differ')
+
+    def handle(self, *args, **options):
+        fixed = reconcile(dry_run=options['dry_run'])
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        for model, count in fixed.items():
+            self.stdout.write(f'{verb} {count} {model} rows')
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:52
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    """ Stats of existing ratings - later kept up to date by movies.signals """
+    Rating = apps.get_model('movies', 'Rating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+    MovieRatingBucket = apps.get_model('movies', 'MovieRatingBucket')
+
+    movies = Rating.objects.values('movie').annotate(count=Count('id'), sum=Sum('star__value'))
+    MovieRatingStats.objects.bulk_create(
+        MovieRatingStats(movie_id=row['movie'], rating_count=row['count'], rating_sum=row['sum']) for row in movies
+    )
+
+    buckets = Rating.objects.values('movie', 'star').annotate(count=Count('id'))
+    MovieRatingBucket.objects.bulk_create(
+        MovieRatingBucket(movie_id=row['movie'], star_id=row['star'], rating_count=row['count']) for row in buckets
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_movie_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRatingStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='movies.movie', verbose_name='Фильм')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Количество оценок')),
+                ('rating_sum', models.BigIntegerField(default=0, verbose_name='Сумма оценок')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг фильма',
+                'verbose_name_plural': 'Рейтинги фильмов',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieRatingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Количество оценок')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to='movies.movie', verbose_name='Фильм')),
+                ('star', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.ratingstar', verbose_name='Звезда')),
+            ],
+            options={
+                'verbose_name': 'Оценки фильма по звездам',
+                'verbose_name_plural': 'Оценки фильмов по звездам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='movieratingbucket',
+            constraint=models.UniqueConstraint(fields=('movie', 'star'), name='movie_rating_bucket_unique'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:55
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils.ipv6 import clean_ipv6_address
+
+
+def normalize_ip(ip):
+    """ Value GenericIPAddressField(unpack_ipv4=True) stores, None for invalid address """
+    ip = ip.strip()
+    try:
+        validate_ipv46_address(ip)
+    except ValidationError:
+        return None
+    return clean_ipv6_address(ip, unpack_ipv4=True) if ':' in ip else ip
+
+
+def dedupe_ratings(apps, schema_editor):
+    """
+    Before the unique (movie, ip) index - keep the latest rating of every
+    visitor, drop ratings with invalid addresses and rebuild rating stats.
+    """
+    Rating = apps.get_model('movies', 'Rating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+    MovieRatingBucket = apps.get_model('movies', 'MovieRatingBucket')
+
+    latest = {}
+    obsolete = []
+    renamed = []
+    for rating in Rating.objects.order_by('-id').only('id', 'movie_id', 'ip').iterator():
+        ip = normalize_ip(rating.ip)
+        if ip is None or (rating.movie_id, ip) in latest:
+            obsolete.append(rating.id)
+            continue
+        latest[rating.movie_id, ip] = rating.id
+        if ip != rating.ip:
+            rating.ip = ip
+            renamed.append(rating)
+
+    if not obsolete and not renamed:
+        return
+    for start in range(0, len(obsolete), 500):
+        Rating.objects.filter(id__in=obsolete[start:start + 500]).delete()
+    Rating.objects.bulk_update(renamed, ['ip'], batch_size=500)
+
+    # historical models send no signals - stats are filled again like in 0003
+    MovieRatingStats.objects.all().delete()
+    MovieRatingBucket.objects.all().delete()
+    movies = Rating.objects.values('movie').annotate(count=Count('id'), sum=Sum('star__value'))
+    MovieRatingStats.objects.bulk_create(
+        MovieRatingStats(movie_id=row['movie'], rating_count=row['count'], rating_sum=row['sum']) for row in movies
+    )
+    buckets = Rating.objects.values('movie', 'star').annotate(count=Count('id'))
+    MovieRatingBucket.objects.bulk_create(
+        MovieRatingBucket(movie_id=row['movie'], star_id=row['star'], rating_count=row['count']) for row in buckets
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_rating_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_ratings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='rating',
+            name='ip',
+            field=models.GenericIPAddressField(unpack_ipv4=True, verbose_name='IP-адрес'),
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('movie', 'ip'), name='rating_movie_ip_unique'),
+        ),
+    ]
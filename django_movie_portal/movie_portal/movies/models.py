@@ -1,6 +1,6 @@
 from datetime import date
 
-from django.db import models
+from django.db import models, transaction
 
 
 class Category(models.Model):
@@ -49,6 +49,16 @@ class Genre(models.Model):
         verbose_name_plural = 'Жанры'
 
 
+class MovieQuerySet(models.QuerySet):
+
+    def published(self):
+        return self.filter(draft=False)
+
+    def for_listing(self):
+        """ Published movies with only columns of the movie card and the pagination key """
+        return self.published().only('id', 'title', 'tagline', 'poster', 'year', 'world_premiere')
+
+
 class Movie(models.Model):
     """ Movie model """
 
@@ -69,12 +79,23 @@ class Movie(models.Model):
     fees_in_world = models.PositiveIntegerField('Сборы в мире', default=0, help_text='указывать сумму в долларах')
     draft = models.BooleanField('Черновик', default=False)
 
+    objects = MovieQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name = 'Фильм'
         verbose_name_plural = 'Фильмы'
+        # listing reads published movies only and pages by id, premiere date or year -
+        # partial indexes hold just those rows and match the `NOT draft` condition
+        indexes = [
+            models.Index(fields=['id'], name='movie_published_id_idx', condition=models.Q(draft=False)),
+            models.Index(
+                fields=['world_premiere', 'id'], name='movie_published_premiere_idx', condition=models.Q(draft=False)
+            ),
+            models.Index(fields=['year', 'id'], name='movie_published_year_idx', condition=models.Q(draft=False)),
+        ]
 
 
 class MovieShot(models.Model):
@@ -106,19 +127,89 @@ class RatingStar(models.Model):
         verbose_name_plural = 'Звезды рейтинга'
 
 
+class RatingQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Ratings are taken out of rating stats by the delete itself - a
+        post_delete receiver would turn off fast delete of cascades
+        """
+        from movies import stats
+
+        with transaction.atomic(using=self.db):
+            counted = stats.count_ratings(self)
+            deleted = super().delete()
+            stats.add_counted_ratings(counted, sign=-1)
+        return deleted
+
+
 class Rating(models.Model):
     """ Rating model """
 
-    ip = models.CharField('IP-адрес', max_length=15)
+    ip = models.GenericIPAddressField('IP-адрес', unpack_ipv4=True)
     star = models.ForeignKey(RatingStar, on_delete=models.CASCADE)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
 
+    objects = RatingQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.star} - {self.movie}'
 
+    def delete(self, using=None, keep_parents=False):
+        from movies import stats
+
+        with transaction.atomic(using=using):
+            counted = (self.movie_id, self.star_id, self.star.value)
+            deleted = super().delete(using, keep_parents)
+            stats.add_ratings([counted], sign=-1)
+        return deleted
+
     class Meta:
         verbose_name = 'Рейтинг'
         verbose_name_plural = 'Рейтинги'
+        # one vote per visitor - a new one replaces the old
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'ip'], name='rating_movie_ip_unique'),
+        ]
+
+
+class MovieRatingStats(models.Model):
+    """ Rating of movie - kept up to date by movies.signals and Rating deletes, fixed by `reconcile_rating_stats` """
+
+    movie = models.OneToOneField(
+        Movie, verbose_name='Фильм', on_delete=models.CASCADE, primary_key=True, related_name='rating_stats'
+    )
+    rating_count = models.PositiveIntegerField('Количество оценок', default=0)
+    rating_sum = models.BigIntegerField('Сумма оценок', default=0)
+
+    @property
+    def average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def __str__(self):
+        return f'{self.movie_id} - {self.average}'
+
+    class Meta:
+        verbose_name = 'Рейтинг фильма'
+        verbose_name_plural = 'Рейтинги фильмов'
+
+
+class MovieRatingBucket(models.Model):
+    """ Number of ratings of movie with star - histogram of MovieRatingStats """
+
+    movie = models.ForeignKey(Movie, verbose_name='Фильм', on_delete=models.CASCADE, related_name='rating_buckets')
+    star = models.ForeignKey(RatingStar, verbose_name='Звезда', on_delete=models.CASCADE)
+    rating_count = models.PositiveIntegerField('Количество оценок', default=0)
+
+    def __str__(self):
+        return f'{self.movie_id} - {self.star_id}: {self.rating_count}'
+
+    class Meta:
+        verbose_name = 'Оценки фильма по звездам'
+        verbose_name_plural = 'Оценки фильмов по звездам'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'star'], name='movie_rating_bucket_unique'),
+        ]
 
 
 class Review(models.Model):
@@ -136,3 +227,7 @@ class Review(models.Model):
     class Meta:
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
+        # top-level reviews of movie are paged by id, replies are found by parent_id index
+        indexes = [
+            models.Index(fields=['movie', 'parent', 'id'], name='review_movie_parent_id_idx'),
+        ]
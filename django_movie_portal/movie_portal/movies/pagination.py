@@ -0,0 +1,68 @@
+from datetime import date
+
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage(list):
+    """ Rows of page and cursor of the next one, None on the last page """
+
+    def __init__(self, rows, next_cursor):
+        super().__init__(rows)
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Pages by position of the last shown row instead of OFFSET - any page costs
+    one index range scan. Orderings are descending, newest movies first; id
+    breaks ties of the premiere date, so every row is on exactly one page.
+    Cursors: '<id>' for 'id', '<YYYY-MM-DD>_<id>' for 'premiere'.
+    """
+    orderings = {
+        'id': ('-id',),
+        'premiere': ('-world_premiere', '-id'),
+    }
+
+    def __init__(self, queryset, per_page, ordering='id'):
+        if ordering not in self.orderings:
+            raise Http404(f'Unknown ordering {ordering!r}')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def parse_cursor(self, cursor):
+        try:
+            if self.ordering == 'premiere':
+                premiere, pk = cursor.split('_')
+                return date.fromisoformat(premiere), int(pk)
+            return int(cursor),
+        except ValueError:
+            raise Http404('Invalid cursor')
+
+    def make_cursor(self, row):
+        if self.ordering == 'premiere':
+            return f'{row.world_premiere.isoformat()}_{row.pk}'
+        return str(row.pk)
+
+    def after(self, cursor):
+        if self.ordering == 'premiere':
+            premiere, pk = self.parse_cursor(cursor)
+            # the leading range condition lets the database seek the index instead of scanning it
+            return Q(world_premiere__lte=premiere) & (Q(world_premiere__lt=premiere) | Q(id__lt=pk))
+        pk, = self.parse_cursor(cursor)
+        return Q(id__lt=pk)
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.orderings[self.ordering])
+        if cursor:
+            queryset = queryset.filter(self.after(cursor))
+
+        # one row more tells if there is a next page - no COUNT(*)
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = self.make_cursor(rows[self.per_page - 1]) if len(rows) > self.per_page else None
+        return KeysetPage(rows[:self.per_page], next_cursor)
@@ -0,0 +1,289 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import NotSupportedError, close_old_connections, connection, transaction
+from django.dispatch import receiver
+
+from movies import stats
+from movies.models import Movie, Rating, RatingStar
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # False - every vote is written in the request
+    'BUFFERED': True,
+    # votes written by one flush
+    'BATCH_SIZE': 1000,
+    # seconds between flushes of the background worker
+    'FLUSH_INTERVAL': 1.0,
+    # votes waiting for flush - over it the request flushes itself, so memory stays bounded
+    'MAX_PENDING': 10000,
+}
+
+
+class StarValues:
+    """ {RatingStar pk: value} kept in process - stars change rarely, votes come often """
+
+    def __init__(self):
+        self._values = None
+
+    def get(self, star_id):
+        if self._values is None or star_id not in self._values:
+            self._values = dict(RatingStar.objects.values_list('pk', 'value'))
+        return self._values.get(star_id)
+
+    def clear(self):
+        self._values = None
+
+
+star_values = StarValues()
+
+
+UPSERT_SQL = """
+INSERT INTO {table} ({movie}, {ip}, {star}) VALUES {values}
+ON CONFLICT ({movie}, {ip}) DO UPDATE SET {star} = EXCLUDED.{star} WHERE {table}.{id} IN ({locked})
+RETURNING {movie}, {ip}
+"""
+
+
+def check_upsert_support():
+    """ INSERT ... ON CONFLICT ... RETURNING - PostgreSQL, SQLite 3.35+ """
+    if connection.vendor == 'postgresql':
+        return
+    if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35):
+        return
+    raise NotSupportedError(f'Upsert of votes is not supported on {connection.vendor}')
+
+
+def upsert_votes(votes, locked):
+    """
+    INSERT ... ON CONFLICT (movie_id, ip) DO UPDATE of {votes} - conflicting
+    rows are updated only when their pk is in {locked}. Returns written
+    (movie_id, ip) keys, a row inserted by other process after the rows were
+    locked is neither updated nor returned.
+    """
+    quote = connection.ops.quote_name
+    opts = Rating._meta
+    sql = UPSERT_SQL.format(
+        table=quote(opts.db_table),
+        movie=quote(opts.get_field('movie').column),
+        ip=quote(opts.get_field('ip').column),
+        star=quote(opts.get_field('star').column),
+        id=quote(opts.pk.column),
+        values=', '.join(['(%s, %s, %s)'] * len(votes)),
+        # no row matches NULL - every conflict is left alone
+        locked=', '.join(['%s'] * len(locked)) or 'NULL',
+    )
+    params = [param for (movie_id, ip), star_id in votes.items() for param in (movie_id, ip, star_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, *locked])
+        return {(movie_id, str(ip)) for movie_id, ip in cursor.fetchall()}
+
+
+def write_votes(votes):
+    """
+    Upsert {(movie_id, ip): star_id} votes - one vote per (movie, ip), a new
+    one replaces the old. Existing rows are locked and read first, so rating
+    stats get deltas of what was actually written; a row inserted by other
+    process in the meantime is read and upserted again. Returns number of
+    written votes.
+    """
+    check_upsert_support()
+    movie_ids = {movie_id for movie_id, _ in votes}
+    written = 0
+    with transaction.atomic():
+        # movie deleted or turned into draft after the vote
+        published = set(Movie.objects.published().filter(pk__in=movie_ids).values_list('pk', flat=True))
+        votes = {key: star_id for key, star_id in votes.items() if key[0] in published}
+
+        added = []
+        removed = []
+        while votes:
+            # two IN lists instead of OR of every pair - SQLite limits expression depth;
+            # pairs not in the batch are dropped below. SQLite has no row locks - a
+            # writer committing between the read and the upsert makes the upsert fail
+            ratings = Rating.objects.filter(
+                movie_id__in={movie_id for movie_id, _ in votes}, ip__in={ip for _, ip in votes}
+            ).select_related('star').select_for_update(of=('self',))
+            existing = {}
+            for rating in ratings:
+                if (rating.movie_id, rating.ip) in votes:
+                    existing[rating.movie_id, rating.ip] = rating
+            # same vote again - nothing to write
+            unchanged = {key for key, rating in existing.items() if rating.star_id == votes[key]}
+            written += len(unchanged)
+            votes = {key: star_id for key, star_id in votes.items() if key not in unchanged}
+            if not votes:
+                break
+
+            upserted = upsert_votes(votes, [rating.pk for rating in existing.values()])
+            for key in upserted:
+                rating = existing.get(key)
+                if rating is not None:
+                    removed.append((rating.movie_id, rating.star_id, rating.star.value))
+                added.append((key[0], votes[key], star_values.get(votes[key])))
+            written += len(upserted)
+            votes = {key: star_id for key, star_id in votes.items() if key not in upserted}
+
+        # raw writes send no signals
+        stats.add_ratings(added, removed=removed)
+    return written
+
+
+class RatingBuffer:
+    """
+    Votes collected in memory and written in batches by a background thread -
+    a request does no write. Later vote of the same visitor for the same movie
+    replaces the earlier one before it reaches the database.
+
+    Votes not yet flushed are lost when the process is killed - they are
+    flushed on normal exit.
+    """
+
+    def __init__(self, options=None):
+        self._lock = threading.Lock()
+        # one writer per process - batches of the worker and of a waiting request do not compete
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._pending = {}
+        # votes whose batch failed once - dropped when it fails again
+        self._failed = set()
+        self.configure(options)
+
+    def configure(self, options=None):
+        self.options = {**DEFAULTS, **(options or {})}
+        self.submitted = 0
+        self.replaced = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+
+    @property
+    def buffered(self):
+        return self.options['BUFFERED']
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, movie_id, ip, star_id):
+        """ Vote of {ip} for movie - written at once when not buffered """
+        if not self.buffered:
+            self.submitted += 1
+            self.written += write_votes({(movie_id, ip): star_id})
+            return
+
+        with self._lock:
+            self.submitted += 1
+            if (movie_id, ip) in self._pending:
+                self.replaced += 1
+            self._pending[movie_id, ip] = star_id
+            # new vote gets its own retry
+            self._failed.discard((movie_id, ip))
+            pending = len(self._pending)
+        self.start()
+
+        if pending >= self.options['MAX_PENDING']:
+            # worker falls behind - the request waits for a batch
+            self.flush()
+        elif pending >= self.options['BATCH_SIZE']:
+            self._wakeup.set()
+
+    def take(self):
+        """ Up to BATCH_SIZE pending votes, removed from buffer """
+        with self._lock:
+            if len(self._pending) <= self.options['BATCH_SIZE']:
+                batch, self._pending = self._pending, {}
+            else:
+                keys = list(self._pending)[:self.options['BATCH_SIZE']]
+                batch = {key: self._pending.pop(key) for key in keys}
+        return batch
+
+    def flush(self):
+        """ Write all pending votes, returns number of written ones """
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self.take()
+                if not batch:
+                    return written
+                self.batches += 1
+                try:
+                    count = write_votes(batch)
+                except Exception:
+                    self.errors += 1
+                    dropped = self.restore(batch)
+                    logger.exception('Failed to write %s votes, %s dropped after retry', len(batch), dropped)
+                    raise
+                if self._failed:
+                    with self._lock:
+                        self._failed.difference_update(batch)
+                self.written += count
+                written += count
+
+    def restore(self, batch):
+        """
+        Failed batch back to buffer for one more try - votes that failed before
+        are dropped, newer votes of the same visitors win. Returns number of
+        dropped votes.
+        """
+        with self._lock:
+            retry = {key: star_id for key, star_id in batch.items() if key not in self._failed}
+            dropped = len(batch) - len(retry)
+            self._failed.difference_update(batch)
+            self._failed.update(retry)
+            self._pending = {**retry, **self._pending}
+            self.dropped += dropped
+        return dropped
+
+    def clear(self):
+        """ Drop pending votes """
+        with self._lock:
+            self._pending = {}
+            self._failed = set()
+
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self.run, name='rating-buffer', daemon=True)
+                self._worker.start()
+
+    def run(self):
+        while True:
+            self._wakeup.wait(self.options['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # logged and counted by flush, batch is back in buffer for one more try
+                pass
+
+    def stats(self):
+        return {
+            'buffered': self.buffered,
+            'pending': len(self),
+            'submitted': self.submitted,
+            'replaced': self.replaced,
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'dropped': self.dropped,
+        }
+
+
+rating_buffer = RatingBuffer(getattr(settings, 'RATING_BUFFER', None))
+atexit.register(rating_buffer.flush)
+
+
+@receiver(setting_changed)
+def reload_rating_buffer(setting, value, **kwargs):
+    """ Reconfigure buffer on override_settings(RATING_BUFFER=...) """
+    if setting == 'RATING_BUFFER':
+        rating_buffer.configure(value)
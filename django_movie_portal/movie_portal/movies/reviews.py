@@ -0,0 +1,89 @@
+from django.db import connection
+
+from movies.models import Review
+from movies.pagination import KeysetPaginator
+
+# deeper replies are shown at this level - recursive templates and JSON stay shallow
+MAX_DEPTH = 10
+
+# backends with WITH RECURSIVE, others load all reviews of movie
+RECURSIVE_CTE_VENDORS = {'postgresql', 'sqlite'}
+
+DESCENDANTS_SQL = """
+WITH RECURSIVE thread(id) AS (
+    SELECT id FROM {table} WHERE parent_id IN ({roots}) AND movie_id = %s
+    UNION ALL
+    SELECT review.id FROM {table} review JOIN thread ON review.parent_id = thread.id WHERE review.movie_id = %s
+)
+SELECT {columns} FROM {table} WHERE id IN (SELECT id FROM thread) ORDER BY id
+"""
+
+
+def build_tree(reviews, roots, max_depth=MAX_DEPTH):
+    """
+    Attach every review of {reviews} to `replies` of its parent, starting from
+    {roots} - O(n), children in order of {reviews}. Replies deeper than
+    {max_depth} are shown at that depth, right after the review they reply to.
+    """
+    children = {}
+    for review in reviews:
+        review.replies = []
+        children.setdefault(review.parent_id, []).append(review)
+
+    # iterative depth first walk - no recursion limit for long reply chains
+    stack = [(root, 0, None) for root in reversed(roots)]
+    while stack:
+        review, depth, replies = stack.pop()
+        review.depth = depth
+        if replies is not None:
+            replies.append(review)
+        nested = depth < max_depth or replies is None
+        for child in reversed(children.get(review.pk, ())):
+            stack.append((child, depth + 1 if nested else depth, review.replies if nested else replies))
+    return roots
+
+
+def load_descendants(movie_id, root_ids):
+    """ All replies to {root_ids} reviews, at any depth - one query """
+    if not root_ids:
+        return []
+    if connection.vendor not in RECURSIVE_CTE_VENDORS:
+        # whole movie in one query, replies of other threads are not walked by build_tree
+        return list(Review.objects.filter(movie_id=movie_id).exclude(pk__in=root_ids).order_by('id'))
+
+    opts = Review._meta
+    sql = DESCENDANTS_SQL.format(
+        table=connection.ops.quote_name(opts.db_table),
+        roots=', '.join(['%s'] * len(root_ids)),
+        columns=', '.join(connection.ops.quote_name(field.column) for field in opts.concrete_fields),
+    )
+    return list(Review.objects.raw(sql, [*root_ids, movie_id, movie_id]))
+
+
+def get_review_threads(movie_id, per_page=20, cursor=None):
+    """
+    Page of top-level reviews of movie, newest first, with all replies in
+    `replies` - two queries whatever the size and depth of threads
+    """
+    roots = Review.objects.filter(movie_id=movie_id, parent__isnull=True)
+    page = KeysetPaginator(roots, per_page).get_page(cursor)
+    build_tree([*page, *load_descendants(movie_id, [review.pk for review in page])], page)
+    return page
+
+
+def get_all_review_threads(movie_id):
+    """ All reviews of movie as trees, newest thread first - one query """
+    reviews = list(Review.objects.filter(movie_id=movie_id).order_by('id'))
+    ids = {review.pk for review in reviews}
+    # reply to review of other movie starts a thread
+    return build_tree(reviews, [review for review in reversed(reviews) if review.parent_id not in ids])
+
+
+def serialize_thread(review):
+    """ Review with replies as dict - email is not public """
+    return {
+        'id': review.pk,
+        'name': review.name,
+        'text': review.text,
+        'replies': [serialize_thread(reply) for reply in review.replies],
+    }
@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from movies import stats
+from movies.cache import listing_cache
+from movies.models import Actor, Category, Genre, Movie, Rating, RatingStar
+from movies.ratings import star_values
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Actor)
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+def invalidate_listing(sender, action=None, **kwargs):
+    """
+    New content version drops cached listing pages. Again after commit -
+    requests between save and commit still read and cache the old rows.
+    """
+    if listing_cache.enabled and (action is None or action.startswith('post_')):
+        listing_cache.bump_version()
+        transaction.on_commit(listing_cache.bump_version)
+
+
+@receiver(pre_save, sender=Rating)
+def remember_counted_rating(sender, instance=None, **kwargs):
+    """ Rating counted in stats before the change - to move it on post_save """
+    instance._counted = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._counted = Rating.objects.filter(pk=instance.pk).values_list(
+            'movie_id', 'star_id', 'star__value'
+        ).first()
+
+
+@receiver(post_save, sender=Rating)
+def count_rating(sender, instance=None, **kwargs):
+    counted = getattr(instance, '_counted', None)
+    if counted is not None and counted[:2] == (instance.movie_id, instance.star_id):
+        return
+    stats.add_ratings(
+        [(instance.movie_id, instance.star_id, instance.star.value)], removed=[counted] if counted else ()
+    )
+
+
+# deleted ratings are taken out of stats by Rating.delete() and RatingQuerySet.delete() -
+# no post_delete receiver, so ratings of deleted movies and stars are fast deleted
+
+
+@receiver(pre_save, sender=RatingStar)
+def remember_star_value(sender, instance=None, **kwargs):
+    instance._counted_value = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._counted_value = RatingStar.objects.filter(pk=instance.pk).values_list('value', flat=True).first()
+
+
+@receiver(post_save, sender=RatingStar)
+def recount_star_value(sender, instance=None, **kwargs):
+    """ Sums of movies rated with the star """
+    counted = getattr(instance, '_counted_value', None)
+    if counted is not None and counted != instance.value:
+        stats.change_star_value(instance.pk, instance.value - counted)
+
+
+@receiver(pre_delete, sender=RatingStar)
+def uncount_star_ratings(sender, instance=None, **kwargs):
+    stats.remove_star(instance.pk)
+
+
+@receiver(post_save, sender=RatingStar)
+@receiver(post_delete, sender=RatingStar)
+def invalidate_star_values(sender, **kwargs):
+    star_values.clear()
@@ -0,0 +1,186 @@
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+
+from movies.models import Movie, MovieRatingBucket, MovieRatingStats, Rating
+
+# rows changed by one UPDATE - keeps number of query parameters low
+BATCH_SIZE = 300
+
+STATS_KEY = ('movie_id',)
+STATS_FIELDS = ('rating_count', 'rating_sum')
+BUCKET_KEY = ('movie_id', 'star_id')
+BUCKET_FIELDS = ('rating_count',)
+
+
+def match(key_fields, keys):
+    return reduce(or_, (Q(**dict(zip(key_fields, key))) for key in keys))
+
+
+def apply_deltas(model, key_fields, value_fields, deltas):
+    """
+    Add {key tuple: value deltas} to rows with UPDATE ... SET x = x + delta, so
+    concurrent changes are not lost. Missing rows are created.
+    """
+    deltas = [(key, delta) for key, delta in deltas.items() if any(delta)]
+    for start in range(0, len(deltas), BATCH_SIZE):
+        batch = dict(deltas[start:start + BATCH_SIZE])
+        existing = {tuple(key) for key in model.objects.filter(match(key_fields, batch)).values_list(*key_fields)}
+        if existing:
+            model.objects.filter(match(key_fields, existing)).update(**{
+                field: F(field) + Case(
+                    *[When(Q(**dict(zip(key_fields, key))), then=Value(batch[key][i])) for key in existing],
+                    default=Value(0), output_field=BigIntegerField(),
+                )
+                for i, field in enumerate(value_fields)
+            })
+
+        # no row to subtract from - left to reconcile
+        missing = {key: delta for key, delta in batch.items() if key not in existing and delta[0] > 0}
+        if not missing:
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    model(**dict(zip(key_fields, key)), **dict(zip(value_fields, delta)))
+                    for key, delta in missing.items()
+                )
+        except IntegrityError:
+            # some were created by a concurrent request in the meantime
+            for key, delta in missing.items():
+                apply_delta(model, key_fields, value_fields, key, delta)
+
+
+def apply_delta(model, key_fields, value_fields, key, delta):
+    """ Single row version of apply_deltas """
+    lookup = dict(zip(key_fields, key))
+    changes = {field: F(field) + value for field, value in zip(value_fields, delta)}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **dict(zip(value_fields, delta)))
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**changes)
+
+
+def count_ratings(ratings):
+    """ (movie_id, star_id, star value, number of ratings) of {ratings} queryset - one query """
+    return list(
+        ratings.order_by().values_list('movie_id', 'star_id', 'star__value').annotate(count=Count('id'))
+    )
+
+
+def add_counted_ratings(counted, sign=1):
+    """ Count (movie_id, star_id, star value, number) ratings in stats, sign=-1 removes them """
+    movies = defaultdict(lambda: [0, 0])
+    buckets = defaultdict(lambda: [0])
+    for movie_id, star_id, value, count in counted:
+        movies[(movie_id,)][0] += sign * count
+        movies[(movie_id,)][1] += sign * count * value
+        buckets[(movie_id, star_id)][0] += sign * count
+    apply_deltas(MovieRatingStats, STATS_KEY, STATS_FIELDS, movies)
+    apply_deltas(MovieRatingBucket, BUCKET_KEY, BUCKET_FIELDS, buckets)
+
+
+def add_ratings(ratings, sign=1, removed=()):
+    """
+    Count (movie_id, star_id, star value) ratings in stats, sign=-1 removes
+    them. {removed} ratings are taken out by the same updates - changed votes.
+    """
+    add_counted_ratings([(*rating, 1) for rating in ratings] + [(*rating, -1) for rating in removed], sign)
+
+
+def change_star_value(star_id, difference):
+    """ Star value changed by {difference} - sum of every movie changes by its ratings with the star """
+    count = MovieRatingBucket.objects.filter(movie_id=OuterRef('movie_id'), star_id=star_id).values('rating_count')
+    MovieRatingStats.objects.filter(
+        movie__in=MovieRatingBucket.objects.filter(star_id=star_id).values('movie_id')
+    ).update(rating_sum=F('rating_sum') + Subquery(count) * difference)
+
+
+def remove_star(star_id):
+    """
+    Star is deleted with its ratings - take them out of counts and sums of
+    movies in one UPDATE, buckets of the star are deleted by cascade
+    """
+    bucket = MovieRatingBucket.objects.filter(movie_id=OuterRef('movie_id'), star_id=star_id)
+    MovieRatingStats.objects.filter(
+        movie__in=MovieRatingBucket.objects.filter(star_id=star_id).values('movie_id')
+    ).update(
+        rating_count=F('rating_count') - Subquery(bucket.values('rating_count')),
+        rating_sum=F('rating_sum') - Subquery(
+            bucket.annotate(total=F('rating_count') * F('star__value')).values('total')
+        ),
+    )
+
+
+def get_rating(movie_id):
+    """
+    Rating of published movie from stats tables - two queries, no scan of
+    ratings. None when there is no such movie.
+    """
+    stats = Movie.objects.published().filter(pk=movie_id).values_list(
+        'rating_stats__rating_count', 'rating_stats__rating_sum'
+    ).first()
+    if stats is None:
+        return None
+
+    count, total = stats
+    histogram = dict(
+        MovieRatingBucket.objects.filter(movie_id=movie_id, rating_count__gt=0)
+        .order_by('star__value').values_list('star__value', 'rating_count')
+    )
+    return {
+        'movie': movie_id,
+        'count': count or 0,
+        'average': round(total / count, 2) if count else None,
+        'histogram': histogram,
+    }
+
+
+def compute_movie_stats():
+    """ On the fly - {(movie_id,): (count, sum)} """
+    rows = Rating.objects.values('movie').annotate(count=Count('id'), sum=Sum('star__value'))
+    return {(row['movie'],): (row['count'], row['sum']) for row in rows}
+
+
+def compute_buckets():
+    """ On the fly - {(movie_id, star_id): (count,)} """
+    rows = Rating.objects.values('movie', 'star').annotate(count=Count('id'))
+    return {(row['movie'], row['star']): (row['count'],) for row in rows}
+
+
+def reconcile(dry_run=False):
+    """
+    Compare stats tables with on the fly aggregates and fix differences.
+    Returns number of fixed rows per model.
+    """
+    fixed = Counter()
+    with transaction.atomic():
+        for model, key_fields, value_fields, compute in (
+            (MovieRatingStats, STATS_KEY, STATS_FIELDS, compute_movie_stats),
+            (MovieRatingBucket, BUCKET_KEY, BUCKET_FIELDS, compute_buckets),
+        ):
+            # lock stats rows first, so incremental updates wait for the fix
+            current = {
+                tuple(row[:len(key_fields)]): tuple(row[len(key_fields):]) for row in
+                model.objects.select_for_update().values_list(*key_fields, *value_fields)
+            }
+            expected = compute()
+            stale = [key for key, value in current.items() if any(value) and key not in expected]
+            wrong = {key: value for key, value in expected.items() if current.get(key) != value}
+            fixed[model.__name__] = len(stale) + len(wrong)
+            if dry_run:
+                continue
+
+            if stale:
+                model.objects.filter(match(key_fields, stale)).delete()
+            for key, value in wrong.items():
+                model.objects.update_or_create(
+                    **dict(zip(key_fields, key)), defaults=dict(zip(value_fields, value))
+                )
+    return fixed
@@ -0,0 +1,17 @@
+from django import template
+
+from movies.reviews import get_review_threads
+
+register = template.Library()
+
+
+@register.simple_tag
+def review_threads(movie, per_page=20, cursor=None):
+    """ {% review_threads movie as threads %} - page of threads with replies, two queries """
+    return get_review_threads(getattr(movie, 'pk', movie), per_page, cursor)
+
+
+@register.inclusion_tag('movies/review_thread.html')
+def review_thread(reviews):
+    """ {% review_thread threads %} - reviews with their replies, nested """
+    return {'reviews': reviews}
@@ -1,3 +1,557 @@
-from django.test import TestCase
+import importlib
+import threading
+import time
+from datetime import date
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from movie_portal.querycount import QueryBudgetTestMixin
+from . import ratings, reviews, stats
+from .cache import listing_cache
+from .models import Genre, Movie, MovieRatingBucket, MovieRatingStats, Rating, RatingStar, Review
+from .ratings import rating_buffer, star_values, write_votes
+
+
+def create_movies(count, **fields):
+    return [
+        Movie.objects.create(
+            title=f'Фильм {i}', description='Описание', poster=f'movies/{i}.jpg', country='США', url=f'movie-{i}',
+            **fields,
+        )
+        for i in range(count)
+    ]
+
+
+class TestMovieQueries(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        create_movies(10)
+
+    @override_settings(QUERY_BUDGET={'STRICT': True, 'BUDGETS': {'movies.views.MovieView': 1}})
+    def test_movie_list_within_budget(self):
+        with self.assertQueryBudget(max_queries=1):
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['movie_list']), 10)
+
+
+class TestMovieList(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.movies = create_movies(30)
+        for i, movie in enumerate(self.movies):
+            movie.world_premiere = date(2000 + i % 3, 1, 1)
+            movie.year = 2000 + i % 3
+            movie.save()
+
+    def get_all_pages(self, **params):
+        """ Titles of all pages following `next` cursors """
+        titles, cursor = [], None
+        while True:
+            response = self.client.get('/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            page = response.context['movie_list']
+            titles += [movie.title for movie in page]
+            if not page.has_next:
+                return titles
+            cursor = page.next_cursor
+
+    def test_drafts_excluded(self):
+        Movie.objects.filter(pk__in=[movie.pk for movie in self.movies[:5]]).update(draft=True)
+
+        titles = self.get_all_pages()
+        self.assertEqual(len(titles), 25)
+        self.assertNotIn(self.movies[0].title, titles)
+
+    def test_only_card_columns_loaded(self):
+        with self.assertQueryBudget(max_queries=1) as queries:
+            response = self.client.get('/')
+
+        self.assertNotIn('description', response.context['movie_list'][0].__dict__)
+        self.assertEqual(queries.count, 1)
+        self.assertContains(response, self.movies[-1].title)
+
+    def test_pages_by_id(self):
+        titles = self.get_all_pages()
+        self.assertEqual(titles, [movie.title for movie in reversed(self.movies)])
+
+    def test_pages_by_premiere(self):
+        titles = self.get_all_pages(ordering='premiere')
+        expected = sorted(self.movies, key=lambda movie: (movie.world_premiere, movie.pk), reverse=True)
+        self.assertEqual(titles, [movie.title for movie in expected])
+
+    def test_filter_by_year(self):
+        titles = self.get_all_pages(year=2001)
+        self.assertEqual(titles, [movie.title for movie in reversed(self.movies) if movie.year == 2001])
+
+    def test_next_link(self):
+        response = self.client.get('/')
+        self.assertContains(response, f'cursor={self.movies[6].pk}')
+
+    def test_invalid_params(self):
+        for params in ({'cursor': 'x'}, {'ordering': 'title'}, {'ordering': 'premiere', 'cursor': '1'}, {'year': 'x'}):
+            self.assertEqual(self.client.get('/', params).status_code, 404)
+
+
+class TestListingCache(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        listing_cache.configure()
+        self.movies = create_movies(5)
+
+    def test_page_cached(self):
+        self.client.get('/')
+        with self.assertQueryBudget(max_queries=0):
+            response = self.client.get('/')
+
+        self.assertContains(response, self.movies[0].title)
+        self.assertEqual(listing_cache.stats()['hits'], 1)
+        self.assertEqual(listing_cache.stats()['misses'], 1)
+
+    def test_params_cached_separately(self):
+        self.client.get('/', {'ordering': 'premiere', 'year': 2000})
+        self.assertEqual(self.client.get('/', {'year': 2000, 'ordering': 'premiere'}).status_code, 200)
+        self.client.get('/', {'ordering': 'id'})
+        self.assertEqual(listing_cache.stats()['hits'], 1)
+        self.assertEqual(listing_cache.stats()['misses'], 2)
+
+    def test_unused_params_not_cached(self):
+        self.client.get('/')
+        for i in range(3):
+            self.client.get('/', {'x': i, 'ordering': 'id'})
+        self.client.get('/', {'cursor': '0100'})
+        self.client.get('/', {'cursor': '100'})
+        self.assertEqual(listing_cache.stats()['misses'], 2)
+
+        self.assertEqual(self.client.get('/', {'ordering': 'title'}).status_code, 404)
+        self.assertEqual(self.client.get('/', {'cursor': 'x'}).status_code, 404)
+        self.assertEqual(listing_cache.stats()['misses'], 2)
+
+    def test_invalidated_on_change(self):
+        self.client.get('/')
+        self.movies[0].title = 'Новое название'
+        self.movies[0].save()
+
+        self.assertContains(self.client.get('/'), 'Новое название')
+        # only the changed card is rendered again
+        self.assertEqual(listing_cache.stats()['card_misses'], 6)
+        self.assertEqual(listing_cache.stats()['card_hits'], 4)
+
+        Genre.objects.create(name='Драма', description='Описание', url='drama')
+        self.client.get('/')
+        self.movies[1].delete()
+        self.assertNotContains(self.client.get('/'), f'>{self.movies[1].title}<')
+        self.assertEqual(listing_cache.stats()['misses'], 4)
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(User.objects.create_user(username='test'))
+        # session and user are loaded on top of the listing - within budget
+        with self.assertNoLogs('movie_portal.querycount', 'WARNING'), self.assertNumQueries(6):
+            self.client.get('/')
+            self.client.get('/')
+        self.assertEqual(listing_cache.stats()['misses'], 0)
+
+    @override_settings(MOVIE_LISTING_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        self.client.get('/')
+        with self.assertQueryBudget(max_queries=1):
+            self.assertContains(self.client.get('/'), self.movies[0].title)
+
+    def test_single_flight(self):
+        key = listing_cache.page_key()
+        listing_cache.cache.add(f'{key}:lock', 1)
+        render = mock.Mock(return_value='rendered')
+
+        # other request stores the page while this one waits
+        with mock.patch('movies.cache.time.sleep', side_effect=lambda _: listing_cache.cache.set(key, 'other')):
+            self.assertEqual(listing_cache.get_or_render(key, render), 'other')
+        render.assert_not_called()
+        self.assertEqual(listing_cache.stats()['waits'], 1)
+
+    @override_settings(MOVIE_LISTING_CACHE={'LOCK_TIMEOUT': 0, 'POLL_INTERVAL': 0})
+    def test_lock_timeout(self):
+        key = listing_cache.page_key()
+        listing_cache.cache.add(f'{key}:lock', 1, 60)
+        self.assertEqual(listing_cache.get_or_render(key, lambda: 'rendered'), 'rendered')
+
+
+class TestRatingStats(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.movies = create_movies(3)
+        self.stars = {value: RatingStar.objects.create(value=value) for value in range(1, 6)}
+        self.visitors = 0
+
+    def rate(self, movie, value):
+        # one vote per visitor
+        self.visitors += 1
+        return Rating.objects.create(ip=f'10.0.0.{self.visitors}', star=self.stars[value], movie=movie)
+
+    def assertStatsCorrect(self):
+        stored = {
+            (movie_id,): (count, total) for movie_id, count, total in
+            MovieRatingStats.objects.exclude(rating_count=0).values_list('movie', 'rating_count', 'rating_sum')
+        }
+        self.assertEqual(stored, stats.compute_movie_stats())
+        stored = {
+            (movie_id, star_id): (count,) for movie_id, star_id, count in
+            MovieRatingBucket.objects.exclude(rating_count=0).values_list('movie', 'star', 'rating_count')
+        }
+        self.assertEqual(stored, stats.compute_buckets())
+
+    def test_incremental_updates(self):
+        first = self.rate(self.movies[0], 5)
+        self.rate(self.movies[0], 3)
+        self.rate(self.movies[1], 4)
+        self.assertStatsCorrect()
+
+        first.star = self.stars[1]
+        first.save()
+        self.assertStatsCorrect()
+        first.movie = self.movies[2]
+        first.save()
+        self.assertStatsCorrect()
+
+        first.delete()
+        self.assertStatsCorrect()
+
+        self.stars[3].value = 2
+        self.stars[3].save()
+        self.assertStatsCorrect()
+
+        self.stars[4].delete()
+        self.assertStatsCorrect()
+
+        Rating.objects.filter(movie=self.movies[0]).delete()
+        self.assertStatsCorrect()
+
+    def test_fast_delete(self):
+        for i in range(20):
+            self.rate(self.movies[i % 2], i % 5 + 1)
+
+        # ratings go with one DELETE, not loaded and signalled one by one
+        with self.assertQueryBudget(max_queries=15, repeat_threshold=2):
+            self.stars[5].delete()
+        self.assertStatsCorrect()
+        with self.assertQueryBudget(max_queries=15, repeat_threshold=2):
+            self.movies[0].delete()
+        self.assertStatsCorrect()
+        # aggregate, DELETE and stats updates - whatever the number of rows
+        with self.assertQueryBudget(max_queries=8):
+            Rating.objects.all().delete()
+        self.assertStatsCorrect()
+
+    def test_rating_api(self):
+        for value in (5, 5, 4, 1):
+            self.rate(self.movies[0], value)
+
+        with self.assertQueryBudget(max_queries=2):
+            response = self.client.get(reverse('movie-rating', args=[self.movies[0].pk]))
+
+        self.assertEqual(response.json(), {
+            'movie': self.movies[0].pk, 'count': 4, 'average': 3.75, 'histogram': {'1': 1, '4': 1, '5': 2},
+        })
+        self.assertEqual(
+            self.client.get(reverse('movie-rating', args=[self.movies[1].pk])).json(),
+            {'movie': self.movies[1].pk, 'count': 0, 'average': None, 'histogram': {}},
+        )
+
+        Movie.objects.filter(pk=self.movies[1].pk).update(draft=True)
+        self.assertEqual(self.client.get(reverse('movie-rating', args=[self.movies[1].pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('movie-rating', args=[0])).status_code, 404)
+
+    def test_reconcile(self):
+        Rating.objects.bulk_create(Rating(ip='127.0.0.1', star=self.stars[4], movie=movie) for movie in self.movies)
+        # bulk_create sends no signals
+        self.assertFalse(MovieRatingStats.objects.exists())
+
+        self.assertEqual(stats.reconcile(dry_run=True), {'MovieRatingStats': 3, 'MovieRatingBucket': 3})
+        self.assertFalse(MovieRatingStats.objects.exists())
+
+        MovieRatingBucket.objects.create(movie=self.movies[0], star=self.stars[1], rating_count=2)
+        out = StringIO()
+        call_command('reconcile_rating_stats', stdout=out)
+        self.assertIn('Fixed 4 MovieRatingBucket rows', out.getvalue())
+        self.assertStatsCorrect()
+        self.assertEqual(stats.reconcile(), {'MovieRatingStats': 0, 'MovieRatingBucket': 0})
+
+
+class TestConcurrentRatings(TransactionTestCase):
+
+    def test_concurrent_ratings(self):
+        """ Ratings from parallel requests - none of the F() increments is lost """
+        movie, = create_movies(1)
+        stars = [RatingStar.objects.create(value=value) for value in range(1, 6)]
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def rate(worker):
+            try:
+                barrier.wait()
+                for i in range(10):
+                    star = stars[(worker + i) % 5]
+                    for _ in range(100):
+                        try:
+                            with transaction.atomic():
+                                Rating.objects.create(ip=f'10.0.{worker}.{i}', star=star, movie=movie)
+                            break
+                        except OperationalError:
+                            # in-memory SQLite of tests reports a locked table instead of waiting for it
+                            time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rate, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        rating = stats.get_rating(movie.pk)
+        self.assertEqual(rating['count'], 80)
+        self.assertEqual(rating['average'], 3)
+        self.assertEqual(rating['histogram'], {value: 16 for value in range(1, 6)})
+        self.assertEqual(stats.reconcile(dry_run=True), {'MovieRatingStats': 0, 'MovieRatingBucket': 0})
+
+
+@override_settings(RATING_BUFFER={'FLUSH_INTERVAL': 3600})
+class TestRatingSubmission(QueryBudgetTestMixin, TestCase):
+    """ Background worker never wakes up here - votes are flushed by tests """
+
+    def setUp(self) -> None:
+        rating_buffer.clear()
+        star_values.clear()
+        self.movie, self.other = create_movies(2)
+        self.stars = {value: RatingStar.objects.create(value=value) for value in range(1, 6)}
+        self.url = reverse('movie-rating', args=[self.movie.pk])
+
+    def vote(self, value, ip='127.0.0.1', url=None):
+        return self.client.post(url or self.url, {'star': self.stars[value].pk}, REMOTE_ADDR=ip)
+
+    def assertVotes(self, expected):
+        self.assertEqual(set(Rating.objects.values_list('movie', 'ip', 'star__value')), expected)
+        self.assertEqual(stats.reconcile(dry_run=True), {'MovieRatingStats': 0, 'MovieRatingBucket': 0})
+
+    def test_buffered_votes(self):
+        self.assertEqual(self.vote(3).status_code, 202)
+        self.vote(4, ip='10.0.0.1')
+        self.vote(5)
+        self.vote(1, url=reverse('movie-rating', args=[self.other.pk]))
+        self.assertFalse(Rating.objects.exists())
+
+        self.assertEqual(rating_buffer.flush(), 3)
+        self.assertVotes({
+            (self.movie.pk, '127.0.0.1', 5), (self.movie.pk, '10.0.0.1', 4), (self.other.pk, '127.0.0.1', 1),
+        })
+        self.assertEqual(stats.get_rating(self.movie.pk)['average'], 4.5)
+        self.assertEqual(rating_buffer.stats()['replaced'], 1)
+
+        # vote changed after flush - row updated, stats moved
+        self.vote(2)
+        rating_buffer.flush()
+        self.assertEqual(stats.get_rating(self.movie.pk)['histogram'], {2: 1, 4: 1})
+        self.assertVotes({
+            (self.movie.pk, '127.0.0.1', 2), (self.movie.pk, '10.0.0.1', 4), (self.other.pk, '127.0.0.1', 1),
+        })
+
+    @override_settings(RATING_BUFFER={'BUFFERED': False})
+    def test_unbuffered_votes(self):
+        self.assertEqual(self.vote(3).status_code, 201)
+        self.assertEqual(self.vote(5).status_code, 201)
+        self.assertVotes({(self.movie.pk, '127.0.0.1', 5)})
+        self.assertEqual(len(rating_buffer), 0)
+
+    @override_settings(RATING_BUFFER={'BUFFERED': False})
+    def test_ipv6(self):
+        self.vote(3, ip='2001:DB8:0:0::1')
+        self.vote(4, ip='2001:db8::1')
+        self.vote(5, ip='::ffff:10.0.0.1')
+        self.assertVotes({(self.movie.pk, '2001:db8::1', 4), (self.movie.pk, '10.0.0.1', 5)})
+
+    def test_invalid_votes(self):
+        self.assertEqual(self.client.post(self.url, {'star': 0}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+        self.assertEqual(self.vote(3, ip='unknown').status_code, 400)
+
+        Movie.objects.filter(pk=self.movie.pk).update(draft=True)
+        self.assertEqual(self.vote(3).status_code, 404)
+        self.assertEqual(self.client.put(self.url).status_code, 405)
+
+    def test_movie_gone_before_flush(self):
+        self.vote(3)
+        self.vote(3, url=reverse('movie-rating', args=[self.other.pk]))
+        self.movie.delete()
+
+        self.assertEqual(rating_buffer.flush(), 1)
+        self.assertVotes({(self.other.pk, '127.0.0.1', 3)})
+
+    def test_unique_vote(self):
+        Rating.objects.create(ip='10.0.0.1', star=self.stars[1], movie=self.movie)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rating.objects.create(ip='10.0.0.1', star=self.stars[2], movie=self.movie)
+
+    def test_batch_queries(self):
+        """ Batch of votes and its stats deltas in a fixed number of queries """
+        votes = {(self.movie.pk, f'10.0.{i // 256}.{i % 256}'): self.stars[i % 5 + 1].pk for i in range(500)}
+        with self.assertQueryBudget(max_queries=15):
+            self.assertEqual(write_votes(votes), 500)
+
+        votes = {key: self.stars[1].pk for key in votes}
+        with self.assertQueryBudget(max_queries=15):
+            write_votes(votes)
+        self.assertEqual(stats.get_rating(self.movie.pk)['histogram'], {1: 500})
+
+    def test_failed_batch_retried_once(self):
+        self.vote(3)
+        self.vote(4, ip='10.0.0.1')
+        with mock.patch.object(ratings, 'write_votes', side_effect=IntegrityError):
+            with self.assertLogs('movies.ratings', 'ERROR'), self.assertRaises(IntegrityError):
+                rating_buffer.flush()
+            self.assertEqual(len(rating_buffer), 2)
+
+            # newer vote of the visitor is retried as new one
+            self.vote(5, ip='10.0.0.1')
+            with self.assertLogs('movies.ratings', 'ERROR'), self.assertRaises(IntegrityError):
+                rating_buffer.flush()
+        self.assertEqual(len(rating_buffer), 1)
+        self.assertEqual(rating_buffer.stats()['dropped'], 1)
+        self.assertEqual(rating_buffer.stats()['errors'], 2)
+
+        self.assertEqual(rating_buffer.flush(), 1)
+        self.assertVotes({(self.movie.pk, '10.0.0.1', 5)})
+
+    def test_vote_inserted_by_other_process(self):
+        """ Row inserted between the locked read and the upsert - updated on the next round, stats follow """
+        upsert_votes = ratings.upsert_votes
+
+        def concurrent_upsert(votes, locked):
+            if not Rating.objects.exists():
+                Rating.objects.create(ip='10.0.0.1', star=self.stars[1], movie=self.movie)
+            return upsert_votes(votes, locked)
+
+        with mock.patch.object(ratings, 'upsert_votes', side_effect=concurrent_upsert) as upsert:
+            self.assertEqual(write_votes({(self.movie.pk, '10.0.0.1'): self.stars[4].pk}), 1)
+
+        self.assertEqual(upsert.call_count, 2)
+        self.assertVotes({(self.movie.pk, '10.0.0.1', 4)})
+        self.assertEqual(stats.get_rating(self.movie.pk)['histogram'], {4: 1})
+
+    def test_normalize_ip(self):
+        migration = importlib.import_module('movies.migrations.0004_rating_ip_unique')
+        self.assertEqual(migration.normalize_ip(' 10.0.0.1 '), '10.0.0.1')
+        self.assertEqual(migration.normalize_ip('::FFFF:10.0.0.1'), '10.0.0.1')
+        self.assertEqual(migration.normalize_ip('2001:db8:0::1'), '2001:db8::1')
+        self.assertIsNone(migration.normalize_ip('unknown'))
+
+
+class TestReviewThreads(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self) -> None:
+        self.movie, self.other = create_movies(2)
+
+    def review(self, name, parent=None, movie=None):
+        return Review.objects.create(
+            email='test@example.com', name=name, text='Текст', parent=parent, movie=movie or self.movie
+        )
+
+    def create_threads(self):
+        first = self.review('first')
+        reply = self.review('reply', first)
+        self.review('other movie', movie=self.other)
+        second = self.review('second')
+        self.review('reply to reply', reply)
+        self.review('second reply', first)
+        self.review('reply to second', second)
+
+    def names(self, threads):
+        return [(review.name, self.names(review.replies)) for review in threads]
+
+    def test_threads(self):
+        self.create_threads()
+        expected = [
+            ('second', [('reply to second', [])]),
+            ('first', [('reply', [('reply to reply', [])]), ('second reply', [])]),
+        ]
+        with self.assertQueryBudget(max_queries=2):
+            self.assertEqual(self.names(reviews.get_review_threads(self.movie.pk)), expected)
+        with self.assertQueryBudget(max_queries=1):
+            self.assertEqual(self.names(reviews.get_all_review_threads(self.movie.pk)), expected)
+
+        # backends without recursive CTE
+        with mock.patch.object(reviews, 'RECURSIVE_CTE_VENDORS', set()):
+            self.assertEqual(self.names(reviews.get_review_threads(self.movie.pk)), expected)
+
+    def test_pages(self):
+        self.create_threads()
+        page = reviews.get_review_threads(self.movie.pk, per_page=1)
+        self.assertEqual(self.names(page), [('second', [('reply to second', [])])])
+
+        page = reviews.get_review_threads(self.movie.pk, per_page=1, cursor=page.next_cursor)
+        self.assertEqual([review.name for review in page], ['first'])
+        self.assertEqual(len(page[0].replies), 2)
+        self.assertFalse(page.has_next)
+
+    def test_max_depth(self):
+        parent = None
+        for i in range(reviews.MAX_DEPTH + 5):
+            parent = self.review(f'level {i}', parent)
+
+        root, = reviews.get_review_threads(self.movie.pk)
+        count = 0
+        level = [root]
+        while level:
+            count += len(level)
+            self.assertLessEqual(max(review.depth for review in level), reviews.MAX_DEPTH)
+            level = [reply for review in level for reply in review.replies]
+        self.assertEqual(count, reviews.MAX_DEPTH + 5)
+
+    def test_reviews_api(self):
+        self.create_threads()
+        url = reverse('movie-reviews', args=[self.movie.pk])
+        with self.assertQueryBudget(max_queries=3):
+            response = self.client.get(url)
+
+        data = response.json()
+        self.assertEqual([thread['name'] for thread in data['results']], ['second', 'first'])
+        self.assertEqual(data['results'][1]['replies'][0]['replies'][0]['name'], 'reply to reply')
+        self.assertNotIn('email', data['results'][0])
+        self.assertIsNone(data['next'])
+
+        Movie.objects.filter(pk=self.movie.pk).update(draft=True)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_template_tags(self):
+        self.create_threads()
+        html = Template(
+            '{% load movie_reviews %}{% review_threads movie as threads %}{% review_thread threads %}'
+        ).render(Context({'movie': self.movie}))
+
+        self.assertEqual(html.count('<li class="review"'), 6)
+        self.assertLess(html.index('>second<'), html.index('>first<'))
+        self.assertLess(html.index('>reply<'), html.index('>reply to reply<'))
+
+
+class TestQueryCountCopy(SimpleTestCase):
+
+    def test_same_as_canonical(self):
+        """ querycount.py is a copy - see its docstring """
+        canonical = settings.BASE_DIR.parent.parent / 'django_learning/drf_learning/drf_learning/querycount.py'
+        if not canonical.exists():
+            self.skipTest('Project is used outside of the repository')
+        self.assertEqual((settings.BASE_DIR / 'movie_portal/querycount.py').read_bytes(), canonical.read_bytes())
@@ -5,4 +5,6 @@ from . import views
 
 urlpatterns = [
     path('', views.MovieView.as_view()),
+    path('movies/<int:pk>/rating/', views.movie_rating, name='movie-rating'),
+    path('movies/<int:pk>/reviews/', views.movie_reviews, name='movie-reviews'),
 ]
@@ -1,13 +1,102 @@
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.template.loader import get_template
+from django.views.decorators.http import require_http_methods
 from django.views.generic.base import View
 
+from .cache import listing_cache
+from .forms import RatingForm
 from .models import Movie
+from .pagination import KeysetPaginator
+from .ratings import rating_buffer
+from .reviews import get_review_threads, serialize_thread
+from .stats import get_rating
 
 
 class MovieView(View):
     """ Список фильмов """
+    paginate_by = 24
 
-    # noinspection PyMethodMayBeStatic
     def get(self, request):
-        movies = Movie.objects.all()
-        return render(request, 'movies/movies.html', {'movie_list': movies})
+        params = self.get_params(request)
+        # the page is the same for all anonymous visitors
+        if not listing_cache.enabled or request.user.is_authenticated:
+            return self.render_page(request, *params)
+
+        content = listing_cache.get_or_render(
+            listing_cache.page_key(*params), lambda: self.render_page(request, *params).content
+        )
+        return HttpResponse(content)
+
+    def get_params(self, request):
+        """
+        Year, ordering and cursor from query string, validated and normalized -
+        404 for invalid ones. Other params are ignored, so they do not make new
+        cache entries.
+        """
+        year = request.GET.get('year') or None
+        if year is not None:
+            if not year.isdigit():
+                raise Http404('Invalid year')
+            year = int(year)
+
+        ordering = request.GET.get('ordering', 'id')
+        cursor = request.GET.get('cursor') or None
+        paginator = KeysetPaginator(None, self.paginate_by, ordering)
+        if cursor is not None:
+            cursor = '_'.join(map(str, paginator.parse_cursor(cursor)))
+        return year, ordering, cursor
+
+    def render_page(self, request, year, ordering, cursor):
+        movies = Movie.objects.for_listing()
+        if year is not None:
+            movies = movies.filter(year=year)
+        page = KeysetPaginator(movies, self.paginate_by, ordering).get_page(cursor)
+
+        card = get_template('movies/movie_card.html')
+        if listing_cache.enabled:
+            cards = listing_cache.render_cards(page, lambda movie: card.render({'movie': movie}))
+        else:
+            cards = [card.render({'movie': movie}) for movie in page]
+        return render(request, 'movies/movies.html', {
+            'movie_list': page, 'movie_cards': cards, 'ordering': ordering, 'year': year,
+        })
+
+
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def movie_rating(request, pk):
+    """
+    GET - number of ratings, average and ratings per star value - from stats tables.
+    POST star=<RatingStar pk> - vote of client IP, replaces its earlier vote.
+    Behind a proxy REMOTE_ADDR must be set to the client address.
+    """
+    if request.method == 'POST':
+        return rate_movie(request, pk)
+
+    rating = get_rating(pk)
+    if rating is None:
+        raise Http404('No Movie matches the given query.')
+    return JsonResponse(rating)
+
+
+def rate_movie(request, pk):
+    form = RatingForm({'star': request.POST.get('star'), 'ip': request.META.get('REMOTE_ADDR')})
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    if not Movie.objects.published().filter(pk=pk).exists():
+        raise Http404('No Movie matches the given query.')
+
+    rating_buffer.submit(pk, form.cleaned_data['ip'], form.cleaned_data['star'])
+    # buffered vote is written by background worker later
+    return JsonResponse(
+        {'movie': pk, 'star': form.cleaned_data['star']}, status=202 if rating_buffer.buffered else 201
+    )
+
+
+def movie_reviews(request, pk):
+    """ Page of review threads of published movie, newest first, `cursor` param for the next page """
+    if not Movie.objects.published().filter(pk=pk).exists():
+        raise Http404('No Movie matches the given query.')
+
+    page = get_review_threads(pk, cursor=request.GET.get('cursor'))
+    return JsonResponse({'results': [serialize_thread(review) for review in page], 'next': page.next_cursor})